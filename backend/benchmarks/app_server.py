@@ -0,0 +1,61 @@
+import os
+import argparse
+from datetime import datetime, timedelta
+
+# Runs the real app (main:app) against the in-memory Mongo stand-in.
+# GitHub and OpenAI are pointed at the fakes through the environment
+# (GITHUB_API_URL, GITHUB_RAW_URL, OPENAI_BASE_URL); benchmarks/run.py sets
+# those and starts this as its own process so its memory can be measured alone.
+#
+#   python -m benchmarks.app_server --port 9100
+BENCH_USERS = int(os.getenv("BENCH_USERS", "200"))
+BENCH_HISTORY_ITEMS = int(os.getenv("BENCH_HISTORY_ITEMS", "500"))
+HISTORY_USER = "bench-history"
+
+# database.py refuses to import without a URI; the client it builds is replaced before use
+os.environ.setdefault("MONGODB_URI", "mongodb://bench.invalid")
+
+from services import database
+from benchmarks.fake_mongo import install
+from benchmarks.fake_openai import SECTIONS
+
+sync_db = install(database)
+
+
+def user_id(i: int) -> str:
+    return f"bench-user-{i}"
+
+
+def seed(users: int = BENCH_USERS, history_items: int = BENCH_HISTORY_ITEMS):
+    """Pro users with an empty quota, plus one user with a long history to page through."""
+    now = datetime.utcnow()
+    sync_db["user_usage"].insert_many([
+        {"user_id": user_id(i), "email": f"{user_id(i)}@example.com", "usage_count": 0, "is_pro": True, "created_at": now}
+        for i in range(users)
+    ])
+    content = dict(SECTIONS, repo_stats={"stars": 42, "forks": 4, "avatar": "", "name": "bench", "description": ""})
+    if history_items:
+        sync_db["content_history"].insert_many([
+            {
+                "user_id": HISTORY_USER,
+                "repo_url": f"https://github.com/bench/history-{i}",
+                "generated_content": content,
+                "platform": "Deep Analysis",
+                "tone_used": "Educator",
+                "created_at": now - timedelta(minutes=i)
+            }
+            for i in range(history_items)
+        ])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Repo2Viral backend on in-memory Mongo")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    args = parser.parse_args()
+
+    seed()
+    from main import app
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
@@ -0,0 +1,283 @@
+import io
+import re
+import json
+import time
+import base64
+import hashlib
+import tarfile
+import argparse
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+# Local stand-in for api.github.com + raw.githubusercontent.com serving synthetic
+# repos. The size is encoded in the repo name: anything ending in -n<files>
+# (e.g. bench/cold-3-n500000) has that many files; other names get 100.
+#
+# Layout: a few root files the analyser looks for (README.md, requirements.txt,
+# main.py, models.py, Dockerfile), then pkgNNN/modNN/fileNNN.py directories of
+# PKG_FILES files each. Recursive tree listings stop at TREE_LIMIT entries and
+# are marked truncated, like GitHub's, so large repos exercise the subtree walk.
+# Trees and tarballs are generated while streaming; nothing is held per repo.
+#
+#   python -m benchmarks.fake_github --port 9101
+TREE_LIMIT = 100_000
+PKG_FILES = 10_000
+MOD_FILES = 100
+DEFAULT_FILES = 100
+README_REPEAT = 12
+
+ROOT_FILES = ("README.md", "requirements.txt", "main.py", "models.py", "Dockerfile")
+
+RATE_LIMIT_HEADERS = {
+    "x-ratelimit-limit": "5000",
+    "x-ratelimit-remaining": "4999",
+    "x-ratelimit-resource": "core"
+}
+
+app = FastAPI(title="Fake GitHub")
+
+
+class SyntheticRepo:
+    def __init__(self, owner: str, name: str):
+        self.owner = owner
+        self.name = name
+        match = re.search(r"-n(\d+)$", name)
+        self.files = int(match.group(1)) if match else DEFAULT_FILES
+        self.root_files = ROOT_FILES[:min(self.files, len(ROOT_FILES))]
+        self.generated = self.files - len(self.root_files)
+        self.sha = hashlib.sha1(f"{owner}/{name}".encode("utf-8")).hexdigest()
+
+    def _pkg_size(self, pkg: int) -> int:
+        return max(min(PKG_FILES, self.generated - pkg * PKG_FILES), 0)
+
+    def _mods(self, pkg: int):
+        size = self._pkg_size(pkg)
+        return [(mod, min(MOD_FILES, size - mod * MOD_FILES)) for mod in range(-(-size // MOD_FILES))]
+
+    def children(self, path: str = ""):
+        """Direct children of a directory as (name, type) pairs, in listing order."""
+        if not path:
+            for f in self.root_files:
+                yield f, "blob"
+            for pkg in range(-(-self.generated // PKG_FILES)):
+                yield f"pkg{pkg:03d}", "tree"
+            return
+        parts = path.split("/")
+        pkg = int(parts[0][3:])
+        if len(parts) == 1:
+            for mod, _ in self._mods(pkg):
+                yield f"mod{mod:02d}", "tree"
+            return
+        mod = int(parts[1][3:])
+        count = dict(self._mods(pkg)).get(mod, 0)
+        for i in range(count):
+            yield f"file{i:03d}.py", "blob"
+
+    def walk(self, path: str = "", recursive: bool = True):
+        """(relative path, type, sha) of everything under path, pre-order like GitHub."""
+        prefix = path + "/" if path else ""
+        for name, kind in self.children(path):
+            yield name, kind, tree_sha(prefix + name) if kind == "tree" else blob_sha(prefix + name)
+            if kind == "tree" and recursive:
+                for sub, sub_kind, sha in self.walk(prefix + name):
+                    yield f"{name}/{sub}", sub_kind, sha
+
+    def file_paths(self):
+        for path, kind, _ in self.walk():
+            if kind == "blob":
+                yield path
+
+    def content(self, path: str) -> bytes:
+        if path == "README.md":
+            body = "\n".join(
+                f"## Section {i}\n\n{self.name} turns repositories into posts. It streams trees, "
+                f"caches generations and batches history writes. Feature {i} keeps p99 low under load."
+                for i in range(README_REPEAT)
+            )
+            return f"# {self.name}\n\n{body}\n".encode("utf-8")
+        if path == "requirements.txt":
+            return b"fastapi\nuvicorn\npydantic\nhttpx\nopenai\npymongo\n"
+        if path == "main.py":
+            return (
+                b"from fastapi import FastAPI\nfrom models import Item\n\napp = FastAPI()\n\n"
+                b"@app.get('/items/{item_id}')\nasync def read_item(item_id: int) -> Item:\n"
+                b"    return Item(id=item_id, name='bench')\n"
+            )
+        if path == "models.py":
+            return b"from pydantic import BaseModel\n\nclass Item(BaseModel):\n    id: int\n    name: str\n\nclass Owner(BaseModel):\n    login: str\n"
+        if path == "Dockerfile":
+            return b"FROM python:3.11-slim\nCOPY . /app\nCMD [\"uvicorn\", \"main:app\"]\n"
+        return f"# {path}\n\ndef handler(value):\n    return value\n".encode("utf-8")
+
+    def has_path(self, path: str) -> bool:
+        if path in self.root_files:
+            return True
+        match = re.fullmatch(r"pkg(\d{3})/mod(\d{2})/file(\d{3})\.py", path)
+        if not match:
+            return False
+        pkg, mod, index = (int(g) for g in match.groups())
+        return index < dict(self._mods(pkg)).get(mod, 0)
+
+
+def tree_sha(path: str) -> str:
+    # Opaque to the client; encodes the directory so subtree requests need no lookup
+    return "t" + path.encode("utf-8").hex()
+
+
+def blob_sha(path: str) -> str:
+    return hashlib.sha1(path.encode("utf-8")).hexdigest()
+
+
+def _headers(etag: str = None) -> dict:
+    headers = dict(RATE_LIMIT_HEADERS, **{"x-ratelimit-reset": str(int(time.time()) + 3600)})
+    if etag:
+        headers["etag"] = f'"{etag}"'
+    return headers
+
+
+def _conditional(request: Request, etag: str, body, media_type: str = "application/json"):
+    """200 with an ETag, or 304 when the client already holds it (as GitHub does)."""
+    if request.headers.get("if-none-match") == f'"{etag}"':
+        return Response(status_code=304, headers=_headers(etag))
+    if not isinstance(body, (str, bytes)):
+        body = json.dumps(body)
+    return Response(content=body, media_type=media_type, headers=_headers(etag))
+
+
+@app.get("/repos/{owner}/{repo}")
+def repo_info(owner: str, repo: str, request: Request):
+    r = SyntheticRepo(owner, repo)
+    return _conditional(request, r.sha, {
+        "name": repo,
+        "full_name": f"{owner}/{repo}",
+        "html_url": f"https://github.com/{owner}/{repo}",
+        "description": f"Synthetic benchmark repo with {r.files} files",
+        "default_branch": "main",
+        "stargazers_count": r.files,
+        "forks_count": r.files // 10,
+        "owner": {"login": owner, "avatar_url": f"https://avatars.example.invalid/{owner}"}
+    })
+
+
+@app.get("/repos/{owner}/{repo}/commits/HEAD")
+def head_commit(owner: str, repo: str, request: Request):
+    r = SyntheticRepo(owner, repo)
+    return _conditional(request, r.sha, r.sha, media_type="application/vnd.github.sha")
+
+
+@app.get("/repos/{owner}/{repo}/readme")
+def readme(owner: str, repo: str, request: Request):
+    r = SyntheticRepo(owner, repo)
+    if "README.md" not in r.root_files:
+        return Response(status_code=404, headers=_headers())
+    return _conditional(request, blob_sha("README.md") + r.sha, {
+        "name": "README.md",
+        "path": "README.md",
+        "encoding": "base64",
+        "content": base64.b64encode(r.content("README.md")).decode("ascii")
+    })
+
+
+@app.get("/repos/{owner}/{repo}/contents/{path:path}")
+def contents(owner: str, repo: str, path: str, request: Request):
+    r = SyntheticRepo(owner, repo)
+    if not r.has_path(path):
+        return Response(status_code=404, headers=_headers())
+    return _conditional(request, blob_sha(path) + r.sha, {
+        "name": path.rsplit("/", 1)[-1],
+        "path": path,
+        "encoding": "base64",
+        "content": base64.b64encode(r.content(path)).decode("ascii")
+    })
+
+
+def _tree_chunks(r: SyntheticRepo, path: str, recursive: bool, sha: str):
+    entries = r.walk(path, recursive)
+    yield f'{{"sha":"{sha}","tree":['.encode("utf-8")
+    count = 0
+    truncated = False
+    batch = []
+    for entry_path, kind, entry_sha in entries:
+        if count >= TREE_LIMIT:
+            truncated = True
+            break
+        item = {"path": entry_path, "mode": "040000" if kind == "tree" else "100644", "type": kind, "sha": entry_sha}
+        batch.append(("," if count else "") + json.dumps(item))
+        count += 1
+        if len(batch) >= 1000:
+            yield "".join(batch).encode("utf-8")
+            batch = []
+    batch.append(f'],"truncated":{"true" if truncated else "false"}}}')
+    yield "".join(batch).encode("utf-8")
+
+
+@app.get("/repos/{owner}/{repo}/git/trees/{ref}")
+def tree(owner: str, repo: str, ref: str, request: Request, recursive: str = None):
+    r = SyntheticRepo(owner, repo)
+    path = "" if not ref.startswith("t") else bytes.fromhex(ref[1:]).decode("utf-8")
+    etag = hashlib.sha1(f"{r.sha}:{ref}:{bool(recursive)}".encode("utf-8")).hexdigest()
+    if request.headers.get("if-none-match") == f'"{etag}"':
+        return Response(status_code=304, headers=_headers(etag))
+    return StreamingResponse(
+        _tree_chunks(r, path, bool(recursive), ref),
+        media_type="application/json",
+        headers=_headers(etag)
+    )
+
+
+class _Sink:
+    """File-like target for tarfile's stream mode; drained after every few members."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _tarball_chunks(r: SyntheticRepo):
+    sink = _Sink()
+    root = f"{r.owner}-{r.name}-{r.sha[:7]}/"
+    with tarfile.open(fileobj=sink, mode="w|gz") as tar:
+        for i, path in enumerate(r.file_paths()):
+            data = r.content(path)
+            info = tarfile.TarInfo(root + path)
+            info.size = len(data)
+            info.mtime = 0
+            tar.addfile(info, io.BytesIO(data))
+            if i % 256 == 255:
+                yield sink.drain()
+    yield sink.drain()
+
+
+@app.get("/repos/{owner}/{repo}/tarball/{ref}")
+def tarball(owner: str, repo: str, ref: str):
+    return StreamingResponse(
+        _tarball_chunks(SyntheticRepo(owner, repo)),
+        media_type="application/x-gzip",
+        headers=_headers()
+    )
+
+
+@app.get("/raw/{owner}/{repo}/{branch}/{path:path}")
+def raw(owner: str, repo: str, branch: str, path: str):
+    r = SyntheticRepo(owner, repo)
+    if branch != "main" or not r.has_path(path):
+        return Response(status_code=404)
+    return Response(content=r.content(path), media_type="text/plain")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake GitHub API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9101)
+    args = parser.parse_args()
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
@@ -0,0 +1,137 @@
+import os
+import asyncio
+import mongomock
+
+# In-memory stand-in for the MongoDB handles in services/database.py.
+# mongomock does the query work synchronously; this wraps it in the async
+# surface pymongo's AsyncMongoClient exposes (awaitable methods, find() returning
+# a cursor, `await aggregate()`), so the app's code runs unchanged.
+# BENCH_MONGO_LATENCY_MS adds a fixed delay per round trip to approximate a
+# networked cluster; at 0 only the app's own overhead is measured.
+BENCH_MONGO_LATENCY_MS = float(os.getenv("BENCH_MONGO_LATENCY_MS", "0"))
+
+
+async def _round_trip():
+    if BENCH_MONGO_LATENCY_MS > 0:
+        await asyncio.sleep(BENCH_MONGO_LATENCY_MS / 1000)
+    else:
+        # Still yield to the loop, as a real driver call would
+        await asyncio.sleep(0)
+
+
+# Expression operators mongomock lacks, mapped to ones that behave the same on
+# Python strings ($substr slices by code point there, like $substrCP)
+_OPERATOR_ALIASES = {"$substrCP": "$substr"}
+
+
+def _translate(stage):
+    if isinstance(stage, dict):
+        return {_OPERATOR_ALIASES.get(k, k): _translate(v) for k, v in stage.items()}
+    if isinstance(stage, list):
+        return [_translate(v) for v in stage]
+    return stage
+
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+        self._fetched = False
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    def skip(self, n):
+        self._cursor = self._cursor.skip(n)
+        return self
+
+    async def to_list(self, length=None):
+        await _round_trip()
+        docs = []
+        for doc in self._cursor:
+            docs.append(doc)
+            if length is not None and len(docs) >= length:
+                break
+        return docs
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._fetched:
+            self._fetched = True
+            await _round_trip()
+        try:
+            return next(self._cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncCollection:
+    def __init__(self, collection):
+        self._collection = collection
+        self.name = collection.name
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self._collection.find(*args, **kwargs))
+
+    async def aggregate(self, pipeline, **kwargs):
+        await _round_trip()
+        return AsyncCursor(iter(list(self._collection.aggregate(_translate(pipeline), **kwargs))))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            await _round_trip()
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self._database = database
+        self._collections = {}
+        self.name = database.name
+
+    def __getitem__(self, name: str) -> AsyncCollection:
+        collection = self._collections.get(name)
+        if collection is None:
+            collection = self._collections[name] = AsyncCollection(self._database[name])
+        return collection
+
+    def __getattr__(self, name: str) -> AsyncCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class AsyncClient:
+    def __init__(self, sync_client):
+        self._sync_client = sync_client
+
+    def __getitem__(self, name: str) -> AsyncDatabase:
+        return AsyncDatabase(self._sync_client[name])
+
+    async def close(self):
+        self._sync_client.close()
+
+
+def install(database_module):
+    """
+    Points services.database at a fresh in-memory server. Must run before any
+    other service module is imported: they bind `db` at import time.
+    Returns the synchronous mongomock database (for seeding).
+    """
+    sync_client = mongomock.MongoClient()
+    sync_db = sync_client[database_module.DB_NAME]
+    database_module.client = AsyncClient(sync_client)
+    database_module.db = AsyncDatabase(sync_db)
+    database_module.get_sync_db = lambda: sync_db
+    return sync_db
@@ -0,0 +1,127 @@
+import json
+import time
+import random
+import asyncio
+import argparse
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import StreamingResponse
+
+# Local stand-in for the OpenAI chat completions API (point OPENAI_BASE_URL at
+# http://host:port/v1). Answers with canned JSON for whichever output sections
+# the system prompt asks for, after a configurable delay:
+#   --latency-ms   time before the whole answer (or the first streamed chunk)
+#   --chunk-ms     delay between streamed chunks
+#   --error-rate   share of requests answered 503, to exercise retries/breakers
+# Usage is reported like the real API, including the final chunk of a stream
+# when stream_options.include_usage is set.
+#
+#   python -m benchmarks.fake_openai --port 9102 --latency-ms 800
+CHUNK_CHARS = 24
+
+SECTIONS = {
+    "twitter_thread": "\n\n".join(
+        f"{i}/8 🚀 Tweet {i} about how the repo streams trees and caches generations [found in main.py]."
+        for i in range(1, 9)
+    ),
+    "linkedin_post": "Most repo tools re-read everything on every request.\n\nThe problem: slow pages.\n\n"
+                     "The stack:\n• FastAPI\n• MongoDB\n• httpx\n\nWhy it matters: p99 stays flat.",
+    "blog_intro": "Benchmarking a Repo-to-Post Pipeline\n\n" + " ".join(["Every stage is measured."] * 60),
+    "slides": [
+        {"slide_number": i, "type": kind, "headline": f"Slide {i}", "body": "Cites main.py and models.py.", "visual_cue": "code"}
+        for i, kind in enumerate(("hook", "problem", "feature", "technical", "technical", "cta"), start=1)
+    ],
+    "video_metadata": {"hook_text": "Code to Content, Measured.", "code_snippet": "async def read_item(item_id: int):\n    return Item(id=item_id)"}
+}
+
+config = {"latency_ms": 800.0, "chunk_ms": 10.0, "error_rate": 0.0}
+
+app = FastAPI(title="Fake OpenAI")
+
+
+def _answer(messages) -> str:
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    keys = [k for k in SECTIONS if f'"{k}"' in system] or list(SECTIONS)
+    return json.dumps({k: SECTIONS[k] for k in keys})
+
+
+def _usage(messages, text: str) -> dict:
+    # ~4 characters per token, close enough for accounting
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4
+    completion = len(text) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    if config["error_rate"] and random.random() < config["error_rate"]:
+        return Response(
+            content=json.dumps({"error": {"message": "Injected failure", "type": "server_error"}}),
+            status_code=503,
+            media_type="application/json"
+        )
+
+    messages = body.get("messages", [])
+    model = body.get("model", "gpt-4o")
+    text = _answer(messages)
+    usage = _usage(messages, text)
+    completion_id = f"chatcmpl-bench{random.getrandbits(48):x}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(config["latency_ms"] / 1000)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            "usage": usage
+        }
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage")
+
+    def chunk(delta: dict, finish_reason=None) -> str:
+        data = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def events():
+        await asyncio.sleep(config["latency_ms"] / 1000)
+        yield chunk({"role": "assistant", "content": ""})
+        for i in range(0, len(text), CHUNK_CHARS):
+            yield chunk({"content": text[i:i + CHUNK_CHARS]})
+            if config["chunk_ms"]:
+                await asyncio.sleep(config["chunk_ms"] / 1000)
+        yield chunk({}, "stop")
+        if include_usage:
+            yield "data: " + json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": usage
+            }) + "\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Fake OpenAI API for benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument("--latency-ms", type=float, default=config["latency_ms"])
+    parser.add_argument("--chunk-ms", type=float, default=config["chunk_ms"])
+    parser.add_argument("--error-rate", type=float, default=config["error_rate"])
+    args = parser.parse_args()
+    config.update(latency_ms=args.latency_ms, chunk_ms=args.chunk_ms, error_rate=args.error_rate)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
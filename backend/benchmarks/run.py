@@ -0,0 +1,424 @@
+"""
+Offline benchmark suite: the real app against local GitHub, OpenAI and Mongo stand-ins.
+
+Starts benchmarks.fake_github, benchmarks.fake_openai and benchmarks.app_server
+as separate processes, drives each scenario with a closed-loop load generator at
+increasing concurrency, and records throughput, p50/p99 latency, errors and the
+app process's memory. Results are written as JSON; pass an earlier file with
+--compare to flag regressions, or --max-rss-mb to cap peak memory (exit status 1).
+
+Scenarios:
+  analyze          POST /analyze, a different repo every request (GitHub + OpenAI path)
+  analyze_cached   POST /analyze, one repo over and over (generation cache hits)
+  deep-n<files>    POST /api/analyze-repo on repos of that many files (one per --deep-sizes entry;
+                   500000 exceeds the fake's 100k-entry tree limit and exercises the subtree walk)
+  history          GET /history, first page of a 500-item history
+  webhook          POST /api/webhooks/gumroad, signed sale notifications
+
+Run from backend/ (needs benchmarks/requirements.txt on top of requirements.txt):
+  python -m benchmarks.run
+  python -m benchmarks.run --scenarios analyze,history --concurrency 1,16 --requests 50
+  python -m benchmarks.run --compare benchmarks/results/<baseline>.json
+
+The Mongo stand-in lives inside the app process, so GitHub responses the app
+caches there count towards its RSS. To check the app's own memory on a huge
+truncated tree, turn that cache off:
+  GITHUB_CACHE_ENABLED=false python -m benchmarks.run --scenarios deep --deep-sizes 500000 --concurrency 1,4 --max-rss-mb 160
+"""
+import os
+import sys
+import hmac
+import json
+import time
+import socket
+import asyncio
+import hashlib
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from urllib.parse import urlencode
+import httpx
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, "benchmarks", "results")
+
+GUMROAD_SECRET = "bench-secret"
+GUMROAD_PERMALINK = "bench"
+BENCH_USERS = 200
+STARTUP_TIMEOUT_SECONDS = 30
+RSS_SAMPLE_SECONDS = 0.05
+
+DEFAULT_SCENARIOS = "analyze,analyze_cached,deep,history,webhook"
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def rss_mb(pid: int):
+    """Resident memory of a process in MB, or None where it can't be read."""
+    try:
+        if psutil:
+            return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    except Exception as e:
+        print(f"Could not read memory of {pid}: {e}")
+    return None
+
+
+def percentile(sorted_values, p: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(int(-(-p * len(sorted_values) // 100)), 1)
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Services:
+    """The three processes under test. Logs go next to the results."""
+
+    def __init__(self, args, stamp: str):
+        self.args = args
+        self.stamp = stamp
+        self.procs = []
+        self.app_pid = None
+        self.ports = {}
+
+    def _start(self, name: str, module: str, port: int, extra_args=(), env=None):
+        log = open(os.path.join(RESULTS_DIR, f"{self.stamp}-{name}.log"), "w")
+        proc = subprocess.Popen(
+            [sys.executable, "-m", module, "--port", str(port), *extra_args],
+            cwd=BACKEND_DIR,
+            env=dict(os.environ, PYTHONUNBUFFERED="1", **(env or {})),
+            stdout=log,
+            stderr=subprocess.STDOUT
+        )
+        self.procs.append((name, proc, log))
+        self.ports[name] = port
+        return proc
+
+    def start(self):
+        gh, oa, app = free_port(), free_port(), free_port()
+        self._start("github", "benchmarks.fake_github", gh)
+        self._start("openai", "benchmarks.fake_openai", oa, [
+            "--latency-ms", str(self.args.openai_latency_ms),
+            "--chunk-ms", str(self.args.openai_chunk_ms),
+            "--error-rate", str(self.args.openai_error_rate)
+        ])
+        # Everything the app would otherwise read from .env is pinned here
+        proc = self._start("app", "benchmarks.app_server", app, env={
+            "GITHUB_API_URL": f"http://127.0.0.1:{gh}",
+            "GITHUB_RAW_URL": f"http://127.0.0.1:{gh}/raw",
+            "GITHUB_HTTP2": "false",
+            "GITHUB_SERVER_TOKENS": "",
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{oa}/v1",
+            "OPENAI_API_KEY": "bench",
+            "MONGODB_URI": "mongodb://bench.invalid",
+            "GUMROAD_COMMUNICATION_SECRET": GUMROAD_SECRET,
+            "GUMROAD_PRODUCT_PERMALINK": GUMROAD_PERMALINK,
+            "JOB_INPROCESS_WORKERS": "0",
+            "HISTORY_SPILL_PATH": os.path.join(RESULTS_DIR, f"{self.stamp}-history_spill.jsonl"),
+            "BENCH_USERS": str(BENCH_USERS),
+            "BENCH_MONGO_LATENCY_MS": str(self.args.mongo_latency_ms)
+        })
+        self.app_pid = proc.pid
+
+    async def wait_ready(self):
+        probes = {"github": "/openapi.json", "openai": "/openapi.json", "app": "/"}
+        deadline = time.monotonic() + STARTUP_TIMEOUT_SECONDS
+        async with httpx.AsyncClient() as client:
+            for name, path in probes.items():
+                while True:
+                    proc = next(p for n, p, _ in self.procs if n == name)
+                    if proc.poll() is not None:
+                        raise RuntimeError(f"{name} exited during startup, see its log in {RESULTS_DIR}")
+                    try:
+                        resp = await client.get(f"http://127.0.0.1:{self.ports[name]}{path}")
+                        if resp.status_code == 200:
+                            break
+                    except httpx.TransportError:
+                        pass
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"{name} did not start within {STARTUP_TIMEOUT_SECONDS}s")
+                    await asyncio.sleep(0.1)
+
+    def stop(self):
+        for _, proc, _ in self.procs:
+            proc.terminate()
+        for _, proc, log in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            log.close()
+
+
+class Scenario:
+    """
+    One endpoint under load. request(i) returns (method, path, httpx kwargs) for
+    the i-th request of a run; prepare() runs untimed before each run.
+    """
+
+    def __init__(self, name: str, request, prepare=None, scale: float = 1.0):
+        self.name = name
+        self.request = request
+        self.prepare = prepare
+        self.scale = scale
+
+
+_user_counter = {"next": 0}
+
+
+def next_user() -> dict:
+    # Seeded pro users in rotation, so quota never runs out mid-run
+    i = _user_counter["next"] % BENCH_USERS
+    _user_counter["next"] += 1
+    return {"user_id": f"bench-user-{i}", "email": f"bench-user-{i}@example.com"}
+
+
+def build_scenarios(args, run_id: str) -> list:
+    scenarios = []
+    wanted = args.scenarios.split(",")
+
+    if "analyze" in wanted:
+        scenarios.append(Scenario("analyze", lambda i, tag: ("POST", "/analyze", {"json": dict(
+            next_user(), url=f"https://github.com/bench/analyze-{run_id}-{tag}-{i}-n{args.files}", tone="Educator"
+        )})))
+
+    if "analyze_cached" in wanted:
+        def cached_request(i, tag):
+            return "POST", "/analyze", {"json": dict(
+                next_user(), url=f"https://github.com/bench/cached-{run_id}-n{args.files}", tone="Educator"
+            )}
+        scenarios.append(Scenario("analyze_cached", cached_request, prepare=lambda: cached_request(0, "warm")))
+
+    if "deep" in wanted:
+        for size in (int(s) for s in args.deep_sizes.split(",")):
+            def deep_request(i, tag, size=size):
+                body = dict(
+                    next_user(),
+                    repo_url=f"https://github.com/bench/deep-{run_id}-{tag}-{i}-n{size}",
+                    github_token="bench-token",
+                    tone="Educator"
+                )
+                if args.deep_mode:
+                    body["analysis_mode"] = args.deep_mode
+                return "POST", "/api/analyze-repo", {"json": body}
+            # Bigger repos get fewer requests so a run stays in minutes
+            scenarios.append(Scenario(f"deep-n{size}", deep_request, scale=min(1.0, 10_000 / max(size, 1))))
+
+    if "history" in wanted:
+        scenarios.append(Scenario("history", lambda i, tag: (
+            "GET", "/history", {"params": {"user_id": "bench-history", "limit": 20}}
+        )))
+
+    if "webhook" in wanted:
+        def webhook_request(i, tag):
+            body = urlencode({
+                "email": f"bench-buyer-{run_id}-{tag}-{i}@example.com",
+                "sale_id": f"sale-{run_id}-{tag}-{i}",
+                "subscription_id": f"sub-{run_id}-{tag}-{i}",
+                "product_permalink": f"https://bench.gumroad.com/l/{GUMROAD_PERMALINK}",
+                "license_key": f"KEY-{i}"
+            }).encode("utf-8")
+            signature = hmac.new(GUMROAD_SECRET.encode("utf-8"), body, hashlib.sha256).hexdigest()
+            return "POST", "/api/webhooks/gumroad", {"content": body, "headers": {
+                "content-type": "application/x-www-form-urlencoded",
+                "x-gumroad-signature": signature
+            }}
+        scenarios.append(Scenario("webhook", webhook_request))
+
+    return scenarios
+
+
+async def run_level(client: httpx.AsyncClient, scenario: Scenario, concurrency: int, total: int, app_pid: int) -> dict:
+    """Closed loop: `concurrency` workers issue `total` requests back to back."""
+    tag = f"c{concurrency}"
+    if scenario.prepare:
+        method, path, kwargs = scenario.prepare()
+        await client.request(method, path, **kwargs)
+
+    latencies = []
+    statuses = {}
+    issued = {"next": 0}
+    rss = {"peak": rss_mb(app_pid), "start": rss_mb(app_pid)}
+    done = asyncio.Event()
+
+    async def sample_rss():
+        while not done.is_set():
+            value = rss_mb(app_pid)
+            if value is not None and (rss["peak"] is None or value > rss["peak"]):
+                rss["peak"] = value
+            await asyncio.sleep(RSS_SAMPLE_SECONDS)
+
+    async def worker():
+        while issued["next"] < total:
+            i = issued["next"]
+            issued["next"] += 1
+            method, path, kwargs = scenario.request(i, tag)
+            start = time.perf_counter()
+            try:
+                resp = await client.request(method, path, **kwargs)
+                status = str(resp.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    sampler = asyncio.create_task(sample_rss())
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    done.set()
+    await sampler
+
+    latencies.sort()
+    errors = sum(n for status, n in statuses.items() if not status.startswith("2"))
+    end_rss = rss_mb(app_pid)
+    return {
+        "scenario": scenario.name,
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "statuses": statuses,
+        "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0.0,
+        "max_ms": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        "rss_start_mb": round(rss["start"], 1) if rss["start"] is not None else None,
+        "rss_peak_mb": round(rss["peak"], 1) if rss["peak"] is not None else None,
+        "rss_end_mb": round(end_rss, 1) if end_rss is not None else None
+    }
+
+
+async def run_benchmarks(args, services: Services, run_id: str) -> list:
+    levels = [int(c) for c in args.concurrency.split(",")]
+    results = []
+    timeout = httpx.Timeout(args.request_timeout)
+    limits = httpx.Limits(max_connections=max(levels), max_keepalive_connections=max(levels))
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{services.ports['app']}", timeout=timeout, limits=limits) as client:
+        for scenario in build_scenarios(args, run_id):
+            for concurrency in levels:
+                total = max(concurrency, int(args.requests * scenario.scale), 1)
+                row = await run_level(client, scenario, concurrency, total, services.app_pid)
+                results.append(row)
+                print(
+                    f"{row['scenario']:<16} c={concurrency:<4} n={total:<5} "
+                    f"{row['throughput_rps']:>8.1f} req/s  p50 {row['p50_ms']:>8.1f} ms  "
+                    f"p99 {row['p99_ms']:>8.1f} ms  errors {row['errors']:<4} rss {row['rss_peak_mb']} MB"
+                )
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=10
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(baseline: dict, current: dict, tolerance: float) -> list:
+    """
+    Rows that got worse than baseline by more than `tolerance` (a fraction):
+    lower throughput, higher p50/p99 or peak memory, or more errors.
+    """
+    old_rows = {(r["scenario"], r["concurrency"]): r for r in baseline.get("results", [])}
+    regressions = []
+    for row in current["results"]:
+        old = old_rows.get((row["scenario"], row["concurrency"]))
+        if not old:
+            continue
+        label = f"{row['scenario']} c={row['concurrency']}"
+        if old["throughput_rps"] and row["throughput_rps"] < old["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {old['throughput_rps']} -> {row['throughput_rps']} req/s")
+        for key in ("p50_ms", "p99_ms", "rss_peak_mb"):
+            if old.get(key) and row.get(key) and row[key] > old[key] * (1 + tolerance):
+                regressions.append(f"{label}: {key} {old[key]} -> {row[key]}")
+        if row["errors"] > old["errors"]:
+            regressions.append(f"{label}: errors {old['errors']} -> {row['errors']}")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the Repo2Viral backend")
+    parser.add_argument("--scenarios", default=DEFAULT_SCENARIOS, help=f"comma separated (default {DEFAULT_SCENARIOS})")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=64, help="requests per scenario and level (scaled down for big deep repos)")
+    parser.add_argument("--files", type=int, default=200, help="repo size for the /analyze scenarios")
+    parser.add_argument("--deep-sizes", default="10,1000,50000,500000", help="repo sizes for the deep scenarios")
+    parser.add_argument("--deep-mode", default=None, choices=("api", "archive"), help="analysis_mode for deep requests (default: server's)")
+    parser.add_argument("--openai-latency-ms", type=float, default=250)
+    parser.add_argument("--openai-chunk-ms", type=float, default=5)
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--mongo-latency-ms", type=float, default=0)
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--output", help="results file (default benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--compare", help="earlier results file to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative slowdown before --compare fails")
+    parser.add_argument("--max-rss-mb", type=float, help="fail if the app's peak RSS in any row exceeds this")
+    args = parser.parse_args()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    services = Services(args, stamp)
+    services.start()
+    try:
+        asyncio.run(services.wait_ready())
+        results = asyncio.run(run_benchmarks(args, services, stamp))
+    finally:
+        services.stop()
+
+    report = {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat() + "Z",
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "config": vars(args)
+        },
+        "results": results
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"{stamp}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}")
+
+    failed = False
+    if args.max_rss_mb:
+        over = [r for r in results if r.get("rss_peak_mb") and r["rss_peak_mb"] > args.max_rss_mb]
+        for row in over:
+            print(f"{row['scenario']} c={row['concurrency']}: peak RSS {row['rss_peak_mb']} MB > {args.max_rss_mb} MB")
+        failed = bool(over)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) against {args.compare}:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions against {args.compare} (tolerance {args.tolerance:.0%})")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
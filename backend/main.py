@@ -1,17 +1,54 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
-from services.github_loader import fetch_repo_content
-from services.ai_generator import generate_viral_content
-from services.usage_service import check_usage, increment_usage
-from services.database import db
+from typing import Optional, List
+from services.github_loader import fetch_repo_content, list_org_repos
+from services.ai_generator import generate_viral_content, stream_viral_content, normalize_sections, SECTION_KEYS
+from services.usage_service import reserve_usage, commit_usage, release_usage
+from services.user_cache import get_user
+from services.database import db, close_database
+from services.indexes import ensure_indexes
+from services.history_writer import start_history_writer, stop_history_writer, record_history
+from services.generation_cache import build_cache_key, get_cached_content, store_cached_content, normalize_repo
+from services.github_client import start_github_client, close_github_client
+from services.single_flight import SingleFlight
+from services.resilience import CircuitOpenError
+from services.metrics import stage, in_flight, start_request_timings, server_timing_header, render_metrics
+from services.job_queue import (
+    enqueue_job, get_job, start_workers, stop_workers, JobFailed,
+    SUCCEEDED, FINISHED, JOB_POLL_INTERVAL_SECONDS
+)
+from contextlib import asynccontextmanager
 from datetime import datetime
+from bson import ObjectId
 
+import os
 import json
+import base64
+import anyio
+import asyncio
 
 from routers import webhooks
 
-app = FastAPI(title="Repo2Viral Backend")
+# Job workers inside the API process. Set to 0 when worker.py runs as its own service.
+JOB_INPROCESS_WORKERS = int(os.getenv("JOB_INPROCESS_WORKERS", "1"))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Shared resources live for the whole process, not per request
+    await start_github_client()
+    await ensure_indexes()
+    await start_history_writer()
+    if JOB_INPROCESS_WORKERS > 0:
+        await start_workers(JOB_INPROCESS_WORKERS, process_job, finish_job)
+    yield
+    await stop_workers()
+    await stop_history_writer()
+    await close_github_client()
+    await close_database()
+
+app = FastAPI(title="Repo2Viral Backend", lifespan=lifespan)
 
 app.include_router(webhooks.router, prefix="/api/webhooks", tags=["webhooks"])
 
@@ -21,32 +58,138 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Cache"],
 )
 
+@app.middleware("http")
+async def server_timing(request: Request, call_next):
+    # Streamed responses only carry the stages that finished before their headers went out
+    timings = start_request_timings()
+    response = await call_next(request)
+    if timings:
+        response.headers["Server-Timing"] = server_timing_header(timings)
+        response.headers["Timing-Allow-Origin"] = "*"
+    return response
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus scrape endpoint (per process)."""
+    body, content_type = render_metrics()
+    return Response(content=body, media_type=content_type)
+
 class RepoRequest(BaseModel):
     url: str
     user_id: str
     email: str
     tone: str = "Educator"
+    no_cache: bool = False
+    sections: Optional[List[str]] = None  # subset of SECTION_KEYS; default is everything
 
 @app.get("/")
 def read_root():
     return {"status": "Repo2Viral Backend API is running"}
 
-@app.post("/analyze")
-async def analyze_repo(request: RepoRequest):
-    # Step 0: Check quota BEFORE doing any work (don't increment yet)
+def upstream_unavailable(e: CircuitOpenError) -> HTTPException:
+    # Fail fast while an upstream is down instead of waiting out its timeouts
+    return HTTPException(
+        status_code=503,
+        detail=f"{e.upstream} is temporarily unavailable. Please retry shortly.",
+        headers={"Retry-After": str(max(int(e.retry_in), 1))}
+    )
+
+def validate_sections(sections):
     try:
-        check_usage(request.user_id, request.email)
+        normalize_sections(sections)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def reserve_quota(user_id: str, email: str):
+    """Reserves one generation up front (single atomic round trip) or raises 403/500."""
+    try:
+        with stage("quota"):
+            await reserve_usage(user_id, email)
     except Exception as e:
         if "limit reached" in str(e).lower():
             raise HTTPException(status_code=403, detail="Free limit reached. Upgrade to Pro.")
         raise HTTPException(status_code=500, detail=f"Usage check failed: {str(e)}")
 
+# Strong references to settlements that outlive a cancelled request
+_settlements = set()
+
+async def release_shielded(user_id: str, amount: int = 1):
+    """
+    release_usage() for paths that run while the request is being cancelled
+    (a client disconnect cancels the streaming response's scope). The release
+    runs as its own task, awaited in a shielded scope, so it finishes either way.
+    """
+    task = asyncio.create_task(release_usage(user_id, amount))
+    _settlements.add(task)
+    task.add_done_callback(_settlements.discard)
+    with anyio.CancelScope(shield=True):
+        await task
+
+@app.post("/analyze")
+async def analyze_repo(request: RepoRequest, response: Response):
+    validate_sections(request.sections)
+    # Step 0: Reserve quota BEFORE doing any work; it is released if generation fails
+    await reserve_quota(request.user_id, request.email)
+    try:
+        content_data = await generate_from_readme(request, response)
+    except BaseException:
+        await release_usage(request.user_id)
+        raise
+
+    # Step 3: Generation succeeded, keep the reserved slot
+    await commit_usage(request.user_id)
+
+    # Step 4: Save to History (queued; flushed to MongoDB in batches)
+    await record_history({
+        "user_id": request.user_id,
+        "repo_url": request.url,
+        "generated_content": content_data,
+        "platform": "All",
+        "tone_used": request.tone,
+        "created_at": datetime.utcnow()
+    })
+
+    return content_data
+
+# Identical generations already running (same repo commit, tone, endpoint and mode)
+# are joined instead of repeated. Quota and history stay with each caller.
+generations = SingleFlight()
+
+def cache_status(content_data, shared: bool) -> str:
+    if shared:
+        return "COALESCED"
+    return "HIT" if content_data else "MISS"
+
+async def generate_from_readme(request: RepoRequest, response: Response):
+    # Step 0.5: Same repo + commit + tone already generated? Skip GitHub and the LLM entirely.
+    with stage("cache_key"):
+        cache_key = await build_cache_key(request.url, request.tone, "readme", sections=request.sections)
+    content_data = None
+    if cache_key and not request.no_cache:
+        with stage("cache_lookup"):
+            content_data = await get_cached_content(cache_key)
+    if content_data:
+        response.headers["X-Cache"] = cache_status(content_data, False)
+        return content_data
+
+    # The cache key already pins repo + commit + tone, so it doubles as the flight key
+    flight_key = ("readme", cache_key) if cache_key else None
+    with in_flight("analysis"):
+        content_data, shared = await generations.do(flight_key, lambda: run_readme_generation(request, cache_key))
+    response.headers["X-Cache"] = cache_status(None, shared)
+    return content_data
+
+async def run_readme_generation(request: RepoRequest, cache_key: Optional[str]):
     # Step 1: Get Data from GitHub
     print(f"Fetching repo: {request.url}")
     try:
-        readme_content = await fetch_repo_content(request.url)
+        with stage("github_readme"):
+            readme_content = await fetch_repo_content(request.url)
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error fetching repo: {str(e)}")
 
@@ -55,30 +198,21 @@ async def analyze_repo(request: RepoRequest):
 
     # Step 2: Generate Content with AI
     print(f"Generating AI content with tone: {request.tone}")
-    content_data = generate_viral_content(readme_content, request.tone)
+    try:
+        with stage("generate"):
+            content_data = await generate_viral_content(readme_content, request.tone, request.sections)
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
 
     if not content_data:
         raise HTTPException(status_code=500, detail="AI generation failed. Check API server logs or keys.")
 
-    # Step 3: Increment usage only after successful generation
-    increment_usage(request.user_id)
-
-    # Step 4: Save to History (MongoDB)
-    try:
-        db["content_history"].insert_one({
-            "user_id": request.user_id,
-            "repo_url": request.url,
-            "generated_content": content_data,
-            "platform": "All",
-            "tone_used": request.tone,
-            "created_at": datetime.utcnow()
-        })
-    except Exception as e:
-        print(f"Failed to save history: {e}")
+    if cache_key:
+        await store_cached_content(cache_key, content_data, request.url, request.tone, "readme", request.sections)
 
     return content_data
 
-from services.deep_analyser import analyze_repo_structure
+from services.deep_analyser import analyze_repo_structure, DEEP_ANALYSIS_MODE
 
 class AnalyzeRequest(BaseModel):
     repo_url: str
@@ -86,30 +220,83 @@ class AnalyzeRequest(BaseModel):
     user_id: str
     email: str
     tone: str = "Educator"
+    no_cache: bool = False
+    sections: Optional[List[str]] = None  # subset of SECTION_KEYS; default is everything
+    analysis_mode: Optional[str] = None  # "api" (per-file) or "archive" (single tarball)
 
 @app.post("/api/analyze-repo")
-async def analyze_repo_deep(request: AnalyzeRequest):
-    # Step 0: Check quota BEFORE doing any work (don't increment yet)
+async def analyze_repo_deep(request: AnalyzeRequest, response: Response):
+    validate_sections(request.sections)
+    # Step 0: Reserve quota BEFORE doing any work; it is released if generation fails
+    await reserve_quota(request.user_id, request.email)
     try:
-        check_usage(request.user_id, request.email)
-    except Exception as e:
-        if "limit reached" in str(e).lower():
-            raise HTTPException(status_code=403, detail="Free limit reached. Upgrade to Pro.")
-        raise HTTPException(status_code=500, detail=f"Usage check failed: {str(e)}")
+        content_data = await generate_deep(request, response)
+    except BaseException:
+        await release_usage(request.user_id)
+        raise
+
+    # Step 3: Generation succeeded, keep the reserved slot
+    await commit_usage(request.user_id)
+
+    # Step 4: Save to History (queued; flushed to MongoDB in batches)
+    await record_history({
+        "user_id": request.user_id,
+        "repo_url": request.repo_url,
+        "generated_content": content_data,
+        "platform": "Deep Analysis",
+        "tone_used": request.tone,
+        "created_at": datetime.utcnow()
+    })
+
+    return content_data
 
+def deep_analysis_error(e: Exception) -> HTTPException:
+    if isinstance(e, CircuitOpenError):
+        return upstream_unavailable(e)
+    error_msg = str(e)
+    if "401" in error_msg or "403" in error_msg or "Expired" in error_msg:
+        return HTTPException(status_code=401, detail="GitHub Token Expired or Invalid. Please log in again.")
+    return HTTPException(status_code=400, detail=f"Deep analysis failed: {error_msg}")
+
+async def generate_deep(request: AnalyzeRequest, response: Response):
+    # Step 0.5: Cache lookup (HEAD is resolved with the user's token, so access is re-checked)
+    with stage("cache_key"):
+        cache_key = await build_cache_key(request.repo_url, request.tone, "deep", request.github_token, request.sections)
+    content_data = None
+    if cache_key and not request.no_cache:
+        with stage("cache_lookup"):
+            content_data = await get_cached_content(cache_key)
+    if content_data:
+        response.headers["X-Cache"] = cache_status(content_data, False)
+        return content_data
+
+    # Joiners have already passed the HEAD access check with their own token above
+    with in_flight("analysis"):
+        content_data, shared = await generations.do(deep_flight_key(request, cache_key), lambda: run_deep_generation(request, cache_key))
+    response.headers["X-Cache"] = cache_status(None, shared)
+    return content_data
+
+def deep_flight_key(request: AnalyzeRequest, cache_key: Optional[str]):
+    if not cache_key:
+        return None
+    return ("deep", cache_key, request.analysis_mode or DEEP_ANALYSIS_MODE)
+
+async def run_deep_generation(request: AnalyzeRequest, cache_key: Optional[str]):
     # Step 1: Deep Analysis using User Token
     print(f"Deep analyzing repo: {request.repo_url}")
     try:
-        structure_data = await analyze_repo_structure(request.repo_url, request.github_token)
+        with stage("analysis"):
+            structure_data = await analyze_repo_structure(request.repo_url, request.github_token, request.analysis_mode)
     except Exception as e:
-        error_msg = str(e)
-        if "401" in error_msg or "403" in error_msg or "Expired" in error_msg:
-            raise HTTPException(status_code=401, detail="GitHub Token Expired or Invalid. Please log in again.")
-        raise HTTPException(status_code=400, detail=f"Deep analysis failed: {error_msg}")
+        raise deep_analysis_error(e)
 
     # Step 2: Generate AI Content
     print(f"Generating AI content with tone: {request.tone}")
-    content_data = generate_viral_content(structure_data, request.tone)
+    try:
+        with stage("generate"):
+            content_data = await generate_viral_content(structure_data, request.tone, request.sections)
+    except CircuitOpenError as e:
+        raise upstream_unavailable(e)
 
     if not content_data:
         raise HTTPException(status_code=500, detail="AI generation failed.")
@@ -117,12 +304,99 @@ async def analyze_repo_deep(request: AnalyzeRequest):
     # Inject Repo Stats into the result so frontend can use it for Video
     content_data["repo_stats"] = structure_data.get("repo_stats", {})
 
-    # Step 3: Increment usage only after successful generation
-    increment_usage(request.user_id)
+    if cache_key:
+        await store_cached_content(cache_key, content_data, request.repo_url, request.tone, "deep", request.sections)
 
-    # Step 4: Save to History (MongoDB)
+    return content_data
+
+def sse_event(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/api/analyze-repo/stream")
+async def analyze_repo_deep_stream(request: AnalyzeRequest):
+    """
+    /api/analyze-repo as Server-Sent Events:
+      stage    {"stage": "cache"|"coalesced"|"repo_info"|"tree"|"evidence"|"entry_point"|"generating", "data": {...}}
+      section  {"key": ..., "value": ...} as soon as the model finishes that top-level section
+      done     the same body /api/analyze-repo returns
+      error    {"status_code": ..., "detail": ...}
+    Quota is reserved before the stream opens, so an exhausted quota is still a plain 403.
+    """
+    validate_sections(request.sections)
+    await reserve_quota(request.user_id, request.email)
+    return StreamingResponse(
+        stream_deep(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def stream_deep(request: AnalyzeRequest):
+    committed = False
     try:
-        db["content_history"].insert_one({
+        with stage("cache_key"):
+            cache_key = await build_cache_key(request.repo_url, request.tone, "deep", request.github_token, request.sections)
+        content_data = None
+        if cache_key and not request.no_cache:
+            with stage("cache_lookup"):
+                content_data = await get_cached_content(cache_key)
+
+        if content_data:
+            yield sse_event("stage", {"stage": "cache", "data": {"hit": True}})
+        else:
+            flight_key = deep_flight_key(request, cache_key)
+            if generations.in_flight(flight_key):
+                # Someone is already generating this exact result; wait for theirs
+                yield sse_event("stage", {"stage": "coalesced", "data": {}})
+                with in_flight("analysis"):
+                    content_data, _ = await generations.do(flight_key, lambda: run_deep_generation(request, cache_key))
+
+        if content_data:
+            for key in SECTION_KEYS:
+                if key in content_data:
+                    yield sse_event("section", {"key": key, "value": content_data[key]})
+        else:
+            # Stage events are pushed by the analyser and relayed while it runs
+            events = asyncio.Queue()
+            analysis = asyncio.create_task(analyze_repo_structure(
+                request.repo_url, request.github_token, request.analysis_mode,
+                on_stage=lambda stage, data: events.put_nowait((stage, data))
+            ))
+            analysis.add_done_callback(lambda _: events.put_nowait((None, None)))
+            try:
+                while True:
+                    stage_name, data = await events.get()
+                    if stage_name is None:
+                        break
+                    yield sse_event("stage", {"stage": stage_name, "data": data})
+                structure_data = analysis.result()
+            except HTTPException:
+                raise
+            except Exception as e:
+                raise deep_analysis_error(e)
+            finally:
+                analysis.cancel()
+
+            yield sse_event("stage", {"stage": "generating", "data": {"tone": request.tone}})
+            try:
+                async for kind, payload in stream_viral_content(structure_data, request.tone, request.sections):
+                    if kind == "section":
+                        key, value = payload
+                        yield sse_event("section", {"key": key, "value": value})
+                    else:
+                        content_data = payload
+            except CircuitOpenError as e:
+                raise upstream_unavailable(e)
+            except Exception as e:
+                print(f"AI Generation Error: {e}")
+                raise HTTPException(status_code=500, detail="AI generation failed.")
+
+            content_data["repo_stats"] = structure_data.get("repo_stats", {})
+            if cache_key:
+                await store_cached_content(cache_key, content_data, request.repo_url, request.tone, "deep", request.sections)
+
+        await commit_usage(request.user_id)
+        committed = True
+        await record_history({
             "user_id": request.user_id,
             "repo_url": request.repo_url,
             "generated_content": content_data,
@@ -130,32 +404,337 @@ async def analyze_repo_deep(request: AnalyzeRequest):
             "tone_used": request.tone,
             "created_at": datetime.utcnow()
         })
+        yield sse_event("done", content_data)
+    except HTTPException as e:
+        await release_usage(request.user_id)
+        yield sse_event("error", {"status_code": e.status_code, "detail": e.detail})
     except Exception as e:
-        print(f"Failed to save history: {e}")
+        if not committed:
+            await release_usage(request.user_id)
+        print(f"Streaming analysis failed: {e}")
+        yield sse_event("error", {"status_code": 500, "detail": str(e)})
+    except BaseException:
+        # Client went away mid-stream
+        if not committed:
+            await release_shielded(request.user_id)
+        raise
 
-    return content_data
+# Bulk analysis: repos per batch and how many run at once within one batch
+BATCH_MAX_REPOS = int(os.getenv("BATCH_MAX_REPOS", "25"))
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
 
-@app.get("/history")
-def get_user_history(user_id: str):
+class BatchAnalyzeRequest(BaseModel):
+    repo_urls: List[str] = []
+    org: Optional[str] = None  # GitHub org or user; its repos are added to repo_urls
+    github_token: str
+    user_id: str
+    email: str
+    tone: str = "Educator"
+    no_cache: bool = False
+    sections: Optional[List[str]] = None  # subset of SECTION_KEYS; default is everything
+    analysis_mode: Optional[str] = None
+
+async def resolve_batch_urls(request: BatchAnalyzeRequest) -> List[str]:
+    """repo_urls plus the org's repos, de-duplicated by owner/repo, capped at BATCH_MAX_REPOS."""
+    urls = list(request.repo_urls)
+    if request.org:
+        try:
+            urls += await list_org_repos(request.org, request.github_token, BATCH_MAX_REPOS)
+        except Exception as e:
+            raise deep_analysis_error(e)
+
+    unique = {}
+    for url in urls:
+        repo = normalize_repo(url)
+        if not repo:
+            raise HTTPException(status_code=400, detail=f"Not a GitHub repository URL: {url}")
+        unique.setdefault(repo, url)
+    if not unique:
+        raise HTTPException(status_code=400, detail="No repositories to analyze.")
+    return list(unique.values())[:BATCH_MAX_REPOS]
+
+@app.post("/api/analyze-repos")
+async def analyze_repos_batch(request: BatchAnalyzeRequest):
+    """
+    Deep analysis for many repos, streamed back as NDJSON, one line per event:
+      {"type": "start", "total": n, "repo_urls": [...]}
+      {"type": "result", "repo_url": ..., "cache": "HIT"|"MISS"|"COALESCED", "content": {...}}
+      {"type": "error", "repo_url": ..., "status_code": ..., "detail": ...}
+      {"type": "summary", "succeeded": ..., "failed": ...}
+    Lines arrive in completion order. Quota for every repo is reserved up front
+    (all or nothing, so the batch gets a plain 403 if it doesn't fit) and each
+    failed or unfinished repo's slot is released.
+    """
+    validate_sections(request.sections)
+    repo_urls = await resolve_batch_urls(request)
     try:
-        history = list(
-            db["content_history"]
-            .find({"user_id": user_id})
-            .sort("created_at", -1)
+        await reserve_usage(request.user_id, request.email, amount=len(repo_urls))
+    except Exception as e:
+        if "limit reached" in str(e).lower():
+            raise HTTPException(status_code=403, detail=f"Not enough quota left for {len(repo_urls)} repositories.")
+        raise HTTPException(status_code=500, detail=f"Usage check failed: {str(e)}")
+
+    return StreamingResponse(
+        stream_batch(request, repo_urls),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def stream_batch(request: BatchAnalyzeRequest, repo_urls: List[str]):
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+    unsettled = len(repo_urls)
+
+    async def run_one(repo_url: str):
+        item = AnalyzeRequest(
+            repo_url=repo_url,
+            github_token=request.github_token,
+            user_id=request.user_id,
+            email=request.email,
+            tone=request.tone,
+            no_cache=request.no_cache,
+            analysis_mode=request.analysis_mode,
+            sections=request.sections
         )
-        for item in history:
-            item["_id"] = str(item["_id"])
-            item["id"] = item["_id"]
-            if "created_at" in item:
-                item["created_at"] = item["created_at"].isoformat()
-        return history
+        item_response = Response()
+        async with semaphore:
+            try:
+                content_data = await generate_deep(item, item_response)
+            except HTTPException as e:
+                return repo_url, None, {"status_code": e.status_code, "detail": e.detail}
+            except Exception as e:
+                print(f"Batch item {repo_url} failed: {e}")
+                return repo_url, None, {"status_code": 500, "detail": str(e)}
+        return repo_url, (content_data, item_response.headers.get("x-cache")), None
+
+    def line(data: dict) -> str:
+        return json.dumps(data, default=str) + "\n"
+
+    tasks = [asyncio.create_task(run_one(url)) for url in repo_urls]
+    succeeded = failed = 0
+    try:
+        yield line({"type": "start", "total": len(repo_urls), "repo_urls": repo_urls})
+        for finished in asyncio.as_completed(tasks):
+            repo_url, result, error = await finished
+            unsettled -= 1
+            if error:
+                failed += 1
+                await release_shielded(request.user_id)
+                yield line({"type": "error", "repo_url": repo_url, **error})
+                continue
+
+            content_data, cache = result
+            succeeded += 1
+            await commit_usage(request.user_id)
+            await record_history({
+                "user_id": request.user_id,
+                "repo_url": repo_url,
+                "generated_content": content_data,
+                "platform": "Deep Analysis",
+                "tone_used": request.tone,
+                "created_at": datetime.utcnow()
+            })
+            yield line({"type": "result", "repo_url": repo_url, "cache": cache, "content": content_data})
+        yield line({"type": "summary", "succeeded": succeeded, "failed": failed})
+    finally:
+        # Client disconnected (or we crashed): stop the rest and hand back their slots
+        for task in tasks:
+            task.cancel()
+        if unsettled:
+            await release_shielded(request.user_id, amount=unsettled)
+
+# --- Job mode: enqueue now, generate in a worker, poll or subscribe for the result ---
+
+@app.post("/api/analyze-repo/jobs", status_code=202)
+async def enqueue_deep_analysis(request: AnalyzeRequest):
+    """
+    Queues a deep analysis and returns its job id right away.
+    Quota is reserved here; the worker commits it on success or releases it
+    once the job has finally failed. Follow the job via GET /api/jobs/{job_id}
+    or the /events stream.
+    """
+    validate_sections(request.sections)
+    await reserve_quota(request.user_id, request.email)
+    try:
+        job_id = await enqueue_job("deep", request.user_id, request.model_dump())
+    except Exception as e:
+        await release_usage(request.user_id)
+        raise HTTPException(status_code=500, detail=f"Could not queue analysis: {str(e)}")
+    return {"job_id": job_id, "status": "queued"}
+
+async def process_job(job: dict):
+    """Job handler: the same generation path as /api/analyze-repo."""
+    if job["kind"] != "deep":
+        raise JobFailed(f"Unknown job kind: {job['kind']}", status_code=400, retryable=False)
+    # A job reclaimed from a dead worker no longer has its token (see claim_job)
+    request = AnalyzeRequest(**{"github_token": "", **job["payload"]})
+    try:
+        return await generate_deep(request, Response())
+    except HTTPException as e:
+        # Bad repo / token / input won't get better on retry; upstream failures might
+        raise JobFailed(str(e.detail), e.status_code, retryable=e.status_code >= 500 or e.status_code == 429)
+
+async def finish_job(job: dict, status: str, result: Optional[dict]):
+    """Settles quota and history once per job, after its final state is stored."""
+    payload = job["payload"]
+    if status != SUCCEEDED:
+        await release_usage(job["user_id"])
+        return
+    await commit_usage(job["user_id"])
+    await record_history({
+        "user_id": job["user_id"],
+        "repo_url": payload["repo_url"],
+        "generated_content": result,
+        "platform": "Deep Analysis",
+        "tone_used": payload.get("tone"),
+        "created_at": datetime.utcnow()
+    })
+
+def serialize_job(job: dict) -> dict:
+    return {
+        "job_id": str(job["_id"]),
+        "status": job["status"],
+        "attempts": job.get("attempts", 0),
+        "result": job.get("result"),
+        "error": job.get("error"),
+        "created_at": job.get("created_at"),
+        "finished_at": job.get("finished_at")
+    }
+
+@app.get("/api/jobs/{job_id}")
+async def get_analysis_job(job_id: str, user_id: str):
+    job = await get_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return serialize_job(job)
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_analysis_job(job_id: str, user_id: str):
+    """
+    Server-Sent Events for one job: a "status" event whenever its status or
+    attempt count changes, then "done" (succeeded) or "error" (failed) with the full job.
+    """
+    job = await get_job(job_id, user_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events(job):
+        last = None
+        while True:
+            state = (job["status"], job.get("attempts", 0))
+            if state != last:
+                last = state
+                yield sse_event("status", {"status": job["status"], "attempts": state[1], "error": job.get("error")})
+            if job["status"] in FINISHED:
+                yield sse_event("done" if job["status"] == SUCCEEDED else "error", serialize_job(job))
+                return
+            await asyncio.sleep(JOB_POLL_INTERVAL_SECONDS)
+            job = await get_job(job_id, user_id)
+            if not job:
+                yield sse_event("error", {"status_code": 404, "detail": "Job not found"})
+                return
+
+    return StreamingResponse(
+        events(job),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+# List views only need enough to render a card; full content comes from /history/{id}
+HISTORY_SUMMARY_PROJECTION = {
+    "user_id": 1,
+    "repo_url": 1,
+    "platform": 1,
+    "tone_used": 1,
+    "created_at": 1,
+    "repo_stats": "$generated_content.repo_stats",
+    "preview": {"$substrCP": [{"$ifNull": ["$generated_content.twitter_thread", ""]}, 0, 150]}
+}
+
+def encode_history_cursor(item: dict) -> str:
+    raw = f"{item['created_at'].isoformat()}|{item['_id']}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+def decode_history_cursor(cursor: str):
+    try:
+        created_at, object_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(created_at), ObjectId(object_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def serialize_history_item(item: dict) -> dict:
+    item["_id"] = str(item["_id"])
+    item["id"] = item["_id"]
+    if "created_at" in item:
+        item["created_at"] = item["created_at"].isoformat()
+    return item
+
+@app.get("/history")
+async def get_user_history(user_id: str, limit: int = HISTORY_PAGE_SIZE, cursor: Optional[str] = None, view: str = "summary"):
+    """
+    Newest-first history, keyset-paginated on (created_at, _id).
+    view="summary" (default) returns lightweight cards with a 150-char preview;
+    view="full" includes generated_content. Pass next_cursor back as cursor for the next page.
+    """
+    if view not in ("summary", "full"):
+        raise HTTPException(status_code=400, detail="view must be 'summary' or 'full'")
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+
+    query = {"user_id": user_id}
+    if cursor:
+        created_at, object_id = decode_history_cursor(cursor)
+        query["$or"] = [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "_id": {"$lt": object_id}}
+        ]
+
+    try:
+        # Fetch one extra row to know whether another page exists
+        pipeline = [
+            {"$match": query},
+            {"$sort": {"created_at": -1, "_id": -1}},
+            {"$limit": limit + 1}
+        ]
+        if view == "summary":
+            pipeline.append({"$project": HISTORY_SUMMARY_PROJECTION})
+        cursor_obj = await db["content_history"].aggregate(pipeline)
+        history = await cursor_obj.to_list(None)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
 
+    next_cursor = None
+    if len(history) > limit:
+        history = history[:limit]
+        next_cursor = encode_history_cursor(history[-1])
+
+    return {
+        "items": [serialize_history_item(item) for item in history],
+        "next_cursor": next_cursor
+    }
+
+@app.get("/history/{history_id}")
+async def get_history_item(history_id: str, user_id: str):
+    """Full generated content for a single history entry owned by user_id."""
+    try:
+        object_id = ObjectId(history_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid history id")
+
+    try:
+        item = await db["content_history"].find_one({"_id": object_id, "user_id": user_id})
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
+
+    if not item:
+        raise HTTPException(status_code=404, detail="History item not found")
+    return serialize_history_item(item)
+
 @app.get("/profile")
-def get_user_profile(user_id: str):
+async def get_user_profile(user_id: str):
     try:
-        user = db["user_usage"].find_one({"user_id": user_id})
+        user = await get_user(user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
         user["_id"] = str(user["_id"])
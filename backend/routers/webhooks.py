@@ -93,13 +93,13 @@ async def gumroad_webhook(request: Request):
              print(f"Ignored request for different product. Got: {product_permalink}, Expected match for: {expected_slug}")
              return {"status": "ignored", "reason": "wrong product"}
         
-        handle_subscription_update(email, is_pro, subscription_id=subscription_id, license_key=license_key)
+        await handle_subscription_update(email, is_pro, subscription_id=subscription_id, license_key=license_key)
         print(f"✅ Processed SALE for {email}")
 
     elif refunded or disputed:
         # Refund or dispute: revoke access
         is_pro = False
-        handle_subscription_update(email, is_pro)
+        await handle_subscription_update(email, is_pro)
         reason = "refunded" if refunded else "disputed"
         print(f"⚠️ Processed {reason.upper()} for {email}, downgrading to free")
 
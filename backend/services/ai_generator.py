@@ -1,16 +1,118 @@
 import os
-from openai import OpenAI
+import copy
+import asyncio
+import functools
+from openai import AsyncOpenAI, APIConnectionError, APIStatusError
 import re
 import json
 from dotenv import load_dotenv
+from services.context_packer import pack_sections, compact_json, count_tokens
+from services.metrics import stage, in_flight, record_openai_usage
+from services.resilience import retry_call, rate_limit_wait, RETRYABLE_STATUSES, CircuitOpenError
 
 load_dotenv()
 
-# Configure OpenAI
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+# Generation engine tuning
+# OPENAI_MAX_CONCURRENCY caps how many gpt-4o calls one worker keeps in flight;
+# extra requests wait for a free slot instead of piling onto the API.
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "32"))
+OPENAI_TIMEOUT_SECONDS = float(os.getenv("OPENAI_TIMEOUT_SECONDS", "90"))
+OPENAI_QUEUE_TIMEOUT_SECONDS = float(os.getenv("OPENAI_QUEUE_TIMEOUT_SECONDS", "30"))
+# Overall deadline for one completion, across its retries, backoff sleeps and slot waits
+OPENAI_DEADLINE_SECONDS = float(os.getenv("OPENAI_DEADLINE_SECONDS", "150"))
+# Generate each requested section as its own (smaller, parallel) completion
+OPENAI_PARALLEL_SECTIONS = os.getenv("OPENAI_PARALLEL_SECTIONS", "true").lower() == "true"
+# Extra rounds for section completions that failed or came back without their keys
+OPENAI_SECTION_RETRIES = int(os.getenv("OPENAI_SECTION_RETRIES", "1"))
 
-# The System Prompt
-def get_system_prompt(tone: str = "Educator"):
+# Configure OpenAI (async so a slow completion never blocks the event loop).
+# The SDK's own retries are off: services/resilience.py applies the shared policy.
+client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), timeout=OPENAI_TIMEOUT_SECONDS, max_retries=0)
+
+_generation_slots = asyncio.Semaphore(OPENAI_MAX_CONCURRENCY)
+
+# Output sections, in the order they appear in the JSON (and in merged results)
+SECTION_KEYS = ("twitter_thread", "linkedin_post", "blog_intro", "slides", "video_metadata")
+
+SECTION_SCHEMAS = {
+    "twitter_thread": '''  "twitter_thread": "A viral 6-10 tweet thread. Use '1/X' numbering at the start of each tweet. Do NOT use 'Tweet 1:' labels. Separate tweets with double newlines. Emojis are mandatory. Tweet 1 must be a killer hook."''',
+    "linkedin_post": '''  "linkedin_post": "A professional, high-reach post. Structure: Hook -> The Problem -> The Tech Stack (Bulleted) -> Why it matters. Use minimal emojis (only for bullets). No markdown headers (#), use bold or CAPS if needed."''',
+    "blog_intro": '''  "blog_intro": "A compelling, SEO-friendly introduction (300 words). Title at the top. Hook the reader immediately."''',
+    "slides": """  "slides": [
+    {
+      "slide_number": 1,
+      "type": "hook",
+      "headline": "<Use a Catchy Hook related to the Repo>",
+      "body": "<A question or statement about the problem the repo solves>",
+      "visual_cue": "warning_icon"
+    },
+    // ... 5-7 slides total. 
+    // Slide 4 MUST be type='technical' and cite a file. 
+    // Slide 5 MUST be type='technical' and cite a file.
+  ]""",
+    "video_metadata": """  "video_metadata": {
+    "hook_text": "A short, punchy 1-line hook for a video trailer (max 40 chars)",
+    "code_snippet": "A representative code snippet (max 8 lines). Clean, indented, and impressive. If possible, use lines from the Entry Point provided."
+  }""",
+}
+
+CAROUSEL_RULES = """Carousel Rules:
+- Headlines: Must be under 40 characters. Punchy and bold.
+- Body Text: Must be under 140 characters. Simple English. No jargon without explanation.
+- **CRITICAL**: Every single slide (except Hook/CTA) MUST mention a specific technical feature found in the Evidence Checklist or File Tree.
+- Structure:
+    Slide 1: The Hook. A startling fact or a question about the problem.
+    Slide 2: The Struggle. Describe the 'Old Way'. (type="problem")
+    Slide 3: The Solution. Introduce the Repo. (type="feature")
+    Slide 4: Technical Deep Dive 1. **MUST cite a file** (e.g., "Secure Auth [found in auth.py]"). (type="technical")
+    Slide 5: Technical Deep Dive 2. **MUST cite a file** (e.g., "Smart Caching [found in redis_service.py]"). (type="technical")
+    Slide 6: Call to Action. (type="cta")
+- Slide 4 & 5 should use visual_cue='code' or 'server'.
+- If you have a specific short code snippet (max 5 lines) for Slide 4/5, put it in 'code_snippet'.
+
+"""
+
+def normalize_sections(sections=None) -> tuple:
+    """Requested sections in canonical order; None or empty means all of them."""
+    if not sections:
+        return SECTION_KEYS
+    unknown = set(sections) - set(SECTION_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown sections: {', '.join(sorted(unknown))}")
+    return tuple(k for k in SECTION_KEYS if k in sections)
+
+def build_output_rules(sections: tuple = SECTION_KEYS) -> str:
+    schema = ",\n".join(SECTION_SCHEMAS[k] for k in sections)
+    rules = f"""
+Output strictly valid JSON. Do not output markdown or plain text.
+
+Structure your response exactly like this JSON structure:
+{{
+{schema}
+}}
+
+"""
+    if "slides" in sections:
+        rules += CAROUSEL_RULES
+    return rules
+
+# Supported tones; anything else gets the default (Educator) prompt
+TONES = ("Educator", "Senior Dev", "Hype Man")
+
+def normalize_tone(tone: str) -> str:
+    return tone if tone in TONES else "Educator"
+
+def get_system_prompt(tone: str = "Educator", sections: tuple = SECTION_KEYS):
+    """
+    The system prompt for a tone and section set. Free-form tones are mapped to
+    TONES first, so the cache below holds at most one prompt per supported tone
+    and section subset no matter what clients send.
+    """
+    return _build_system_prompt(normalize_tone(tone), normalize_sections(sections))
+
+# The System Prompt (built once per tone and section set: 3 tones x 32 subsets)
+@functools.lru_cache(maxsize=len(TONES) * 2 ** len(SECTION_KEYS))
+def _build_system_prompt(tone: str, sections: tuple):
     # Base Persona: Technical Storyteller
     base = """You are a Senior Technical Writer & Code Analyst. Your goal is not just to "audit" the code, but to *teach* and *explain* the architecture to developers.
     
@@ -44,120 +146,322 @@ Tone: Technical Instructor.
 Style: Clear, step-by-step breakdown. "First, it does X..." "Then, it processes Y...". Perfect for tutorials.
 """
 
-    # Strict Rules & JSON Output
-    rules = """
-Output strictly valid JSON. Do not output markdown or plain text.
+    # Strict Rules & JSON Output (only the requested sections are described)
+    rules = build_output_rules(sections)
+    
+    return f"{base}\n{tone_instruction}\n{rules}"
 
-Structure your response exactly like this JSON structure:
-{
-  "twitter_thread": "A viral 6-10 tweet thread. Use '1/X' numbering at the start of each tweet. Do NOT use 'Tweet 1:' labels. Separate tweets with double newlines. Emojis are mandatory. Tweet 1 must be a killer hook.",
-  "linkedin_post": "A professional, high-reach post. Structure: Hook -> The Problem -> The Tech Stack (Bulleted) -> Why it matters. Use minimal emojis (only for bullets). No markdown headers (#), use bold or CAPS if needed.",
-  "blog_intro": "A compelling, SEO-friendly introduction (300 words). Title at the top. Hook the reader immediately.",
-  "slides": [
-    {
-      "slide_number": 1,
-      "type": "hook",
-      "headline": "<Use a Catchy Hook related to the Repo>",
-      "body": "<A question or statement about the problem the repo solves>",
-      "visual_cue": "warning_icon"
-    },
-    // ... 5-7 slides total. 
-    // Slide 4 MUST be type='technical' and cite a file. 
-    // Slide 5 MUST be type='technical' and cite a file.
-  ],
-  "video_metadata": {
-    "hook_text": "A short, punchy 1-line hook for a video trailer (max 40 chars)",
-    "code_snippet": "A representative code snippet (max 8 lines). Clean, indented, and impressive. If possible, use lines from the Entry Point provided."
-  }
-}
+def build_user_message(context_data: any) -> str:
+    """
+    Formats the analyser output (or a legacy README string) as the user message.
+    Deep analysis context is packed to the token budget in services/context_packer.py.
+    """
+    if isinstance(context_data, dict):
+        # It's our new Deep Analysis format
+        fixed = f"""TECH STACK: {', '.join(context_data.get('tech_stack', []))}
 
-Carousel Rules:
-- Headlines: Must be under 40 characters. Punchy and bold.
-- Body Text: Must be under 140 characters. Simple English. No jargon without explanation.
-- **CRITICAL**: Every single slide (except Hook/CTA) MUST mention a specific technical feature found in the Evidence Checklist or File Tree.
-- Structure:
-    Slide 1: The Hook. A startling fact or a question about the problem.
-    Slide 2: The Struggle. Describe the 'Old Way'. (type="problem")
-    Slide 3: The Solution. Introduce the Repo. (type="feature")
-    Slide 4: Technical Deep Dive 1. **MUST cite a file** (e.g., "Secure Auth [found in auth.py]"). (type="technical")
-    Slide 5: Technical Deep Dive 2. **MUST cite a file** (e.g., "Smart Caching [found in redis_service.py]"). (type="technical")
-    Slide 6: Call to Action. (type="cta")
-- Slide 4 & 5 should use visual_cue='code' or 'server'.
-- If you have a specific short code snippet (max 5 lines) for Slide 4/5, put it in 'code_snippet'.
+EVIDENCE CHECKLIST (Verified Features):
+{compact_json(context_data.get('evidence', {}))}"""
+        packed = pack_sections(
+            context_data.get('readme_content', 'No README'),
+            context_data.get('entry_point_content') or "",
+            context_data.get('file_tree', []),
+            fixed_tokens=count_tokens(fixed),
+            total_files=context_data.get('file_count')
+        )
+        return f"""Here is the Deep Code Analysis of the Repository:
+
+README CONTENT (Context):
+{packed['readme']}
+
+{fixed}
 
+ENTRY POINT ({context_data.get('entry_point_name')}):
+```
+{packed['entry_point']}
+```
+
+FILE STRUCTURE:
+{packed['file_tree']}
 """
-    
-    return f"{base}\n{tone_instruction}\n{rules}"
+    # Legacy string input (already packed by github_loader)
+    return f"Here is the Repository README:\n{context_data}"
+
+class GenerationQueueTimeout(RuntimeError):
+    """No OPENAI_MAX_CONCURRENCY slot freed up in time; OpenAI was never called."""
 
-def generate_viral_content(context_data: any, tone: str = "Educator"):
+
+async def _acquire_slot():
+    try:
+        with in_flight("openai_waiting"):
+            await asyncio.wait_for(_generation_slots.acquire(), timeout=OPENAI_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise GenerationQueueTimeout(f"no free generation slot after {OPENAI_QUEUE_TIMEOUT_SECONDS}s")
+
+def _classify_openai_error(e: Exception):
+    """(retryable, wait, counts_as_failure) for retry_call."""
+    if isinstance(e, GenerationQueueTimeout):
+        # Our own back-pressure, not a verdict on OpenAI
+        return False, None, None
+    if isinstance(e, APIConnectionError):  # includes the SDK's timeouts
+        return True, None, True
+    if isinstance(e, APIStatusError):
+        wait = rate_limit_wait(e.response.headers) if e.status_code == 429 else None
+        return e.status_code in RETRYABLE_STATUSES, wait, e.status_code >= 500
+    if isinstance(e, asyncio.TimeoutError):
+        # Our own overall deadline: too slow to try again, but the upstream is struggling
+        return False, None, True
+    return False, None, False
+
+async def _complete(user_message: str, tone: str, sections: tuple) -> str:
+    """
+    One JSON-mode completion for `sections`. Returns the raw text.
+    A generation slot is held per attempt only, never through a backoff or
+    Retry-After sleep. The whole thing is bounded by OPENAI_DEADLINE_SECONDS.
+    """
+    async def attempt():
+        await _acquire_slot()
+        try:
+            with in_flight("openai"):
+                return await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model="gpt-4o",
+                        messages=[
+                            {"role": "system", "content": get_system_prompt(tone, sections)},
+                            {"role": "user", "content": user_message}
+                        ],
+                        response_format={ "type": "json_object" }
+                    ),
+                    timeout=OPENAI_TIMEOUT_SECONDS
+                )
+        finally:
+            _generation_slots.release()
+
+    with stage("openai"):
+        response = await asyncio.wait_for(
+            retry_call("openai", attempt, _classify_openai_error),
+            timeout=OPENAI_DEADLINE_SECONDS
+        )
+    record_openai_usage(response.usage)
+    return response.choices[0].message.content
+
+async def _complete_sections(user_message: str, tone: str, sections: tuple) -> str:
+    """_complete(), failing unless the text is JSON holding every key in `sections`."""
+    text = await _complete(user_message, tone, sections)
+    missing = _missing_sections(text, sections)
+    if missing:
+        raise ValueError(f"completion is missing {', '.join(missing)}")
+    return text
+
+def _missing_sections(text: str, sections: tuple) -> list:
+    try:
+        data = json.loads(text)
+    except (json.JSONDecodeError, TypeError):
+        return list(sections)
+    if not isinstance(data, dict):
+        return list(sections)
+    return [k for k in sections if k not in data]
+
+async def generate_viral_content(context_data: any, tone: str = "Educator", sections=None):
+    """
+    Runs the gpt-4o generation without blocking the event loop.
+    sections picks a subset of SECTION_KEYS (default: all). With several sections
+    and OPENAI_PARALLEL_SECTIONS on, each one is its own completion sharing the
+    same packed context; they run side by side, so wall time is the slowest
+    section rather than the whole JSON. Each attempt at a completion takes one
+    of the OPENAI_MAX_CONCURRENCY slots; one that can't get a slot within
+    OPENAI_QUEUE_TIMEOUT_SECONDS, or doesn't finish within
+    OPENAI_DEADLINE_SECONDS, fails like any other completion.
+    A completion that fails or lacks its sections is run again, up to
+    OPENAI_SECTION_RETRIES more rounds. Returns None if any section is still
+    missing, so a partial result is never cached or charged; raises
+    CircuitOpenError instead when the remaining failures are all the open breaker.
+    """
     try:
         if not os.getenv("OPENAI_API_KEY"):
             print("Error: OPENAI_API_KEY not found in environment variables.")
             return None
 
-        # Format input based on type
-        if isinstance(context_data, dict):
-            # It's our new Deep Analysis format
-            full_user_message = f"""Here is the Deep Code Analysis of the Repository:
-            
-            README CONTENT (Context):
-            {context_data.get('readme_content', 'No README')}
-            
-            TECH STACK: {', '.join(context_data.get('tech_stack', []))}
-            
-            EVIDENCE CHECKLIST (Verified Features):
-            {json.dumps(context_data.get('evidence', {}), indent=2)}
-            
-            ENTRY POINT ({context_data.get('entry_point_name')}):
-            ```
-            {context_data.get('entry_point_content')}
-            ```
-            
-            FILE STRUCTURE (Top 200 files):
-            {', '.join(context_data.get('file_tree', []))}
-            """
+        sections = normalize_sections(sections)
+        full_user_message = build_user_message(context_data)
+
+        if OPENAI_PARALLEL_SECTIONS and len(sections) > 1:
+            pending = [(key,) for key in sections]
         else:
-            # Legacy string input
-            full_user_message = f"Here is the Repository README:\n{context_data}"
-        
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": get_system_prompt(tone)},
-                {"role": "user", "content": full_user_message}
-            ],
-            response_format={ "type": "json_object" }
-        )
-        
-        raw_text = response.choices[0].message.content
-        
-        return parse_ai_response(raw_text)
+            pending = [sections]
+
+        texts = []
+        for _ in range(1 + OPENAI_SECTION_RETRIES):
+            results = await asyncio.gather(
+                *(_complete_sections(full_user_message, tone, group) for group in pending),
+                return_exceptions=True
+            )
+            failed = []
+            for group, result in zip(pending, results):
+                if isinstance(result, BaseException):
+                    print(f"AI Generation Error ({', '.join(group)}): {result}")
+                    failed.append((group, result))
+                else:
+                    texts.append(result)
+            pending = [group for group, _ in failed]
+            if not pending:
+                return parse_ai_response(texts, sections)
+            # No point asking again while the breaker refuses every call
+            if all(isinstance(error, CircuitOpenError) for _, error in failed):
+                raise failed[0][1]
+        return None
+    except CircuitOpenError:
+        raise
     except Exception as e:
         print(f"AI Generation Error: {e}")
         return None
 
-def parse_ai_response(text: str):
+class SectionScanner:
     """
-    Parses the valid JSON output from the AI.
+    Incremental scanner over a streamed JSON object. feed() returns the
+    top-level (key, value) pairs whose values closed in the text fed so far,
+    so each section can be sent on as soon as the model finishes writing it.
+    """
+
+    def __init__(self):
+        self._buffer = []
+        self._member = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, text: str):
+        done = []
+        for ch in text:
+            self._buffer.append(ch)
+            if self._depth >= 1:
+                self._member.append(ch)
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+                continue
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self._close_member(done)
+            elif ch == "," and self._depth == 1:
+                self._close_member(done)
+        return done
+
+    def _close_member(self, done):
+        # The closing "," or "}" that ended the member was already appended
+        member = "".join(self._member[:-1]).strip()
+        self._member = []
+        if not member:
+            return
+        try:
+            done.extend(json.loads("{" + member + "}").items())
+        except json.JSONDecodeError:
+            pass
+
+    @property
+    def text(self) -> str:
+        return "".join(self._buffer)
+
+async def stream_viral_content(context_data: any, tone: str = "Educator", sections=None):
     """
-    import json
+    Streaming variant of generate_viral_content, sharing its concurrency limit.
+    Always a single completion (sections arrive in order as they close).
+    Yields ("section", (key, value)) as each top-level key of the model's JSON
+    completes, then ("done", content) with the same dict generate_viral_content
+    returns. Raises RuntimeError if the generation can't run or comes back
+    without every requested section.
+    """
+    if not os.getenv("OPENAI_API_KEY"):
+        raise RuntimeError("OPENAI_API_KEY not found in environment variables.")
+
+    sections = normalize_sections(sections)
+    full_user_message = build_user_message(context_data)
+
+    async def open_stream():
+        # The slot is taken per attempt and, once the stream is open, kept until it ends
+        await _acquire_slot()
+        try:
+            return await client.chat.completions.create(
+                model="gpt-4o",
+                messages=[
+                    {"role": "system", "content": get_system_prompt(tone, sections)},
+                    {"role": "user", "content": full_user_message}
+                ],
+                response_format={ "type": "json_object" },
+                stream=True,
+                # The final chunk then carries token usage
+                stream_options={"include_usage": True}
+            )
+        except BaseException:
+            _generation_slots.release()
+            raise
+
+    with stage("openai"):
+        # Only opening the stream is retried; once tokens flow a failure ends the generation
+        stream = await asyncio.wait_for(
+            retry_call("openai", open_stream, _classify_openai_error),
+            timeout=OPENAI_DEADLINE_SECONDS
+        )
     try:
-        data = json.loads(text)
-        return {
-            "twitter_thread": data.get("twitter_thread", ""),
-            "linkedin_post": data.get("linkedin_post", ""),
-            "blog_intro": data.get("blog_intro", ""),
-            "slides": data.get("slides", []),
-            "video_metadata": data.get("video_metadata", {
-                "hook_text": "Code to Content in Seconds.",
-                "code_snippet": "def analyze():\n  return 'viral'"
-            })
-        }
-    except json.JSONDecodeError:
-        print("Failed to parse JSON response")
-        return {
-            "twitter_thread": "",
-            "linkedin_post": "",
-            "blog_intro": "",
-            "slides": []
-        }
+        with in_flight("openai"), stage("openai"):
+            scanner = SectionScanner()
+            async for chunk in stream:
+                if chunk.usage:
+                    record_openai_usage(chunk.usage)
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if not delta:
+                    continue
+                for section in scanner.feed(delta):
+                    yield "section", section
+    finally:
+        _generation_slots.release()
+
+    # A cut-off or incomplete completion is a failure, not a result with default sections
+    missing = _missing_sections(scanner.text, sections)
+    if missing:
+        raise RuntimeError(f"completion is missing {', '.join(missing)}")
+    yield "done", parse_ai_response(scanner.text, sections)
+
+SECTION_DEFAULTS = {
+    "twitter_thread": "",
+    "linkedin_post": "",
+    "blog_intro": "",
+    "slides": [],
+    "video_metadata": {
+        "hook_text": "Code to Content in Seconds.",
+        "code_snippet": "def analyze():\n  return 'viral'"
+    }
+}
+
+def parse_ai_response(text, sections=None):
+    """
+    Parses the valid JSON output from the AI.
+    text is one completion or a list of them (one per section group), which
+    are merged. Only the requested sections are returned, in canonical order.
+    """
+    sections = normalize_sections(sections)
+    texts = [text] if isinstance(text, str) else list(text)
+
+    data = {}
+    parsed_any = False
+    for raw in texts:
+        try:
+            data.update(json.loads(raw))
+            parsed_any = True
+        except (json.JSONDecodeError, TypeError):
+            print("Failed to parse JSON response")
+
+    if not parsed_any:
+        return {k: copy.deepcopy(SECTION_DEFAULTS[k]) for k in sections if k != "video_metadata"}
+    return {k: data.get(k, copy.deepcopy(SECTION_DEFAULTS[k])) for k in sections}
@@ -0,0 +1,137 @@
+import os
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Token-aware packing of repo context into the user message.
+# Sections are measured in real gpt-4o tokens (tiktoken) and filled in priority
+# order up to their caps; whatever a section leaves unused flows to the next
+# truncated one. Without tiktoken installed, tokens are estimated at ~4 chars each.
+PROMPT_CONTEXT_TOKENS = int(os.getenv("PROMPT_CONTEXT_TOKENS", "6000"))
+
+# Per-section caps, in priority order (evidence and stack are small and always kept)
+SECTION_CAPS = {
+    "entry_point": int(os.getenv("PROMPT_ENTRY_POINT_TOKENS", "700")),
+    "readme": int(os.getenv("PROMPT_README_TOKENS", "2500")),
+    "file_tree": int(os.getenv("PROMPT_FILE_TREE_TOKENS", "1500")),
+}
+
+CHARS_PER_TOKEN = 4
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")  # gpt-4o
+except Exception:
+    _encoding = None
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cuts text down to max_tokens, marking the cut."""
+    if max_tokens <= 0 or not text:
+        return ""
+    if count_tokens(text) <= max_tokens:
+        return text
+    if _encoding:
+        tokens = _encoding.encode(text, disallowed_special=())
+        return _encoding.decode(tokens[:max_tokens]) + "\n[...truncated]"
+    return text[:max_tokens * CHARS_PER_TOKEN] + "\n[...truncated]"
+
+
+def compact_json(data) -> str:
+    """Evidence as one-line JSON with empty fields dropped."""
+    if isinstance(data, dict):
+        data = {k: v for k, v in data.items() if v not in (None, "", [], {})}
+    return json.dumps(data, separators=(",", ":"), ensure_ascii=False)
+
+
+def _render_tree(paths, depth: int) -> str:
+    # Anything deeper than `depth` is folded into its ancestor: "src/components/ (42 files)"
+    counts = {}
+    for path in paths:
+        parts = path.split("/")
+        if len(parts) > depth:
+            folder = "/".join(parts[:depth]) + "/"
+            counts[folder] = counts.get(folder, 0) + 1
+
+    lines = []
+    emitted = set()
+    for path in paths:
+        parts = path.split("/")
+        if len(parts) <= depth:
+            lines.append(path)
+            continue
+        folder = "/".join(parts[:depth]) + "/"
+        if folder not in emitted:
+            emitted.add(folder)
+            lines.append(f"{folder} ({counts[folder]} files)")
+    return "\n".join(lines)
+
+
+def compress_tree(paths, max_tokens: int, total: int = None) -> str:
+    """
+    Renders the file tree within max_tokens: full paths if they fit, otherwise
+    directories are collapsed into counts one level at a time, deepest first.
+    """
+    if not paths or max_tokens <= 0:
+        return ""
+    header = ""
+    if total and total > len(paths):
+        header = f"(first {len(paths)} of {total} files)\n"
+
+    deepest = max(p.count("/") for p in paths) + 1
+    for depth in range(deepest, 0, -1):
+        rendered = header + _render_tree(paths, depth)
+        if count_tokens(rendered) <= max_tokens:
+            return rendered
+    return truncate_to_tokens(header + _render_tree(paths, 1), max_tokens)
+
+
+def allocate(sizes: dict, budget: int) -> dict:
+    """
+    Splits `budget` tokens over sections (sizes in tokens, SECTION_CAPS order).
+    Each section first gets min(size, cap); leftover then goes, in priority
+    order, to the sections the caps cut short.
+    """
+    grants = {}
+    remaining = budget
+    for name, cap in SECTION_CAPS.items():
+        grants[name] = min(sizes.get(name, 0), cap, max(remaining, 0))
+        remaining -= grants[name]
+    for name in SECTION_CAPS:
+        if remaining <= 0:
+            break
+        extra = min(sizes.get(name, 0) - grants[name], remaining)
+        if extra > 0:
+            grants[name] += extra
+            remaining -= extra
+    return grants
+
+
+def pack_sections(readme: str, entry_point: str, file_tree, fixed_tokens: int = 0, total_files: int = None) -> dict:
+    """
+    Fits readme, entry point and file tree into PROMPT_CONTEXT_TOKENS minus the
+    fixed_tokens already spent (stack, evidence, headings).
+    Returns {"readme", "entry_point", "file_tree"} as prompt-ready text.
+    """
+    file_tree = list(file_tree or [])
+    # The tree's "size" is its uncollapsed rendering; compress_tree folds it to whatever it's granted
+    sizes = {
+        "entry_point": count_tokens(entry_point),
+        "readme": count_tokens(readme),
+        "file_tree": count_tokens("\n".join(file_tree)),
+    }
+    grants = allocate(sizes, PROMPT_CONTEXT_TOKENS - fixed_tokens)
+    return {
+        "readme": truncate_to_tokens(readme, grants["readme"]),
+        "entry_point": truncate_to_tokens(entry_point, grants["entry_point"]),
+        "file_tree": compress_tree(file_tree, grants["file_tree"], total_files),
+    }
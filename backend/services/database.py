@@ -1,4 +1,4 @@
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient
 import os
 from dotenv import load_dotenv
 
@@ -10,5 +10,39 @@ DB_NAME = os.getenv("MONGODB_DB_NAME", "repo2viral")
 if not MONGODB_URI:
     raise ValueError("MONGODB_URI not found in .env")
 
-client = MongoClient(MONGODB_URI)
+# Connection pool sizing (per process)
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "100"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "0"))
+MONGODB_MAX_IDLE_TIME_MS = int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "60000"))
+MONGODB_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGODB_WAIT_QUEUE_TIMEOUT_MS", "10000"))
+MONGODB_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+
+POOL_OPTIONS = {
+    "maxPoolSize": MONGODB_MAX_POOL_SIZE,
+    "minPoolSize": MONGODB_MIN_POOL_SIZE,
+    "maxIdleTimeMS": MONGODB_MAX_IDLE_TIME_MS,
+    "waitQueueTimeoutMS": MONGODB_WAIT_QUEUE_TIMEOUT_MS,
+    "serverSelectionTimeoutMS": MONGODB_SERVER_SELECTION_TIMEOUT_MS
+}
+
+# Async client used by every request handler; connects lazily on first use
+client = AsyncMongoClient(MONGODB_URI, **POOL_OPTIONS)
 db = client[DB_NAME]
+
+_sync_client = None
+
+
+async def close_database():
+    """Closes the async pool. Called once from the app lifespan on shutdown."""
+    await client.close()
+
+
+def get_sync_db():
+    """
+    Blocking pymongo handle for one-off admin scripts (toggle_pro.py etc.).
+    Never call this from a request handler.
+    """
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = MongoClient(MONGODB_URI, **POOL_OPTIONS)
+    return _sync_client[DB_NAME]
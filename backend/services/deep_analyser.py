@@ -1,10 +1,102 @@
-import httpx
+import os
 import re
 import base64
+import asyncio
+from services.github_loader import parse_repo_url
+from services.github_cache import cached_get
+from services.github_client import get_github_client, github_headers, GITHUB_API_URL
+from services.repo_archive import load_repo_archive, ArchiveTooLarge
+from services.repo_index import Detector, DetectorRegistry, FileTreeIndex
+from services.tree_reader import read_tree, TreeUnavailable
+from services.rate_budget import credential_key, remaining
+from services.metrics import stage
 
-async def analyze_repo_structure(repo_url: str, token: str):
+# Upper bound on concurrent contents-API calls per analysis
+DEEP_FETCH_CONCURRENCY = int(os.getenv("DEEP_FETCH_CONCURRENCY", "8"))
+
+# "api": git tree + one contents call per file. "archive": one tarball download.
+DEEP_ANALYSIS_MODE = os.getenv("DEEP_ANALYSIS_MODE", "api")
+ANALYSIS_MODES = ("api", "archive")
+# With fewer API calls than this left on the user's token, an unspecified mode
+# becomes "archive" (one tarball request instead of a contents call per file)
+DEEP_ARCHIVE_BUDGET_THRESHOLD = int(os.getenv("DEEP_ARCHIVE_BUDGET_THRESHOLD", "100"))
+
+# The first 1000 paths are kept for the prompt (the context packer folds them into
+# directory counts to fit its token budget); each detector keeps up to
+# DEEP_TREE_BUCKET_LIMIT matches while counts stay exact. Paths no detector wants
+# are only counted, so huge trees index in bounded memory.
+DEEP_TREE_KEEP_PATHS = 1000
+DEEP_TREE_BUCKET_LIMIT = int(os.getenv("DEEP_TREE_BUCKET_LIMIT", "50"))
+
+# Coarse ceilings on fetched text; the real limit is the packer's token budget
+DEEP_README_MAX_CHARS = 32000
+DEEP_ENTRY_POINT_MAX_CHARS = 8000
+
+ENTRY_CANDIDATES = ["main.py", "app.py", "index.js", "app.js", "index.ts", "src/index.js", "src/main.rs", "main.go"]
+
+# Everything the analyser looks for in the file tree. Adding a detector here
+# does not add another scan: they are all resolved against one FileTreeIndex.
+DETECTORS = DetectorRegistry()
+
+# Stack (label order = output order)
+DETECTORS.register(Detector("python", "stack", "Python", basename_suffixes=["requirements.txt", "pyproject.toml"]))
+DETECTORS.register(Detector("node", "stack", "JavaScript/Node.js", basename_suffixes=["package.json"]))
+DETECTORS.register(Detector("nextjs", "stack", "Next.js", basename_prefixes=["next.config"], requires="node"))
+DETECTORS.register(Detector("go", "stack", "Go", basename_suffixes=["go.mod"]))
+DETECTORS.register(Detector("rust", "stack", "Rust", basename_suffixes=["cargo.toml"]))
+
+# Structure evidence
+DETECTORS.register(Detector("docker_compose", "feature", "Containerized / Easy Deploy [docker-compose.yml]", basename_prefixes=["docker-compose"]))
+DETECTORS.register(Detector("workflows", "feature", "CI/CD Pipeline Active [.github/workflows]", dirs=[".github/workflows"]))
+DETECTORS.register(Detector("tests", "feature", "Includes {count} Test Suites [tests/]", contains=["test"], extensions=[".py", ".js", ".ts"]))
+
+# Files whose contents get scanned
+DETECTORS.register(Detector("readme", "file", basenames=["readme.md"]))
+DETECTORS.register(Detector("requirements", "file", basename_suffixes=["requirements.txt"]))
+DETECTORS.register(Detector("models", "file", basename_suffixes=["models.py", "schema.prisma"]))
+
+# Entry point candidates
+DETECTORS.register(Detector("entry_point", "entry", paths=ENTRY_CANDIDATES))
+DETECTORS.register(Detector("entry_point_fallback", "entry", contains=["main", "app"]))
+
+async def fetch_files(fetch_file, paths):
+    """
+    Fetches several files concurrently through fetch_file(path).
+    Duplicate and empty paths are skipped. A failing file maps to None
+    instead of aborting the rest of the fan-out.
+    Returns {path: content_or_None}.
+    """
+    unique_paths = list(dict.fromkeys(p for p in paths if p))
+    semaphore = asyncio.Semaphore(DEEP_FETCH_CONCURRENCY)
+
+    async def bounded(path):
+        async with semaphore:
+            return await fetch_file(path)
+
+    results = await asyncio.gather(*(bounded(p) for p in unique_paths), return_exceptions=True)
+    contents = {}
+    for path, result in zip(unique_paths, results):
+        if isinstance(result, BaseException):
+            print(f"Skipping {path}: {result}")
+            result = None
+        contents[path] = result
+    return contents
+
+def _emit(on_stage, stage: str, data: dict):
+    # Progress reporting must never break an analysis
+    if on_stage:
+        try:
+            on_stage(stage, data)
+        except Exception as e:
+            print(f"Stage callback failed for {stage}: {e}")
+
+async def analyze_repo_structure(repo_url: str, token: str, mode: str = None, on_stage=None):
     """
     Deep scan of repository using user's GitHub token.
+    mode picks how files are read ("api" or "archive", default DEEP_ANALYSIS_MODE).
+    Archive mode falls back to the per-file API if the tarball is over the size cap.
+    on_stage(stage, data), if given, is called as each stage finishes:
+    "repo_info", "tree", "evidence", "entry_point".
     Returns:
     {
         "file_tree": ["src/main.py", "package.json", ...],
@@ -15,153 +107,172 @@ async def analyze_repo_structure(repo_url: str, token: str):
     }
     """
     # 1. Parse URL
-    match = re.search(r"github\.com/([^/]+)/([^/]+)", repo_url)
-    if not match:
+    parsed = parse_repo_url(repo_url)
+    if not parsed:
         raise ValueError("Invalid GitHub URL")
     
-    owner = match.group(1)
-    repo = match.group(2)
+    owner, repo = parsed
     
-    headers = {
-        "Authorization": f"Bearer {token}",
-        "Accept": "application/vnd.github.v3+json"
-    }
+    headers = github_headers(token)
     
-    async with httpx.AsyncClient() as client:
-        # 1. Fetch Root Content (File Tree)
-        repo_resp = await client.get(f"https://api.github.com/repos/{owner}/{repo}", headers=headers)
-        if repo_resp.status_code == 401 or repo_resp.status_code == 403:
-             raise PermissionError("GitHub Token Expired or Invalid")
-        if repo_resp.status_code != 200:
-            raise Exception(f"Failed to fetch repo info: {repo_resp.text}")
-            
-        repo_info = repo_resp.json()
-        default_branch = repo_info.get("default_branch", "main")
-        repo_stats = {
-            "stars": repo_info.get("stargazers_count", 0),
-            "forks": repo_info.get("forks_count", 0),
-            "avatar": repo_info.get("owner", {}).get("avatar_url", ""),
-            "name": repo_info.get("name", repo),
-            "description": repo_info.get("description", "")
-        }
-        
-        # Get Tree
-        tree_resp = await client.get(f"https://api.github.com/repos/{owner}/{repo}/git/trees/{default_branch}?recursive=1", headers=headers)
-        if tree_resp.status_code != 200:
-             raise Exception("Failed to fetch file tree")
-             
-        tree_data = tree_resp.json()
-        all_files = [item["path"] for item in tree_data.get("tree", []) if item["type"] == "blob"]
+    client = get_github_client()
+    # 1. Fetch Root Content (File Tree)
+    with stage("github_repo_info"):
+        repo_resp = await cached_get(client, f"{GITHUB_API_URL}/repos/{owner}/{repo}", headers)
+    if repo_resp.status_code == 401 or repo_resp.status_code == 403:
+         raise PermissionError("GitHub Token Expired or Invalid")
+    if repo_resp.status_code != 200:
+        raise Exception(f"Failed to fetch repo info: {repo_resp.text}")
         
-        # Helper to fetch content
-        async def fetch_file(path):
-            try:
-                url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path}"
-                resp = await client.get(url, headers=headers)
-                if resp.status_code == 200:
-                    data = resp.json()
-                    if data.get("encoding") == "base64":
-                        return base64.b64decode(data["content"]).decode("utf-8")
-            except:
+    repo_info = repo_resp.json()
+    default_branch = repo_info.get("default_branch", "main")
+    repo_stats = {
+        "stars": repo_info.get("stargazers_count", 0),
+        "forks": repo_info.get("forks_count", 0),
+        "avatar": repo_info.get("owner", {}).get("avatar_url", ""),
+        "name": repo_info.get("name", repo),
+        "description": repo_info.get("description", "")
+    }
+    _emit(on_stage, "repo_info", repo_stats)
+    
+    if not mode:
+        left = remaining(credential_key(token))
+        if left is not None and left < DEEP_ARCHIVE_BUDGET_THRESHOLD:
+            print(f"{owner}/{repo}: {left} GitHub calls left on this token, using archive mode")
+            mode = "archive"
+    mode = mode or DEEP_ANALYSIS_MODE
+    if mode not in ANALYSIS_MODES:
+        raise ValueError(f"Unknown analysis mode: {mode}")
+
+    if mode == "archive":
+        try:
+            with stage("github_archive"):
+                archive = await load_repo_archive(client, owner, repo, default_branch, headers)
+            # Off the event loop: a large archive is hundreds of thousands of paths
+            index = await asyncio.to_thread(
+                FileTreeIndex.build, archive.paths, DETECTORS, DEEP_TREE_KEEP_PATHS, DEEP_TREE_BUCKET_LIMIT
+            )
+            _emit(on_stage, "tree", {"mode": "archive", "file_count": index.count, "truncated": False})
+            return await _analyze_files(index, archive.read_many, repo_stats, on_stage)
+        except ArchiveTooLarge as e:
+            print(f"{owner}/{repo}: {e}. Falling back to per-file API.")
+
+    # Get Tree: streamed into the index, which keeps only the first paths and capped
+    # detector hits. The ETag cache may still buffer one listing per request in
+    # flight, up to GITHUB_CACHE_MAX_BODY_BYTES, to store it.
+    try:
+        with stage("github_tree"):
+            index, truncated = await read_tree(
+                client, owner, repo, default_branch, headers,
+                lambda: FileTreeIndex(DETECTORS, DEEP_TREE_KEEP_PATHS, DEEP_TREE_BUCKET_LIMIT)
+            )
+    except TreeUnavailable:
+         raise Exception("Failed to fetch file tree")
+    _emit(on_stage, "tree", {"mode": "api", "file_count": index.count, "truncated": truncated})
+    
+    # Helper to fetch content
+    async def fetch_file(path):
+        try:
+            url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/contents/{path}"
+            resp = await cached_get(client, url, headers)
+            if resp.status_code != 200:
+                print(f"Skipping {path}: contents API returned {resp.status_code}")
                 return None
-            return None
-
-        # 1.5 Fetch README (Critical for Context)
-        readme_file = next((f for f in all_files if f.lower() == "readme.md"), None)
-        readme_content = "No README found."
-        if readme_file:
-            content = await fetch_file(readme_file)
-            if content:
-                readme_content = content[:8000] # Cap at 8k chars to fit in context
-
-        # 2. Detect Stack
-        stack = []
-        if any(f.endswith("requirements.txt") or f.endswith("pyproject.toml") for f in all_files):
-            stack.append("Python")
-        if any(f.endswith("package.json") for f in all_files):
-            stack.append("JavaScript/Node.js")
-            if any("next" in f for f in all_files):
-                stack.append("Next.js")
-        if any(f.endswith("go.mod") for f in all_files):
-            stack.append("Go")
-        if any(f.endswith("Cargo.toml") for f in all_files):
-            stack.append("Rust")
-
-        # 3. EVIDENCE COLLECTION (The "No-Bluff" Logic)
-        evidence = {
-            "features": [],
-            "test_count": 0,
-            "entities": [],
-            "config_evidence": [] 
-        }
-
-        # Structure Checks
-        if any("docker-compose" in f for f in all_files):
-            evidence["features"].append("Containerized / Easy Deploy [docker-compose.yml]")
-        
-        if any(".github/workflows" in f for f in all_files):
-            evidence["features"].append("CI/CD Pipeline Active [.github/workflows]")
-        
-        test_files = [f for f in all_files if "test" in f.lower() and (f.endswith(".py") or f.endswith(".js") or f.endswith(".ts"))]
-        evidence["test_count"] = len(test_files)
-        if len(test_files) > 0:
-            evidence["features"].append(f"Includes {len(test_files)} Test Suites [tests/]")
-
-        # Content Scans (Fetch specific files)
-        # Check requirements.txt for Stripe/Integrations
-        req_file = next((f for f in all_files if f.endswith("requirements.txt")), None)
-        if req_file:
-            content = await fetch_file(req_file)
-            if content:
-                if "stripe" in content.lower():
-                    evidence["features"].append("Payment Integration (Stripe) [requirements.txt]")
-                if "fastapi" in content.lower():
-                    evidence["features"].append("FastAPI High Performance [requirements.txt]")
-                if "django" in content.lower():
-                    evidence["features"].append("Django Core [requirements.txt]")
-
-        # Check Models for Data Entities
-        # Simple regex heuristic to find class names in models.py
-        model_file = next((f for f in all_files if "models.py" in f or "schema.prisma" in f), None)
-        if model_file:
-            content = await fetch_file(model_file)
-            if content:
-                # Python Class Regex
-                classes = re.findall(r"class\s+(\w+)\(", content)
-                # Prisma Model Regex
-                prisma_models = re.findall(r"model\s+(\w+)\s+{", content)
-                
-                found_entities = classes[:5] + prisma_models[:5] # Top 5
-                if found_entities:
-                    evidence["entities"] = found_entities
-                    evidence["features"].append(f"Data Models: {', '.join(found_entities)} [{model_file}]")
-        
-        # 4. Find Entry Point & Read
-        entry_candidates = ["main.py", "app.py", "index.js", "app.js", "index.ts", "src/index.js", "src/main.rs", "main.go"]
-        selected_entry = None
-        for candidate in entry_candidates:
-            if candidate in all_files:
-                selected_entry = candidate
-                break
+            data = resp.json()
+            if data.get("encoding") == "base64":
+                return base64.b64decode(data["content"]).decode("utf-8", errors="replace")
+        except Exception as e:
+            print(f"Skipping {path}: {e}")
+        return None
+
+    async def load_contents(paths):
+        return await fetch_files(fetch_file, paths)
+
+    return await _analyze_files(index, load_contents, repo_stats, on_stage)
+
+
+async def _analyze_files(index, load_contents, repo_stats, on_stage=None):
+    """
+    Stack detection, evidence collection and entry point selection.
+    Shared by both modes: index is a FileTreeIndex built in one pass over the
+    tree and load_contents(paths) returns {path: text_or_None}.
+    """
+    # Detectors were matched as the tree was indexed
+    found = DETECTORS.resolve(index)
+
+    # Every path we need is known once the tree is in hand, so pick them all up front
+    readme_file = next((f for f in found["readme"] if "/" not in f), None)
+    req_file = next(iter(found["requirements"]), None)
+    # Simple regex heuristic to find class names in models.py
+    model_file = next(iter(found["models"]), None)
+
+    # Find Entry Point (candidate order wins, then first main/app-ish path)
+    selected_entry = next((c for c in ENTRY_CANDIDATES if c in found["entry_point"]), None)
+    if not selected_entry:
+        selected_entry = next(iter(found["entry_point_fallback"]), None)
+
+    # Fetch them all concurrently: wall time is ~one round trip instead of one per file
+    with stage("github_files"):
+        contents = await load_contents([readme_file, req_file, model_file, selected_entry])
+
+    # 1.5 README (Critical for Context)
+    readme_content = "No README found."
+    if contents.get(readme_file):
+        readme_content = contents[readme_file][:DEEP_README_MAX_CHARS]
+
+    # 2. Detect Stack
+    stack = [d.label for d in DETECTORS.of_kind("stack") if found[d.name]]
+
+    # 3. EVIDENCE COLLECTION (The "No-Bluff" Logic)
+    evidence = {
+        "features": [],
+        "test_count": found["tests"].total,
+        "entities": [],
+        "config_evidence": [] 
+    }
+
+    # Structure Checks
+    for d in DETECTORS.of_kind("feature"):
+        matches = found[d.name]
+        if matches:
+            evidence["features"].append(d.label.format(count=matches.total, first=matches[0]))
+
+    # Content Scans
+    # Check requirements.txt for Stripe/Integrations
+    content = contents.get(req_file)
+    if content:
+        if "stripe" in content.lower():
+            evidence["features"].append("Payment Integration (Stripe) [requirements.txt]")
+        if "fastapi" in content.lower():
+            evidence["features"].append("FastAPI High Performance [requirements.txt]")
+        if "django" in content.lower():
+            evidence["features"].append("Django Core [requirements.txt]")
+
+    # Check Models for Data Entities
+    content = contents.get(model_file)
+    if content:
+        # Python Class Regex
+        classes = re.findall(r"class\s+(\w+)\(", content)
+        # Prisma Model Regex
+        prisma_models = re.findall(r"model\s+(\w+)\s+{", content)
         
-        # Fallback
-        if not selected_entry:
-            for f in all_files:
-                 if "main" in f.lower() or "app" in f.lower():
-                     selected_entry = f
-                     break
-                     
-        entry_content = ""
-        if selected_entry:
-            entry_content = await fetch_file(selected_entry) or ""
-            entry_content = entry_content[:1500] # Cap it
-
-        return {
-            "file_tree": all_files[:200], 
-            "tech_stack": stack,
-            "entry_point_name": selected_entry,
-            "entry_point_content": entry_content,
-            "readme_content": readme_content,
-            "evidence": evidence,
-            "repo_stats": repo_stats
-        }
+        found_entities = classes[:5] + prisma_models[:5] # Top 5
+        if found_entities:
+            evidence["entities"] = found_entities
+            evidence["features"].append(f"Data Models: {', '.join(found_entities)} [{model_file}]")
+    _emit(on_stage, "evidence", {"tech_stack": stack, "evidence": evidence})
+    
+    # 4. Entry Point
+    entry_content = (contents.get(selected_entry) or "")[:DEEP_ENTRY_POINT_MAX_CHARS]
+    _emit(on_stage, "entry_point", {"name": selected_entry})
+
+    return {
+        "file_tree": index.paths,
+        "file_count": index.count, 
+        "tech_stack": stack,
+        "entry_point_name": selected_entry,
+        "entry_point_content": entry_content,
+        "readme_content": readme_content,
+        "evidence": evidence,
+        "repo_stats": repo_stats
+    }
@@ -0,0 +1,133 @@
+import os
+import copy
+import hashlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+
+from services.database import db
+from services.metrics import record_cache
+from services.github_loader import parse_repo_url, fetch_head_sha
+from services.ai_generator import get_system_prompt, normalize_sections, normalize_tone, SECTION_KEYS
+
+load_dotenv()
+
+# Two tiers: a per-process LRU answers repeat hits in microseconds, Mongo shares
+# results between workers and restarts. Mongo drops expired rows via a TTL index
+# on expires_at (created at startup by services/indexes.py).
+GENERATION_CACHE_TTL_SECONDS = int(os.getenv("GENERATION_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+GENERATION_CACHE_LRU_SIZE = int(os.getenv("GENERATION_CACHE_LRU_SIZE", "256"))
+
+CACHE_COLLECTION = "generation_cache"
+
+_lru = OrderedDict()
+
+
+def normalize_repo(url: str):
+    """Returns "owner/repo" in lowercase, or None for non-GitHub URLs."""
+    parsed = parse_repo_url(url)
+    if not parsed:
+        return None
+    owner, repo = parsed
+    return f"{owner}/{repo}".lower()
+
+
+def prompt_version(tone: str, sections: tuple = SECTION_KEYS) -> str:
+    """Short hash of the system prompt, so editing the prompt invalidates old results."""
+    return hashlib.sha256(get_system_prompt(tone, sections).encode("utf-8")).hexdigest()[:12]
+
+
+def make_cache_key(repo: str, commit_sha: str, tone: str, endpoint: str, sections: tuple = SECTION_KEYS) -> str:
+    # Unsupported tones get the default prompt, so they share its results too
+    tone = normalize_tone(tone)
+    parts = [repo, commit_sha, tone, endpoint, prompt_version(tone, sections)]
+    # Full results keep their existing keys; subsets are cached separately
+    if sections != SECTION_KEYS:
+        parts.append(",".join(sections))
+    raw = "|".join(parts)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+async def build_cache_key(repo_url: str, tone: str, endpoint: str, token: str = None, sections=None):
+    """
+    Resolves the repo's current HEAD and returns the cache key for this request.
+    Resolving HEAD with the caller's own token doubles as an access check, so a
+    cached private-repo result is only ever served to someone who can read it.
+    Returns None when the repo or its HEAD can't be resolved (caching is skipped).
+    """
+    repo = normalize_repo(repo_url)
+    if not repo:
+        return None
+    owner, name = repo.split("/", 1)
+    commit_sha = await fetch_head_sha(owner, name, token)
+    if not commit_sha:
+        return None
+    return make_cache_key(repo, commit_sha, tone, endpoint, normalize_sections(sections))
+
+
+def _lru_get(key: str):
+    entry = _lru.get(key)
+    if not entry:
+        return None
+    if entry["expires_at"] <= datetime.utcnow():
+        _lru.pop(key, None)
+        return None
+    _lru.move_to_end(key)
+    return entry["content"]
+
+
+def _lru_put(key: str, content: dict, expires_at: datetime):
+    _lru[key] = {"content": content, "expires_at": expires_at}
+    _lru.move_to_end(key)
+    while len(_lru) > GENERATION_CACHE_LRU_SIZE:
+        _lru.popitem(last=False)
+
+
+async def get_cached_content(key: str):
+    """Returns a copy of the cached generation for key, or None on a miss."""
+    content = _lru_get(key)
+    if content is not None:
+        record_cache("generation_lru", True)
+        return copy.deepcopy(content)
+    record_cache("generation_lru", False)
+
+    try:
+        doc = await db[CACHE_COLLECTION].find_one({"_id": key})
+    except Exception as e:
+        print(f"Generation cache lookup failed: {e}")
+        return None
+
+    if not doc or doc["expires_at"] <= datetime.utcnow():
+        record_cache("generation", False)
+        return None
+    record_cache("generation", True)
+
+    _lru_put(key, doc["content"], doc["expires_at"])
+    return copy.deepcopy(doc["content"])
+
+
+async def store_cached_content(key: str, content: dict, repo_url: str, tone: str, endpoint: str, sections=None):
+    """Writes a generation to both tiers. Failures are logged, never raised."""
+    sections = normalize_sections(sections)
+    expires_at = datetime.utcnow() + timedelta(seconds=GENERATION_CACHE_TTL_SECONDS)
+    content = copy.deepcopy(content)
+    _lru_put(key, content, expires_at)
+
+    try:
+        await db[CACHE_COLLECTION].replace_one(
+            {"_id": key},
+            {
+                "_id": key,
+                "repo": normalize_repo(repo_url),
+                "tone": tone,
+                "endpoint": endpoint,
+                "sections": list(sections),
+                "prompt_version": prompt_version(tone, sections),
+                "content": content,
+                "created_at": datetime.utcnow(),
+                "expires_at": expires_at
+            },
+            upsert=True
+        )
+    except Exception as e:
+        print(f"Generation cache write failed: {e}")
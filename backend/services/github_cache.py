@@ -0,0 +1,197 @@
+import os
+import hashlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+import httpx
+from dotenv import load_dotenv
+
+from services.database import db
+from services.metrics import record_cache
+
+load_dotenv()
+
+# Conditional-request cache for GitHub API responses.
+# Bodies are stored with their ETag; repeat requests send If-None-Match and a
+# 304 (which does not count against the rate limit) is answered from the cache.
+# An in-process LRU sits in front of Mongo so restarts keep the ETags. It is
+# bounded by entries and by total body bytes, and only holds small bodies:
+# large ones (recursive trees) live in Mongo only and are revalidated from there.
+GITHUB_CACHE_ENABLED = os.getenv("GITHUB_CACHE_ENABLED", "true").lower() == "true"
+GITHUB_CACHE_LRU_SIZE = int(os.getenv("GITHUB_CACHE_LRU_SIZE", "512"))
+GITHUB_CACHE_LRU_BYTES = int(os.getenv("GITHUB_CACHE_LRU_BYTES", str(32 * 1024 * 1024)))
+GITHUB_CACHE_LRU_MAX_ENTRY_BYTES = int(os.getenv("GITHUB_CACHE_LRU_MAX_ENTRY_BYTES", str(256 * 1024)))
+GITHUB_CACHE_MAX_BODY_BYTES = int(os.getenv("GITHUB_CACHE_MAX_BODY_BYTES", str(8 * 1024 * 1024)))
+# Entries not fetched or revalidated for this long are dropped by a TTL index on updated_at
+GITHUB_CACHE_RETENTION_SECONDS = int(os.getenv("GITHUB_CACHE_RETENTION_SECONDS", str(30 * 24 * 3600)))
+# A 304 bumps updated_at at most this often per entry (one small write, not one per hit)
+GITHUB_CACHE_TOUCH_SECONDS = int(os.getenv("GITHUB_CACHE_TOUCH_SECONDS", str(24 * 3600)))
+
+CACHE_COLLECTION = "github_http_cache"
+
+_lru = OrderedDict()
+_lru_bytes = 0
+
+
+def _cache_key(url: str, headers: dict) -> str:
+    # Scope entries by Accept and by token so one user's private-repo response
+    # is never replayed to another user.
+    accept = headers.get("Accept", "")
+    auth = hashlib.sha256(headers.get("Authorization", "").encode("utf-8")).hexdigest()[:16]
+    return hashlib.sha256(f"{url}|{accept}|{auth}".encode("utf-8")).hexdigest()
+
+
+def _lru_put(key: str, entry: dict):
+    global _lru_bytes
+    previous = _lru.pop(key, None)
+    if previous:
+        _lru_bytes -= len(previous["body"])
+    if len(entry["body"]) > GITHUB_CACHE_LRU_MAX_ENTRY_BYTES:
+        return
+    _lru[key] = entry
+    _lru_bytes += len(entry["body"])
+    while len(_lru) > GITHUB_CACHE_LRU_SIZE or _lru_bytes > GITHUB_CACHE_LRU_BYTES:
+        _, evicted = _lru.popitem(last=False)
+        _lru_bytes -= len(evicted["body"])
+
+
+async def _load_entry(key: str):
+    entry = _lru.get(key)
+    if entry:
+        _lru.move_to_end(key)
+        return entry
+    try:
+        doc = await db[CACHE_COLLECTION].find_one({"_id": key})
+    except Exception as e:
+        print(f"GitHub cache lookup failed: {e}")
+        return None
+    if not doc:
+        return None
+    entry = {
+        "etag": doc["etag"],
+        "body": bytes(doc["body"]),
+        "content_type": doc.get("content_type", ""),
+        "updated_at": doc.get("updated_at")
+    }
+    _lru_put(key, entry)
+    return entry
+
+
+async def _save_entry(key: str, url: str, entry: dict):
+    entry["updated_at"] = datetime.utcnow()
+    _lru_put(key, entry)
+    try:
+        await db[CACHE_COLLECTION].replace_one(
+            {"_id": key},
+            {"_id": key, "url": url, **entry},
+            upsert=True
+        )
+    except Exception as e:
+        print(f"GitHub cache write failed: {e}")
+
+
+async def _touch_entry(key: str, entry: dict):
+    """
+    A 304 proves the entry is still current: push its updated_at forward so the
+    TTL index only drops entries nobody revalidates. Throttled per entry.
+    """
+    now = datetime.utcnow()
+    updated_at = entry.get("updated_at")
+    if updated_at and now - updated_at < timedelta(seconds=GITHUB_CACHE_TOUCH_SECONDS):
+        return
+    entry["updated_at"] = now
+    try:
+        await db[CACHE_COLLECTION].update_one({"_id": key}, {"$set": {"updated_at": now}})
+    except Exception as e:
+        print(f"GitHub cache touch failed: {e}")
+
+
+async def cached_get(client: httpx.AsyncClient, url: str, headers: dict = None) -> httpx.Response:
+    """
+    Drop-in for client.get(url, headers=headers) against the GitHub API.
+    A 304 is turned back into a 200 carrying the cached body, so callers keep
+    using status_code / json() / text unchanged.
+    """
+    headers = dict(headers or {})
+    if not GITHUB_CACHE_ENABLED:
+        return await client.get(url, headers=headers)
+
+    key = _cache_key(url, headers)
+    entry = await _load_entry(key)
+    if entry:
+        headers["If-None-Match"] = entry["etag"]
+
+    resp = await client.get(url, headers=headers)
+
+    record_cache("github_http", resp.status_code == 304 and entry is not None)
+    if resp.status_code == 304 and entry:
+        await _touch_entry(key, entry)
+        return httpx.Response(
+            200,
+            content=entry["body"],
+            headers={"Content-Type": entry["content_type"], "ETag": entry["etag"], "X-Cache": "revalidated"},
+            request=resp.request
+        )
+
+    etag = resp.headers.get("etag")
+    if resp.status_code == 200 and etag and len(resp.content) <= GITHUB_CACHE_MAX_BODY_BYTES:
+        await _save_entry(key, url, {
+            "etag": etag,
+            "body": resp.content,
+            "content_type": resp.headers.get("content-type", "")
+        })
+
+    return resp
+
+
+@asynccontextmanager
+async def cached_stream(client: httpx.AsyncClient, url: str, headers: dict = None):
+    """
+    Streaming variant of cached_get for large payloads (e.g. recursive trees).
+    Yields (status_code, chunks) where chunks is an async iterator of bytes.
+    A 304 replays the cached body. A fresh 200 is teed into the cache only if it
+    is fully consumed and stays under GITHUB_CACHE_MAX_BODY_BYTES.
+    """
+    headers = dict(headers or {})
+    key = None
+    entry = None
+    if GITHUB_CACHE_ENABLED:
+        key = _cache_key(url, headers)
+        entry = await _load_entry(key)
+        if entry:
+            headers["If-None-Match"] = entry["etag"]
+
+    tee = None
+    completed = False
+    etag = None
+    content_type = ""
+
+    async with client.stream("GET", url, headers=headers) as resp:
+        record_cache("github_http", resp.status_code == 304 and entry is not None)
+        if resp.status_code == 304 and entry:
+            await _touch_entry(key, entry)
+
+            async def replay():
+                yield entry["body"]
+            yield 200, replay()
+            return
+
+        etag = resp.headers.get("etag")
+        content_type = resp.headers.get("content-type", "")
+        if key and resp.status_code == 200 and etag:
+            tee = bytearray()
+
+        async def chunks():
+            nonlocal tee, completed
+            async for chunk in resp.aiter_bytes():
+                if tee is not None:
+                    tee.extend(chunk)
+                    if len(tee) > GITHUB_CACHE_MAX_BODY_BYTES:
+                        tee = None
+                yield chunk
+            completed = True
+
+        yield resp.status_code, chunks()
+
+    if tee is not None and completed:
+        await _save_entry(key, url, {"etag": etag, "body": bytes(tee), "content_type": content_type})
@@ -0,0 +1,84 @@
+import os
+import httpx
+from dotenv import load_dotenv
+from services.resilience import ResilientTransport
+from services.rate_budget import record_rate_limit
+
+load_dotenv()
+
+# One pooled client for every GitHub call (api.github.com + raw.githubusercontent.com).
+# Created by the FastAPI lifespan hook in main.py so keep-alive connections and
+# HTTP/2 streams are reused across requests instead of re-handshaking each time.
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_RAW_URL = os.getenv("GITHUB_RAW_URL", "https://raw.githubusercontent.com").rstrip("/")
+
+GITHUB_HTTP2 = os.getenv("GITHUB_HTTP2", "true").lower() == "true"
+GITHUB_MAX_CONNECTIONS = int(os.getenv("GITHUB_MAX_CONNECTIONS", "100"))
+GITHUB_MAX_KEEPALIVE = int(os.getenv("GITHUB_MAX_KEEPALIVE", "20"))
+GITHUB_KEEPALIVE_EXPIRY = float(os.getenv("GITHUB_KEEPALIVE_EXPIRY", "30"))
+GITHUB_CONNECT_TIMEOUT = float(os.getenv("GITHUB_CONNECT_TIMEOUT", "5"))
+GITHUB_READ_TIMEOUT = float(os.getenv("GITHUB_READ_TIMEOUT", "20"))
+GITHUB_POOL_TIMEOUT = float(os.getenv("GITHUB_POOL_TIMEOUT", "10"))
+
+USER_AGENT = "Repo2Viral-Agent"
+
+_client = None
+
+
+def _build_client():
+    # Pooling lives on the inner transport; the wrapper adds retries and circuit breaking
+    transport = httpx.AsyncHTTPTransport(
+        http2=GITHUB_HTTP2,
+        limits=httpx.Limits(
+            max_connections=GITHUB_MAX_CONNECTIONS,
+            max_keepalive_connections=GITHUB_MAX_KEEPALIVE,
+            keepalive_expiry=GITHUB_KEEPALIVE_EXPIRY
+        )
+    )
+    return httpx.AsyncClient(
+        transport=ResilientTransport(transport, "github"),
+        timeout=httpx.Timeout(
+            GITHUB_READ_TIMEOUT,
+            connect=GITHUB_CONNECT_TIMEOUT,
+            pool=GITHUB_POOL_TIMEOUT
+        ),
+        headers={"User-Agent": USER_AGENT},
+        # Every API response reports the caller's remaining rate limit
+        event_hooks={"response": [record_rate_limit]}
+    )
+
+
+async def start_github_client():
+    """Opens the shared client. Called once from the app lifespan."""
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+async def close_github_client():
+    """Closes pooled connections. Called once on shutdown."""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def get_github_client() -> httpx.AsyncClient:
+    """
+    Returns the shared client.
+    Falls back to creating it lazily so scripts that import the loaders
+    without going through the app lifespan still work.
+    """
+    global _client
+    if _client is None:
+        _client = _build_client()
+    return _client
+
+
+def github_headers(token: str = None, accept: str = "application/vnd.github.v3+json") -> dict:
+    """Per-request headers layered on top of the shared client's defaults."""
+    headers = {"Accept": accept}
+    if token:
+        headers["Authorization"] = f"Bearer {token}"
+    return headers
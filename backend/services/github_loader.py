@@ -1,82 +1,200 @@
-import httpx
+import os
 import base64
 import re
+import asyncio
+from services.github_cache import cached_get
+from services.github_client import get_github_client, github_headers, GITHUB_API_URL, GITHUB_RAW_URL
+from services.tree_reader import read_tree, PathSample, TreeUnavailable
+from services.context_packer import pack_sections
+from services.rate_budget import choose_credential
+
+# Per-stage budgets for the README loader (seconds)
+LOADER_README_TIMEOUT = float(os.getenv("LOADER_README_TIMEOUT", "10"))
+LOADER_TREE_TIMEOUT = float(os.getenv("LOADER_TREE_TIMEOUT", "15"))
+LOADER_TREE_KEEP_PATHS = 1000
+# API calls one README load plans for: /readme, repo info, tree
+LOADER_API_COST = 3
+
+def parse_repo_url(url: str):
+    """
+    Extracts (owner, repo) from a GitHub URL.
+    Strips a trailing ".git" so clone URLs and browser URLs resolve to the same repo.
+    Returns None if the URL does not point at a GitHub repository.
+    """
+    match = re.search(r"github\.com/([^/\s]+)/([^/\s?#]+)", url)
+    if not match:
+        return None
+    owner = match.group(1)
+    repo = match.group(2)
+    if repo.lower().endswith(".git"):
+        repo = repo[:-4]
+    return owner, repo
+
+async def fetch_head_sha(owner: str, repo: str, token: str = None):
+    """
+    Returns the commit SHA at the tip of the default branch, or None if it can't be resolved.
+    Uses the "sha" media type so GitHub answers with just the 40-char hash.
+    Without a user token the call is charged to the server's budget (see
+    rate_budget); if that is spent, None is returned without calling GitHub.
+    """
+    if not token:
+        token, use_api = choose_credential(1)
+        if not use_api:
+            return None
+    headers = github_headers(token, accept="application/vnd.github.sha")
+
+    try:
+        client = get_github_client()
+        resp = await cached_get(client, f"{GITHUB_API_URL}/repos/{owner}/{repo}/commits/HEAD", headers)
+        if resp.status_code == 200:
+            return resp.text.strip()
+    except Exception as e:
+        print(f"Error resolving HEAD for {owner}/{repo}: {e}")
+    return None
+
+async def list_org_repos(org: str, token: str = None, limit: int = 100):
+    """
+    Returns up to `limit` repo URLs for a GitHub org (or user), most recently pushed
+    first. Forks and archived repos are skipped.
+    Raises ValueError if the account doesn't exist, PermissionError on a bad token.
+    """
+    headers = github_headers(token)
+    client = get_github_client()
+    urls = []
+    base = f"{GITHUB_API_URL}/orgs/{org}/repos"
+    page = 1
+    while len(urls) < limit:
+        resp = await cached_get(client, f"{base}?per_page=100&sort=pushed&page={page}", headers)
+        if resp.status_code == 404 and page == 1 and "/orgs/" in base:
+            # Not an org; personal accounts list the same way under /users
+            base = f"{GITHUB_API_URL}/users/{org}/repos"
+            continue
+        if resp.status_code in (401, 403):
+            raise PermissionError("GitHub Token Expired or Invalid")
+        if resp.status_code == 404:
+            raise ValueError(f"GitHub account not found: {org}")
+        if resp.status_code != 200:
+            raise Exception(f"Failed to list repos for {org}: {resp.text}")
+
+        repos = resp.json()
+        for repo in repos:
+            if not repo.get("fork") and not repo.get("archived"):
+                urls.append(repo["html_url"])
+        if len(repos) < 100:
+            break
+        page += 1
+    return urls[:limit]
+
+async def _run_stage(name: str, coro, timeout: float, default):
+    """Awaits one loader stage with its own timeout; a failed or slow stage yields default."""
+    try:
+        return await asyncio.wait_for(coro, timeout=timeout)
+    except asyncio.TimeoutError:
+        print(f"Loader stage '{name}' timed out after {timeout}s")
+    except Exception as e:
+        print(f"Error in loader stage '{name}': {e}")
+    return default
+
+async def _fetch_raw_text(client, url: str):
+    try:
+        resp = await client.get(url)
+        if resp.status_code == 200:
+            return resp.text
+    except Exception as e:
+        print(f"Error fetching {url}: {e}")
+    return None
+
+async def _race_raw_readme(client, owner: str, repo: str) -> str:
+    """
+    Tries raw.githubusercontent.com on the common branches at the same time.
+    The first branch that answers wins and the other requests are cancelled.
+    """
+    tasks = [
+        asyncio.create_task(_fetch_raw_text(client, f"{GITHUB_RAW_URL}/{owner}/{repo}/{branch}/README.md"))
+        for branch in ["main", "master"]
+    ]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            text = await finished
+            if text:
+                return text
+        return ""
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _fetch_readme(client, owner: str, repo: str, headers: dict) -> str:
+    # GET /repos/{owner}/{repo}/readme
+    readme_url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/readme"
+    resp = await cached_get(client, readme_url, headers)
+
+    if resp.status_code == 200:
+        data = resp.json()
+        if "content" in data and data.get("encoding") == "base64":
+            return base64.b64decode(data["content"]).decode("utf-8")
+        elif "download_url" in data:
+            return await _fetch_raw_text(client, data["download_url"]) or ""
+        return ""
+
+    # If API fails (e.g. 404 or rate limit), try raw.githubusercontent.com
+    return await _race_raw_readme(client, owner, repo)
+
+async def _fetch_file_structure(client, owner: str, repo: str, headers: dict) -> PathSample:
+    # Get default branch first
+    repo_info_resp = await cached_get(client, f"{GITHUB_API_URL}/repos/{owner}/{repo}", headers)
+    if repo_info_resp.status_code != 200:
+        return PathSample(0)
+
+    repo_info = repo_info_resp.json()
+    default_branch = repo_info.get("default_branch", "main")
+
+    # Get Tree: streamed, keeping only the paths the prompt packer may use
+    try:
+        sample, _ = await read_tree(
+            client, owner, repo, default_branch, headers,
+            lambda: PathSample(LOADER_TREE_KEEP_PATHS)
+        )
+    except TreeUnavailable:
+        return PathSample(0)
+    return sample
 
 async def fetch_repo_content(url: str) -> str:
     """
     Fetches the README.md content from a GitHub repository.
     Also attempts to fetch the file structure for context.
+    The README branch and the repo info -> tree branch run concurrently,
+    each bounded by its own timeout, so latency is the slower of the two.
     """
     # Extract owner and repo from URL
-    match = re.search(r"github\.com/([^/]+)/([^/]+)", url)
-    if not match:
+    parsed = parse_repo_url(url)
+    if not parsed:
         raise ValueError("Invalid GitHub URL. format: https://github.com/owner/repo")
     
-    owner = match.group(1)
-    repo = match.group(2)
+    owner, repo = parsed
     
-    async with httpx.AsyncClient() as client:
-        readme_content = ""
-        
-        # 1. Fetch README content via GitHub API
-        # GET /repos/{owner}/{repo}/readme
-        readme_url = f"https://api.github.com/repos/{owner}/{repo}/readme"
-        headers = {
-            "Accept": "application/vnd.github.v3+json",
-            "User-Agent": "Repo2Viral-Agent"
-        }
+    client = get_github_client()
+    # Public read: a pooled server token if one has budget, else anonymous
+    token, use_api = choose_credential(LOADER_API_COST)
+    headers = github_headers(token)
+
+    if use_api:
+        readme_content, file_structure = await asyncio.gather(
+            _run_stage("readme", _fetch_readme(client, owner, repo, headers), LOADER_README_TIMEOUT, ""),
+            _run_stage("tree", _fetch_file_structure(client, owner, repo, headers), LOADER_TREE_TIMEOUT, PathSample(0))
+        )
+    else:
+        # API budget spent: raw README only (raw.githubusercontent.com is not rate limited the same way)
+        print(f"GitHub API budget low, loading {owner}/{repo} README from raw content only")
+        readme_content = await _run_stage("readme", _race_raw_readme(client, owner, repo), LOADER_README_TIMEOUT, "")
+        file_structure = PathSample(0)
+
+    if not readme_content:
+         readme_content = "Could not fetch README.md content."
+
+    # Combine (README and tree share the prompt's token budget)
+    packed = pack_sections(readme_content.strip(), "", file_structure.paths, total_files=file_structure.count)
+    result = packed["readme"]
+    if packed["file_tree"]:
+        result += f"\n\n\n--- Repository Structure Context ({file_structure.count} files) ---\n{packed['file_tree']}"
         
-        try:
-            resp = await client.get(readme_url, headers=headers)
-            
-            if resp.status_code == 200:
-                data = resp.json()
-                if "content" in data and data.get("encoding") == "base64":
-                    readme_content = base64.b64decode(data["content"]).decode("utf-8")
-                elif "download_url" in data:
-                     raw_resp = await client.get(data["download_url"])
-                     readme_content = raw_resp.text
-            else:
-                # If API fails (e.g. 404 or rate limit), try raw.githubusercontent.com
-                # master and main are common branches
-                for branch in ["main", "master"]:
-                    raw_url = f"https://raw.githubusercontent.com/{owner}/{repo}/{branch}/README.md"
-                    raw_resp = await client.get(raw_url)
-                    if raw_resp.status_code == 200:
-                        readme_content = raw_resp.text
-                        break
-        except Exception as e:
-            print(f"Error fetching README: {e}")
-
-        if not readme_content:
-             readme_content = "Could not fetch README.md content."
-
-        # 2. Bonus: Fetch file structure
-        file_structure = []
-        try:
-            # Get default branch first
-            repo_info_url = f"https://api.github.com/repos/{owner}/{repo}"
-            repo_info_resp = await client.get(repo_info_url, headers=headers)
-            
-            if repo_info_resp.status_code == 200:
-                repo_info = repo_info_resp.json()
-                default_branch = repo_info.get("default_branch", "main")
-                
-                # Get Tree
-                tree_url = f"https://api.github.com/repos/{owner}/{repo}/git/trees/{default_branch}?recursive=1"
-                tree_resp = await client.get(tree_url, headers=headers)
-                
-                if tree_resp.status_code == 200:
-                    tree_data = tree_resp.json()
-                    # Filter for files (blob)
-                    file_structure = [item["path"] for item in tree_data.get("tree", []) if item["type"] == "blob"]
-        except Exception as e:
-            print(f"Error fetching tree: {e}")
-
-        # Combine
-        result = readme_content.strip()
-        if file_structure:
-            structure_str = "\n".join(file_structure[:300]) # Limit to 300 files to avoid massive context
-            result += f"\n\n\n--- Repository Structure Context ({len(file_structure)} files) ---\n{structure_str}"
-            
-        return result
+    return result
@@ -0,0 +1,177 @@
+import os
+import asyncio
+from bson import json_util
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+
+from services.database import db
+
+load_dotenv()
+
+# Write-behind persistence for content_history.
+# Handlers enqueue a record and return; a background task flushes batches with
+# insert_many when HISTORY_BATCH_SIZE records are waiting or HISTORY_FLUSH_INTERVAL_SECONDS
+# has passed since the first one. Batches Mongo rejects are appended to a local
+# JSONL spill file, which is replayed on the next startup.
+HISTORY_QUEUE_MAX = int(os.getenv("HISTORY_QUEUE_MAX", "1000"))
+HISTORY_BATCH_SIZE = int(os.getenv("HISTORY_BATCH_SIZE", "50"))
+HISTORY_FLUSH_INTERVAL_SECONDS = float(os.getenv("HISTORY_FLUSH_INTERVAL_SECONDS", "1.0"))
+HISTORY_DRAIN_TIMEOUT_SECONDS = float(os.getenv("HISTORY_DRAIN_TIMEOUT_SECONDS", "10"))
+HISTORY_SPILL_PATH = os.getenv("HISTORY_SPILL_PATH", "history_spill.jsonl")
+
+HISTORY_COLLECTION = "content_history"
+DUPLICATE_KEY = 11000
+
+_STOP = object()
+_queue = None
+_task = None
+# The batch the writer is collecting or inserting, spilled if shutdown cancels it
+_batch = None
+
+
+def _append_spill(records):
+    with open(HISTORY_SPILL_PATH, "a", encoding="utf-8") as f:
+        for record in records:
+            f.write(json_util.dumps(record) + "\n")
+
+
+def _read_spill():
+    if not os.path.exists(HISTORY_SPILL_PATH):
+        return []
+    with open(HISTORY_SPILL_PATH, "r", encoding="utf-8") as f:
+        return [json_util.loads(line) for line in f if line.strip()]
+
+
+async def _spill(records):
+    try:
+        await asyncio.to_thread(_append_spill, records)
+        print(f"Spilled {len(records)} history records to {HISTORY_SPILL_PATH}")
+    except Exception as e:
+        print(f"Failed to spill {len(records)} history records: {e}")
+
+
+async def _insert(records):
+    """
+    insert_many(ordered=False). Returns the records that still need a home.
+    pymongo assigns _id before sending, so a replayed record that already made it
+    in comes back as a duplicate key and is treated as written.
+    """
+    try:
+        await db[HISTORY_COLLECTION].insert_many(records, ordered=False)
+        return []
+    except BulkWriteError as e:
+        failed = {err["index"] for err in e.details.get("writeErrors", []) if err.get("code") != DUPLICATE_KEY}
+        return [records[i] for i in sorted(failed)]
+    except Exception as e:
+        print(f"History batch insert failed: {e}")
+        return records
+
+
+async def _flush(batch):
+    failed = await _insert(batch)
+    if failed:
+        await _spill(failed)
+
+
+async def _replay_spill():
+    """Re-inserts records a previous process spilled. Left on disk if Mongo is still down."""
+    try:
+        records = await asyncio.to_thread(_read_spill)
+    except Exception as e:
+        print(f"Could not read history spill file: {e}")
+        return
+    if not records:
+        return
+    failed = await _insert(records)
+    if len(failed) == len(records):
+        return
+    await asyncio.to_thread(os.remove, HISTORY_SPILL_PATH)
+    if failed:
+        await _spill(failed)
+    print(f"Replayed {len(records) - len(failed)} spilled history records")
+
+
+async def _fill_batch(batch):
+    """
+    Adds records to batch until it holds HISTORY_BATCH_SIZE or the flush interval
+    is up. Returns whether the writer was asked to stop.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + HISTORY_FLUSH_INTERVAL_SECONDS
+    while len(batch) < HISTORY_BATCH_SIZE:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            break
+        try:
+            record = await asyncio.wait_for(_queue.get(), remaining)
+        except asyncio.TimeoutError:
+            break
+        if record is _STOP:
+            return True
+        batch.append(record)
+    return False
+
+
+async def _run():
+    global _batch
+    await _replay_spill()
+    while True:
+        record = await _queue.get()
+        if record is _STOP:
+            return
+        _batch = [record]
+        stopping = await _fill_batch(_batch)
+        await _flush(_batch)
+        _batch = None
+        if stopping:
+            return
+
+
+async def start_history_writer():
+    global _queue, _task
+    if _task:
+        return
+    _queue = asyncio.Queue(maxsize=HISTORY_QUEUE_MAX)
+    _task = asyncio.create_task(_run())
+
+
+async def stop_history_writer():
+    """
+    Flushes everything still queued. Whatever can't be written in time is
+    spilled, including the batch an insert was still working on.
+    """
+    global _queue, _task, _batch
+    if not _task:
+        return
+    await _queue.put(_STOP)
+    try:
+        await asyncio.wait_for(_task, HISTORY_DRAIN_TIMEOUT_SECONDS)
+    except (asyncio.TimeoutError, Exception) as e:
+        print(f"History writer did not drain cleanly: {e!r}")
+        _task.cancel()
+    # Records already inserted from this batch come back as duplicates on replay
+    leftover = list(_batch or [])
+    _batch = None
+    while not _queue.empty():
+        record = _queue.get_nowait()
+        if record is not _STOP:
+            leftover.append(record)
+    if leftover:
+        await _spill(leftover)
+    _queue = None
+    _task = None
+
+
+async def record_history(record: dict):
+    """
+    Queues a content_history record. Never raises.
+    Without a running writer (e.g. scripts) or when the queue is full, the record
+    is written inline so back-pressure lands on the caller rather than on memory.
+    """
+    if _queue is not None:
+        try:
+            _queue.put_nowait(record)
+            return
+        except asyncio.QueueFull:
+            print("History queue full, writing inline")
+    await _flush([record])
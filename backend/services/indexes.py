@@ -0,0 +1,188 @@
+"""
+Index bootstrap and query-plan diagnostics for the backend's collections.
+
+ensure_indexes() runs at application startup and is idempotent.
+
+Diagnostics (runs explain() on the hot queries and flags collection scans):
+    python -m services.indexes explain
+Create indexes by hand (e.g. before a deploy):
+    python -m services.indexes ensure
+Report user_usage records sharing a user_id (they block the unique index),
+and with --apply merge each group into its oldest record:
+    python -m services.indexes dedupe [--apply]
+"""
+import sys
+from pymongo import IndexModel, ASCENDING, DESCENDING
+
+from services.database import db, get_sync_db
+from services.github_cache import GITHUB_CACHE_RETENTION_SECONDS
+from services.job_queue import JOB_RETENTION_SECONDS
+
+# Default index names are kept (user_id_1, expires_at_1, ...) so re-running
+# against indexes created by older code is a no-op rather than a name conflict.
+INDEX_SPECS = {
+    "user_usage": [
+        # Point lookups from quota/profile; unique so reserve_usage's upsert can't duplicate users
+        IndexModel([("user_id", ASCENDING)], unique=True),
+        # Gumroad webhook resolves users by email
+        IndexModel([("email", ASCENDING)])
+    ],
+    "content_history": [
+        # /history: filter by user, newest first, keyset on (created_at, _id)
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    ],
+    "generation_cache": [
+        # TTL eviction of cached generations
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0)
+    ],
+    "github_http_cache": [
+        # Lookups are by _id; this only ages out ETags nobody has revalidated in a while
+        # (a 304 bumps updated_at, see github_cache._touch_entry)
+        IndexModel([("updated_at", ASCENDING)], expireAfterSeconds=GITHUB_CACHE_RETENTION_SECONDS)
+    ],
+    "analysis_jobs": [
+        # claim_job: due queued jobs, oldest first
+        IndexModel([("status", ASCENDING), ("available_at", ASCENDING)]),
+        # claim_job: running jobs whose lease ran out
+        IndexModel([("status", ASCENDING), ("lease_expires_at", ASCENDING)]),
+        # Finished jobs age out; unfinished ones have no finished_at and stay
+        IndexModel([("finished_at", ASCENDING)], expireAfterSeconds=JOB_RETENTION_SECONDS)
+    ]
+}
+
+# Outcome of the index build per collection; attempted at most once per process
+_index_built = {}
+
+
+async def ensure_collection_indexes(collection: str) -> bool:
+    """
+    Creates the indexes for one collection. Attempted once per process: a
+    failure (e.g. duplicate user_ids blocking the unique index) is logged and
+    not retried from the request path. Fix the data with the dedupe command,
+    then run `ensure` or restart. Returns whether the indexes are in place.
+    """
+    if collection in _index_built:
+        return _index_built[collection]
+    _index_built[collection] = False
+    try:
+        await db[collection].create_indexes(INDEX_SPECS[collection])
+        _index_built[collection] = True
+    except Exception as e:
+        print(f"Failed to ensure indexes on {collection}: {e}")
+        if collection == "user_usage":
+            print("Duplicate user_ids? Run: python -m services.indexes dedupe")
+    return _index_built[collection]
+
+
+async def ensure_indexes():
+    """Creates every index in INDEX_SPECS. Safe to call on every startup."""
+    for collection in INDEX_SPECS:
+        await ensure_collection_indexes(collection)
+
+
+# Representative shapes of the queries the request path runs
+HOT_QUERIES = [
+    ("user_usage", "quota / profile by user_id", {"user_id": "__probe__"}, None, 1),
+    ("user_usage", "webhook lookup by email", {"email": "__probe__@example.com"}, None, 1),
+    ("content_history", "history page", {"user_id": "__probe__"}, [("created_at", -1), ("_id", -1)], 21),
+    ("generation_cache", "cache lookup by key", {"_id": "__probe__"}, None, 1),
+    ("github_http_cache", "ETag lookup by key", {"_id": "__probe__"}, None, 1),
+    ("analysis_jobs", "claim due job", {"status": "queued", "available_at": {"$lte": 0}}, [("available_at", 1)], 1),
+    ("analysis_jobs", "reclaim expired lease", {"status": "running", "lease_expires_at": {"$lte": 0}}, None, 1),
+]
+
+
+def _plan_stages(plan: dict):
+    """Yields every stage name in a winning plan tree."""
+    if not plan:
+        return
+    yield plan.get("stage", "")
+    if "inputStage" in plan:
+        yield from _plan_stages(plan["inputStage"])
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+    # SBE plans nest the classic tree under queryPlan
+    if "queryPlan" in plan:
+        yield from _plan_stages(plan["queryPlan"])
+
+
+def explain_hot_queries():
+    """Prints the winning plan for each hot query. Returns the number of COLLSCANs found."""
+    sync_db = get_sync_db()
+    collscans = 0
+    for collection, label, query, sort, limit in HOT_QUERIES:
+        cursor = sync_db[collection].find(query).limit(limit)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(plan))
+        flag = "OK"
+        if "COLLSCAN" in stages:
+            flag = "COLLSCAN"
+            collscans += 1
+        print(f"[{flag}] {collection}: {label} -> {' <- '.join(s for s in stages if s)}")
+    return collscans
+
+
+def find_duplicate_users(sync_db) -> list:
+    """Groups of user_usage _ids sharing one user_id, as {"_id": user_id, "ids": [...]}."""
+    return list(sync_db["user_usage"].aggregate([
+        {"$group": {"_id": "$user_id", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}}
+    ]))
+
+
+def dedupe_users(sync_db, apply: bool = False) -> int:
+    """
+    Reports duplicate user records and, with apply=True, merges each group into
+    its oldest record: usage counts are summed (each twin took its own share of
+    increments), pro status and Gumroad fields survive if any twin had them.
+    Returns the number of duplicated user_ids.
+    """
+    groups = find_duplicate_users(sync_db)
+    for group in groups:
+        docs = sorted(sync_db["user_usage"].find({"_id": {"$in": group["ids"]}}), key=lambda d: d["_id"])
+        keep = docs[0]
+        merged = {
+            "usage_count": sum(d.get("usage_count", 0) for d in docs),
+            "is_pro": any(d.get("is_pro") for d in docs)
+        }
+        # Prefer the values from a pro record, then the oldest one that has them
+        for field in ("email", "gumroad_subscription_id", "gumroad_license_key"):
+            values = [d[field] for d in sorted(docs, key=lambda d: not d.get("is_pro")) if d.get(field)]
+            if values:
+                merged[field] = values[0]
+        print(f"{group['_id']}: {len(docs)} records -> usage_count={merged['usage_count']} is_pro={merged['is_pro']}")
+        if apply:
+            sync_db["user_usage"].update_one({"_id": keep["_id"]}, {"$set": merged})
+            sync_db["user_usage"].delete_many({"_id": {"$in": [d["_id"] for d in docs[1:]]}})
+    return len(groups)
+
+
+def _ensure_sync():
+    sync_db = get_sync_db()
+    for collection, models in INDEX_SPECS.items():
+        names = sync_db[collection].create_indexes(models)
+        print(f"{collection}: {', '.join(names)}")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "explain"
+    if command == "ensure":
+        _ensure_sync()
+    elif command == "dedupe":
+        apply = "--apply" in sys.argv[2:]
+        found = dedupe_users(get_sync_db(), apply=apply)
+        if not found:
+            print("No duplicate user_ids.")
+        elif not apply:
+            print(f"{found} duplicated user_id{'' if found == 1 else 's'}. Merge with: python -m services.indexes dedupe --apply")
+    elif command == "explain":
+        found = explain_hot_queries()
+        if found:
+            print(f"{found} hot quer{'y' if found == 1 else 'ies'} scanning a whole collection. Run: python -m services.indexes ensure")
+            sys.exit(1)
+        print("All hot queries use an index.")
+    else:
+        print("Usage: python -m services.indexes [explain|ensure|dedupe [--apply]]")
+        sys.exit(1)
@@ -0,0 +1,265 @@
+import os
+import socket
+import asyncio
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+from services.database import db
+
+load_dotenv()
+
+# Mongo-backed queue for analyses that outlive an HTTP request.
+# A worker claims a job by atomically flipping it to "running" with a lease;
+# while it works it keeps extending the lease. If the worker dies, the lease
+# runs out and the job becomes claimable again (visibility timeout).
+# Failed attempts are retried with exponential backoff up to JOB_MAX_ATTEMPTS.
+JOB_VISIBILITY_TIMEOUT_SECONDS = float(os.getenv("JOB_VISIBILITY_TIMEOUT_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "5"))
+JOB_POLL_INTERVAL_SECONDS = float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1"))
+# Finished jobs are dropped by a TTL index on finished_at
+JOB_RETENTION_SECONDS = int(os.getenv("JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+JOBS_COLLECTION = "analysis_jobs"
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED = (SUCCEEDED, FAILED)
+
+
+class JobFailed(Exception):
+    """Raised by a job handler. retryable=False fails the job on the spot."""
+
+    def __init__(self, detail: str, status_code: int = 500, retryable: bool = True):
+        super().__init__(detail)
+        self.detail = detail
+        self.status_code = status_code
+        self.retryable = retryable
+
+
+def new_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{ObjectId()}"
+
+
+def parse_job_id(job_id: str):
+    try:
+        return ObjectId(job_id)
+    except (InvalidId, TypeError):
+        return None
+
+
+async def enqueue_job(kind: str, user_id: str, payload: dict) -> str:
+    """Stores a queued job and returns its id."""
+    now = datetime.utcnow()
+    result = await db[JOBS_COLLECTION].insert_one({
+        "kind": kind,
+        "user_id": user_id,
+        "payload": payload,
+        "status": QUEUED,
+        "attempts": 0,
+        "max_attempts": JOB_MAX_ATTEMPTS,
+        "available_at": now,
+        "created_at": now,
+        "updated_at": now
+    })
+    return str(result.inserted_id)
+
+
+async def get_job(job_id: str, user_id: str):
+    """A job as its owner may see it (no payload), or None."""
+    oid = parse_job_id(job_id)
+    if not oid:
+        return None
+    return await db[JOBS_COLLECTION].find_one(
+        {"_id": oid, "user_id": user_id},
+        {"payload": 0, "locked_by": 0}
+    )
+
+
+async def claim_job(worker_id: str):
+    """
+    Takes the oldest runnable job: queued and due, or running with an expired
+    lease (its worker died). Returns the job or None.
+    The GitHub token is removed from the stored payload as the job is claimed;
+    only the returned job (this attempt's memory) still holds it. A retry puts
+    it back (fail_job); a job reclaimed from a dead worker runs without it.
+    """
+    now = datetime.utcnow()
+    lease = {
+        "status": RUNNING,
+        "locked_by": worker_id,
+        "lease_expires_at": now + timedelta(seconds=JOB_VISIBILITY_TIMEOUT_SECONDS),
+        "updated_at": now
+    }
+    job = await db[JOBS_COLLECTION].find_one_and_update(
+        {"$or": [
+            {"status": QUEUED, "available_at": {"$lte": now}},
+            {"status": RUNNING, "lease_expires_at": {"$lte": now}}
+        ]},
+        {
+            "$set": lease,
+            "$inc": {"attempts": 1},
+            "$unset": {"payload.github_token": ""}
+        },
+        sort=[("available_at", 1)],
+        # The document as it was, so the token comes back; the claim is applied below
+        return_document=ReturnDocument.BEFORE
+    )
+    if job:
+        job.update(lease)
+        job["attempts"] = job.get("attempts", 0) + 1
+    return job
+
+
+async def extend_lease(job_id, worker_id: str) -> bool:
+    """Pushes the lease out again. False means the job was taken over."""
+    now = datetime.utcnow()
+    result = await db[JOBS_COLLECTION].update_one(
+        {"_id": job_id, "status": RUNNING, "locked_by": worker_id},
+        {"$set": {"lease_expires_at": now + timedelta(seconds=JOB_VISIBILITY_TIMEOUT_SECONDS), "updated_at": now}}
+    )
+    return result.modified_count == 1
+
+
+async def complete_job(job_id, worker_id: str, result: dict) -> bool:
+    """
+    Stores the result. Only the lease holder can complete a job, so a worker
+    whose lease expired can't overwrite the retry.
+    """
+    now = datetime.utcnow()
+    update = await db[JOBS_COLLECTION].update_one(
+        {"_id": job_id, "status": RUNNING, "locked_by": worker_id},
+        {
+            "$set": {"status": SUCCEEDED, "result": result, "finished_at": now, "updated_at": now},
+            "$unset": {"lease_expires_at": ""}
+        }
+    )
+    return update.modified_count == 1
+
+
+async def fail_job(job: dict, worker_id: str, error: JobFailed) -> str:
+    """
+    Requeues the job with backoff if the error is retryable and attempts remain,
+    otherwise marks it failed. Returns the new status, or None if the lease was lost.
+    A requeued job gets back the GitHub token claim_job took out of it.
+    """
+    now = datetime.utcnow()
+    error_doc = {"status_code": error.status_code, "detail": error.detail}
+    if error.retryable and job["attempts"] < job.get("max_attempts", JOB_MAX_ATTEMPTS):
+        delay = JOB_RETRY_BASE_SECONDS * (2 ** (job["attempts"] - 1))
+        requeue = {"status": QUEUED, "available_at": now + timedelta(seconds=delay), "error": error_doc, "updated_at": now}
+        token = job.get("payload", {}).get("github_token")
+        if token:
+            requeue["payload.github_token"] = token
+        update = {
+            "$set": requeue,
+            "$unset": {"locked_by": "", "lease_expires_at": ""}
+        }
+        status = QUEUED
+    else:
+        update = {
+            "$set": {"status": FAILED, "error": error_doc, "finished_at": now, "updated_at": now},
+            "$unset": {"lease_expires_at": ""}
+        }
+        status = FAILED
+
+    result = await db[JOBS_COLLECTION].update_one(
+        {"_id": job["_id"], "status": RUNNING, "locked_by": worker_id},
+        update
+    )
+    return status if result.modified_count == 1 else None
+
+
+async def _keep_lease(job_id, worker_id: str):
+    """Extends the lease until cancelled or taken over. A failed extension is retried next tick."""
+    while True:
+        await asyncio.sleep(JOB_VISIBILITY_TIMEOUT_SECONDS / 3)
+        try:
+            extended = await extend_lease(job_id, worker_id)
+        except Exception as e:
+            print(f"Could not extend lease on job {job_id}: {e}")
+            continue
+        if not extended:
+            print(f"Lost lease on job {job_id}")
+            return
+
+
+async def run_worker(handler, on_finished=None, stop: asyncio.Event = None, worker_id: str = None):
+    """
+    Claims and runs jobs until `stop` is set.
+    handler(job) returns the result dict or raises (JobFailed for a chosen status;
+    anything else is retried as a 500).
+    on_finished(job, status, result), if given, runs once after the job reached
+    a final state under this worker's lease (e.g. to settle quota and history).
+    """
+    worker_id = worker_id or new_worker_id()
+    stop = stop or asyncio.Event()
+    print(f"Job worker {worker_id} started")
+
+    while not stop.is_set():
+        try:
+            job = await claim_job(worker_id)
+        except Exception as e:
+            print(f"Job claim failed: {e}")
+            job = None
+        if not job:
+            try:
+                await asyncio.wait_for(stop.wait(), timeout=JOB_POLL_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        # A job reclaimed after its last attempt's worker died has no attempts left
+        if job["attempts"] > job.get("max_attempts", JOB_MAX_ATTEMPTS):
+            status = await fail_job(job, worker_id, JobFailed("Job exceeded its attempts", retryable=False))
+            if status and on_finished:
+                await on_finished(job, status, None)
+            continue
+
+        lease = asyncio.create_task(_keep_lease(job["_id"], worker_id))
+        try:
+            result = await handler(job)
+            status = SUCCEEDED if await complete_job(job["_id"], worker_id, result) else None
+        except Exception as e:
+            error = e if isinstance(e, JobFailed) else JobFailed(str(e))
+            print(f"Job {job['_id']} attempt {job['attempts']} failed: {error.detail}")
+            status = await fail_job(job, worker_id, error)
+            result = None
+        finally:
+            lease.cancel()
+
+        if status in FINISHED and on_finished:
+            try:
+                await on_finished(job, status, result)
+            except Exception as e:
+                print(f"Job {job['_id']} finish hook failed: {e}")
+
+    print(f"Job worker {worker_id} stopped")
+
+
+_workers = []
+_stop = None
+
+
+async def start_workers(count: int, handler, on_finished=None):
+    """Starts `count` in-process workers (used by the API when JOB_INPROCESS_WORKERS > 0)."""
+    global _stop
+    _stop = asyncio.Event()
+    for _ in range(count):
+        _workers.append(asyncio.create_task(run_worker(handler, on_finished, _stop)))
+
+
+async def stop_workers(timeout: float = 30):
+    """Lets running jobs finish; unfinished ones are picked up again once their lease expires."""
+    if not _workers:
+        return
+    _stop.set()
+    done, pending = await asyncio.wait(_workers, timeout=timeout)
+    for task in pending:
+        task.cancel()
+    _workers.clear()
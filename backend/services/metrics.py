@@ -0,0 +1,92 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+# Prometheus metrics for the generation pipeline, served by GET /metrics.
+# Values are per process; with several workers, scrape each one (or aggregate
+# in Prometheus). Cache hit ratios come from repo2viral_cache_requests_total:
+#   sum by (cache) (rate(...{result="hit"}[5m])) / sum by (cache) (rate(...[5m]))
+
+STAGE_SECONDS = Histogram(
+    "repo2viral_stage_seconds",
+    "Wall time of one pipeline stage",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 90, 120)
+)
+UPSTREAM_RESPONSES = Counter(
+    "repo2viral_upstream_responses_total",
+    "Outbound call outcomes (HTTP status, 'error' or 'circuit_open'), every attempt counted",
+    ["upstream", "status"]
+)
+CACHE_REQUESTS = Counter(
+    "repo2viral_cache_requests_total",
+    "Cache lookups by cache and result",
+    ["cache", "result"]
+)
+IN_FLIGHT = Gauge(
+    "repo2viral_in_flight",
+    "Work currently in progress (analysis: requests running or joining a generation, openai: completions, openai_waiting: queued for a slot)",
+    ["kind"]
+)
+OPENAI_TOKENS = Counter(
+    "repo2viral_openai_tokens_total",
+    "OpenAI token usage reported by the API",
+    ["type"]
+)
+
+_timings = ContextVar("stage_timings", default=None)
+
+
+def start_request_timings() -> list:
+    """Starts collecting stage timings for the current request (read back for Server-Timing)."""
+    timings = []
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name: str):
+    """Times a block into the stage histogram and the current request's Server-Timing."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((name, elapsed))
+
+
+@contextmanager
+def in_flight(kind: str):
+    IN_FLIGHT.labels(kind).inc()
+    try:
+        yield
+    finally:
+        IN_FLIGHT.labels(kind).dec()
+
+
+def server_timing_header(timings) -> str:
+    return ", ".join(f"{name};dur={elapsed * 1000:.1f}" for name, elapsed in timings)
+
+
+def record_upstream(upstream: str, status):
+    UPSTREAM_RESPONSES.labels(upstream, str(status)).inc()
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.labels(cache, "hit" if hit else "miss").inc()
+
+
+def record_openai_usage(usage):
+    if not usage:
+        return
+    OPENAI_TOKENS.labels("prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    OPENAI_TOKENS.labels("completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+def render_metrics():
+    """(body, content_type) for the /metrics endpoint."""
+    return generate_latest(), CONTENT_TYPE_LATEST
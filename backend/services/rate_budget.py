@@ -0,0 +1,93 @@
+import os
+import time
+import hashlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# GitHub core rate-limit budget, tracked per credential from the
+# X-RateLimit-* headers on every API response.
+# Public reads that would otherwise go out anonymously (60/hour per IP) can use
+# an optional pool of server tokens (GITHUB_SERVER_TOKENS, comma separated,
+# 5000/hour each); the token with the most budget left is picked. When nothing
+# has budget to spare, callers route to raw.githubusercontent.com instead.
+GITHUB_SERVER_TOKENS = [t.strip() for t in os.getenv("GITHUB_SERVER_TOKENS", "").split(",") if t.strip()]
+GITHUB_BUDGET_LOW_WATERMARK = int(os.getenv("GITHUB_BUDGET_LOW_WATERMARK", "10"))
+
+ANONYMOUS = "anonymous"
+
+_budgets = {}  # credential key -> {"remaining", "limit", "reset"}
+
+
+def credential_key(authorization: str = None) -> str:
+    """Budget key for an Authorization header value (or token); never the token itself."""
+    if not authorization:
+        return ANONYMOUS
+    token = authorization.split(" ", 1)[-1]
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()[:16]
+
+
+async def record_rate_limit(response):
+    """httpx response hook: updates the budget of the credential that made the request."""
+    headers = response.headers
+    remaining = headers.get("x-ratelimit-remaining")
+    if remaining is None:
+        return
+    # Search and GraphQL have their own buckets
+    if headers.get("x-ratelimit-resource", "core") != "core":
+        return
+    try:
+        _budgets[credential_key(response.request.headers.get("authorization"))] = {
+            "remaining": int(remaining),
+            "limit": int(headers.get("x-ratelimit-limit", "0")),
+            "reset": float(headers.get("x-ratelimit-reset", "0"))
+        }
+    except ValueError:
+        pass
+
+
+def remaining(key: str):
+    """Known remaining calls for a credential, or None if unknown or the window has reset."""
+    budget = _budgets.get(key)
+    if not budget or budget["reset"] <= time.time():
+        return None
+    return budget["remaining"]
+
+
+def try_reserve(key: str, cost: int) -> bool:
+    """
+    Claims `cost` calls from a credential's budget ahead of time so concurrent
+    requests don't all plan on the same last few calls. The next response
+    overwrites the estimate with GitHub's own count.
+    """
+    left = remaining(key)
+    if left is None:
+        return True
+    if left - cost < GITHUB_BUDGET_LOW_WATERMARK:
+        return False
+    _budgets[key]["remaining"] = left - cost
+    return True
+
+
+def choose_credential(cost: int):
+    """
+    Picks who pays for a public read of about `cost` API calls.
+    Returns (token, use_api): a pool token with the most budget left, else
+    anonymous (None, True); (None, False) means the API budget is spent and
+    the caller should use raw endpoints.
+    """
+    def budget_left(token):
+        left = remaining(credential_key(token))
+        return float("inf") if left is None else left
+
+    for token in sorted(GITHUB_SERVER_TOKENS, key=budget_left, reverse=True):
+        if try_reserve(credential_key(token), cost):
+            return token, True
+    if try_reserve(ANONYMOUS, cost):
+        return None, True
+    return None, False
+
+
+def snapshot() -> dict:
+    """Current budgets by credential key (for diagnostics)."""
+    return {key: dict(budget) for key, budget in _budgets.items()}
@@ -0,0 +1,98 @@
+import io
+import os
+import asyncio
+import tarfile
+from dotenv import load_dotenv
+
+from services.github_client import GITHUB_API_URL
+
+load_dotenv()
+
+# Archive mode downloads the whole repo as one gzipped tarball (a single request
+# against the rate limit) and reads files out of it in memory.
+DEEP_ARCHIVE_MAX_BYTES = int(os.getenv("DEEP_ARCHIVE_MAX_BYTES", str(50 * 1024 * 1024)))
+DEEP_ARCHIVE_MAX_FILE_BYTES = int(os.getenv("DEEP_ARCHIVE_MAX_FILE_BYTES", str(1024 * 1024)))
+
+
+class ArchiveTooLarge(Exception):
+    """Raised when a tarball exceeds DEEP_ARCHIVE_MAX_BYTES (checked while streaming)."""
+
+
+class RepoArchive:
+    """
+    In-memory view of a repository tarball.
+    paths lists every regular file (repo-relative, same shape as the git tree API).
+    read_many() pulls any subset of files in a single forward pass over the archive.
+    """
+
+    def __init__(self, data: bytes, paths: list, offsets: dict):
+        self._data = data
+        self.paths = paths
+        self._offsets = offsets
+
+    async def read_many(self, paths):
+        """Returns {path: text_or_None}. Unknown or oversized files map to None."""
+        wanted = [p for p in dict.fromkeys(paths) if p]
+        return await asyncio.to_thread(self._read_many_sync, wanted)
+
+    def _read_many_sync(self, wanted):
+        contents = {p: None for p in wanted}
+        targets = {self._offsets[p]: p for p in wanted if p in self._offsets}
+        if not targets:
+            return contents
+
+        # Walk members in archive order and stop once the last wanted file is read,
+        # so gzip never has to seek backwards.
+        last_offset = max(targets)
+        with tarfile.open(fileobj=io.BytesIO(self._data), mode="r:gz") as tar:
+            for member in tar:
+                path = targets.get(member.offset)
+                if path and member.size <= DEEP_ARCHIVE_MAX_FILE_BYTES:
+                    extracted = tar.extractfile(member)
+                    if extracted:
+                        contents[path] = extracted.read().decode("utf-8", errors="replace")
+                if member.offset >= last_offset:
+                    break
+        return contents
+
+
+def _index_archive(data: bytes) -> RepoArchive:
+    paths = []
+    offsets = {}
+    with tarfile.open(fileobj=io.BytesIO(data), mode="r:gz") as tar:
+        for member in tar:
+            if not member.isfile():
+                continue
+            # Members are prefixed with "<owner>-<repo>-<sha>/"
+            parts = member.name.split("/", 1)
+            if len(parts) < 2 or not parts[1]:
+                continue
+            paths.append(parts[1])
+            offsets[parts[1]] = member.offset
+    return RepoArchive(data, paths, offsets)
+
+
+async def load_repo_archive(client, owner: str, repo: str, ref: str, headers: dict) -> RepoArchive:
+    """
+    Streams GET /repos/{owner}/{repo}/tarball/{ref} into memory (never to disk).
+    Aborts as soon as the declared or streamed size passes DEEP_ARCHIVE_MAX_BYTES.
+    """
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/tarball/{ref}"
+    buffer = bytearray()
+
+    async with client.stream("GET", url, headers=headers, follow_redirects=True) as resp:
+        if resp.status_code == 401 or resp.status_code == 403:
+            raise PermissionError("GitHub Token Expired or Invalid")
+        if resp.status_code != 200:
+            raise Exception(f"Failed to download archive: HTTP {resp.status_code}")
+
+        declared = resp.headers.get("content-length")
+        if declared and declared.isdigit() and int(declared) > DEEP_ARCHIVE_MAX_BYTES:
+            raise ArchiveTooLarge(f"Archive is {declared} bytes (cap {DEEP_ARCHIVE_MAX_BYTES})")
+
+        async for chunk in resp.aiter_bytes():
+            buffer.extend(chunk)
+            if len(buffer) > DEEP_ARCHIVE_MAX_BYTES:
+                raise ArchiveTooLarge(f"Archive exceeded {DEEP_ARCHIVE_MAX_BYTES} bytes while streaming")
+
+    return await asyncio.to_thread(_index_archive, bytes(buffer))
@@ -0,0 +1,172 @@
+import posixpath
+
+
+class Detector:
+    """
+    Declarative rule matched against a FileTreeIndex.
+
+    A path matches when ANY of the criteria hit:
+      basenames          exact file name (case-insensitive)
+      basename_suffixes  file name ends with one of these (case-insensitive)
+      basename_prefixes  file name starts with one of these (case-insensitive)
+      dirs               path lives under one of these directories
+      paths              exact repo-relative path
+      contains           lowercase path contains the token (optionally only
+                         for files whose extension is in `extensions`)
+
+    kind groups detectors for the analyser ("stack", "feature", "file", "entry").
+    label is what ends up in the output; it may use {count} and {first}.
+    requires names another detector that must also match (e.g. Next.js needs Node).
+    """
+
+    def __init__(self, name, kind, label=None, basenames=(), basename_suffixes=(), basename_prefixes=(),
+                 dirs=(), paths=(), contains=(), extensions=(), requires=None):
+        self.name = name
+        self.kind = kind
+        self.label = label or name
+        self.basenames = tuple(b.lower() for b in basenames)
+        self.basename_suffixes = tuple(s.lower() for s in basename_suffixes)
+        self.basename_prefixes = tuple(p.lower() for p in basename_prefixes)
+        self.dirs = tuple(d.strip("/") for d in dirs)
+        self.paths = tuple(paths)
+        self.contains = tuple(c.lower() for c in contains)
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.requires = requires
+
+
+class FileTreeIndex:
+    """
+    One-pass index over a repository's file paths.
+    Each path is matched against the registry's detectors as it is added, and
+    only the matches are kept, in tree order. Paths no detector asks for cost
+    nothing beyond the count.
+
+    Paths can be fed one at a time with add(), so a streamed tree never has to
+    be held in memory: keep_paths caps how many raw paths are retained and
+    bucket_limit caps how many matches each detector remembers (plus its first
+    root-level match, e.g. the root README); totals stay exact.
+    """
+
+    def __init__(self, registry=None, keep_paths=None, bucket_limit=None):
+        self.count = 0
+        self.paths = []
+        # detector name -> matching paths (capped) / exact number of matches
+        self.hits = {}
+        self.totals = {}
+
+        self.keep_paths = keep_paths
+        self.bucket_limit = bucket_limit
+        self._registry = registry
+        self._root_kept = set()
+
+    @classmethod
+    def build(cls, paths, registry=None, keep_paths=None, bucket_limit=None):
+        index = cls(registry, keep_paths, bucket_limit)
+        for path in paths:
+            index.add(path)
+        return index
+
+    def add(self, path: str):
+        self.count += 1
+        if self.keep_paths is None or len(self.paths) < self.keep_paths:
+            self.paths.append(path)
+        if self._registry is None:
+            return
+
+        for name in self._registry.match(path):
+            total = self.totals.get(name, 0) + 1
+            self.totals[name] = total
+            if self.bucket_limit is None or total <= self.bucket_limit:
+                self.hits.setdefault(name, []).append(path)
+            elif "/" not in path and name not in self._root_kept:
+                # The analyser prefers root-level files; keep the first one past the cap
+                self.hits[name].append(path)
+            if "/" not in path:
+                self._root_kept.add(name)
+
+
+class DetectorHits(list):
+    """Matching paths in tree order (possibly capped), with total = number of matching files."""
+
+    def __init__(self, paths=(), total=0):
+        super().__init__(paths)
+        self.total = total
+
+
+class DetectorRegistry:
+    """
+    Ordered collection of detectors matched together against each path.
+    Rules are grouped by kind up front, so a path costs one basename lookup plus
+    the suffix/prefix/dir/substring checks detectors actually declared.
+    """
+
+    def __init__(self):
+        self.detectors = []
+        self._by_basename = {}
+        self._by_path = {}
+        self._suffixes = []
+        self._prefixes = []
+        # Union of every suffix / prefix, so most paths are ruled out in one call
+        self._any_suffix = ()
+        self._any_prefix = ()
+        self._dirs = []
+        self._probes = []
+
+    def register(self, detector: Detector):
+        self.detectors.append(detector)
+        for basename in detector.basenames:
+            self._by_basename.setdefault(basename, []).append(detector.name)
+        for path in detector.paths:
+            self._by_path.setdefault(path, []).append(detector.name)
+        if detector.basename_suffixes:
+            self._suffixes.append((detector.basename_suffixes, detector.name))
+            self._any_suffix += detector.basename_suffixes
+        if detector.basename_prefixes:
+            self._prefixes.append((detector.basename_prefixes, detector.name))
+            self._any_prefix += detector.basename_prefixes
+        for directory in detector.dirs:
+            self._dirs.append((directory.lower() + "/", detector.name))
+        for token in detector.contains:
+            self._probes.append((token, detector.extensions, detector.name))
+        return detector
+
+    def of_kind(self, kind: str):
+        return [d for d in self.detectors if d.kind == kind]
+
+    def match(self, path: str) -> list:
+        """Names of the detectors matching one path (each at most once)."""
+        lower = path.lower()
+        basename = posixpath.basename(lower)
+        matched = list(self._by_basename.get(basename, ()))
+        matched.extend(self._by_path.get(path, ()))
+        if self._any_suffix and basename.endswith(self._any_suffix):
+            for suffixes, name in self._suffixes:
+                if basename.endswith(suffixes):
+                    matched.append(name)
+        if self._any_prefix and basename.startswith(self._any_prefix):
+            for prefixes, name in self._prefixes:
+                if basename.startswith(prefixes):
+                    matched.append(name)
+        for directory, name in self._dirs:
+            if lower.startswith(directory):
+                matched.append(name)
+        if self._probes:
+            suffix = posixpath.splitext(basename)[1]
+            for token, extensions, name in self._probes:
+                if token in lower and (not extensions or suffix in extensions):
+                    matched.append(name)
+        if len(matched) > 1:
+            matched = list(dict.fromkeys(matched))
+        return matched
+
+    def resolve(self, index: FileTreeIndex) -> dict:
+        """Returns {detector name: DetectorHits} for every detector; totals are exact."""
+        resolved = {
+            d.name: DetectorHits(index.hits.get(d.name, ()), index.totals.get(d.name, 0))
+            for d in self.detectors
+        }
+        # Drop matches whose prerequisite detector found nothing
+        for d in self.detectors:
+            if d.requires and not resolved.get(d.requires):
+                resolved[d.name] = DetectorHits()
+        return resolved
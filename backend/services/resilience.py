@@ -0,0 +1,236 @@
+import os
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+import httpx
+from dotenv import load_dotenv
+from services.metrics import record_upstream
+
+load_dotenv()
+
+# Shared retry / circuit-breaking policy for outbound calls (GitHub, OpenAI).
+# - Retryable failures back off exponentially with full jitter.
+# - Retry-After / X-RateLimit-Reset are honoured when the wait is short enough
+#   to sit out (RETRY_MAX_WAIT_SECONDS); longer waits fail straight away.
+# - Each upstream has a circuit breaker: after BREAKER_FAILURE_THRESHOLD
+#   consecutive failures (5xx, timeouts, connection errors) calls fail fast for
+#   BREAKER_RESET_SECONDS, then a single probe decides whether to close it again.
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", "3"))
+RETRY_BASE_DELAY_SECONDS = float(os.getenv("RETRY_BASE_DELAY_SECONDS", "0.5"))
+RETRY_MAX_DELAY_SECONDS = float(os.getenv("RETRY_MAX_DELAY_SECONDS", "8"))
+RETRY_MAX_WAIT_SECONDS = float(os.getenv("RETRY_MAX_WAIT_SECONDS", "20"))
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", "30"))
+
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS"})
+
+
+class CircuitOpenError(Exception):
+    """The upstream's breaker is open; the call was not attempted."""
+
+    def __init__(self, upstream: str, retry_in: float):
+        super().__init__(f"{upstream} is unavailable (circuit open, retry in {retry_in:.0f}s)")
+        self.upstream = upstream
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+        self._probe_started = 0.0
+
+    def before_call(self):
+        """
+        Raises CircuitOpenError while open. Lets exactly one probe through once
+        the reset time is up. A probe that hasn't reported back within another
+        reset period is presumed lost, and the next caller probes instead.
+        Returns whether this call is the probe.
+        """
+        if self.state == self.CLOSED:
+            return False
+        now = time.monotonic()
+        elapsed = now - self.opened_at
+        if self.state == self.OPEN and elapsed >= self.reset_seconds:
+            self.state = self.HALF_OPEN
+            self._probing = False
+        if self.state == self.HALF_OPEN and self._probing and now - self._probe_started >= self.reset_seconds:
+            self._probing = False
+        if self.state == self.HALF_OPEN and not self._probing:
+            self._probing = True
+            self._probe_started = now
+            return True
+        raise CircuitOpenError(self.name, max(self.reset_seconds - elapsed, 0))
+
+    def release_probe(self):
+        """The probe ended without a verdict (e.g. it was cancelled): the next caller may probe."""
+        self._probing = False
+
+    def record_success(self):
+        if self.state != self.CLOSED:
+            print(f"Circuit {self.name} closed")
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.threshold:
+            if self.state != self.OPEN:
+                print(f"Circuit {self.name} opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+
+_breakers = {}
+
+
+def get_breaker(upstream: str) -> CircuitBreaker:
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        breaker = _breakers[upstream] = CircuitBreaker(upstream)
+    return breaker
+
+
+def backoff_delay(attempt: int) -> float:
+    """Full-jitter exponential backoff for the given (0-based) retry."""
+    return random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** attempt)))
+
+
+def rate_limit_wait(headers) -> float:
+    """
+    Seconds the upstream asked us to wait, or None if it didn't say.
+    Understands Retry-After (seconds or HTTP date) and GitHub's
+    X-RateLimit-Remaining: 0 + X-RateLimit-Reset (epoch seconds).
+    """
+    retry_after = headers.get("retry-after")
+    if retry_after:
+        try:
+            return max(float(retry_after), 0.0)
+        except ValueError:
+            try:
+                return max(parsedate_to_datetime(retry_after).timestamp() - time.time(), 0.0)
+            except (TypeError, ValueError):
+                pass
+    if headers.get("x-ratelimit-remaining") == "0" and headers.get("x-ratelimit-reset"):
+        try:
+            return max(float(headers["x-ratelimit-reset"]) - time.time(), 0.0)
+        except ValueError:
+            pass
+    return None
+
+
+async def retry_call(upstream: str, call, classify, attempts: int = RETRY_MAX_ATTEMPTS):
+    """
+    Awaits call() under the upstream's breaker, retrying what classify allows.
+    classify(exc) -> (retryable, wait_seconds_or_None, counts_as_failure).
+    counts_as_failure=None means the error says nothing about the upstream
+    (e.g. the call never reached it); the breaker is left as it was.
+    """
+    breaker = get_breaker(upstream)
+    attempt = 0
+    while True:
+        try:
+            probe = breaker.before_call()
+        except CircuitOpenError:
+            record_upstream(upstream, "circuit_open")
+            raise
+        try:
+            result = await call()
+        except Exception as e:
+            record_upstream(upstream, getattr(e, "status_code", None) or "error")
+            retryable, wait, failure = classify(e)
+            if failure:
+                breaker.record_failure()
+            elif failure is None:
+                if probe:
+                    breaker.release_probe()
+            else:
+                # The upstream answered (e.g. a 4xx), so it is up
+                breaker.record_success()
+            if not retryable or attempt + 1 >= attempts:
+                raise
+            delay = wait if wait is not None else backoff_delay(attempt)
+            if delay > RETRY_MAX_WAIT_SECONDS:
+                raise
+        except BaseException:
+            # Cancelled mid-call: says nothing about the upstream, but mustn't hold the probe
+            if probe:
+                breaker.release_probe()
+            raise
+        else:
+            record_upstream(upstream, "ok")
+            breaker.record_success()
+            return result
+        attempt += 1
+        await asyncio.sleep(delay)
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    httpx transport applying the policy to every request on a client, including
+    streamed ones (retries happen before the body is handed to the caller).
+    Only idempotent methods are retried. The breaker is keyed per host.
+    """
+
+    def __init__(self, inner: httpx.AsyncBaseTransport, name: str):
+        self._inner = inner
+        self._name = name
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        upstream = f"{self._name}:{request.url.host}"
+        breaker = get_breaker(upstream)
+        can_retry = request.method in IDEMPOTENT_METHODS
+        attempt = 0
+        while True:
+            try:
+                probe = breaker.before_call()
+            except CircuitOpenError:
+                record_upstream(upstream, "circuit_open")
+                raise
+            try:
+                response = await self._inner.handle_async_request(request)
+            except httpx.TransportError:
+                record_upstream(upstream, "error")
+                breaker.record_failure()
+                if not can_retry or attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                    raise
+                delay = backoff_delay(attempt)
+            except BaseException:
+                # Cancelled, or an error that isn't the upstream's: no verdict either way
+                if probe:
+                    breaker.release_probe()
+                raise
+            else:
+                status = response.status_code
+                record_upstream(upstream, status)
+                if status >= 500:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                # GitHub signals an exhausted rate limit with 403 + X-RateLimit-Remaining: 0
+                wait = rate_limit_wait(response.headers) if status in (403, 429, 503) else None
+                retryable = status in RETRYABLE_STATUSES or wait is not None
+                if not can_retry or not retryable or attempt + 1 >= RETRY_MAX_ATTEMPTS:
+                    return response
+                delay = wait if wait is not None else backoff_delay(attempt)
+                if delay > RETRY_MAX_WAIT_SECONDS:
+                    return response
+                await response.aclose()
+            attempt += 1
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        await self._inner.aclose()
@@ -0,0 +1,44 @@
+import copy
+import asyncio
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key: the first caller starts the
+    work, later callers await the same task until it finishes. Nothing is kept
+    once the task is done (caching finished results is generation_cache's job).
+    """
+
+    def __init__(self):
+        self._calls = {}
+
+    def in_flight(self, key) -> bool:
+        return key is not None and key in self._calls
+
+    async def do(self, key, fn):
+        """
+        Runs fn() at most once at a time per key. Returns (result, shared), where
+        shared is True for callers that joined someone else's call; they get a
+        deep copy so nobody mutates the leader's result.
+        A key of None opts out of coalescing.
+        The work is shielded: a caller that disconnects doesn't cancel it for the rest.
+        """
+        if key is None:
+            return await fn(), False
+
+        task = self._calls.get(key)
+        shared = task is not None
+        if not shared:
+            task = asyncio.create_task(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda t: self._finish(key, t))
+
+        result = await asyncio.shield(task)
+        return (copy.deepcopy(result) if shared else result), shared
+
+    def _finish(self, key, task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Mark the exception retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,190 @@
+import os
+import asyncio
+import collections
+import ijson
+from dotenv import load_dotenv
+
+from services.github_cache import cached_stream
+from services.github_client import GITHUB_API_URL
+
+load_dotenv()
+
+# Truncated trees (GitHub caps recursive listings) are re-read subtree by subtree.
+TREE_WALK_CONCURRENCY = int(os.getenv("TREE_WALK_CONCURRENCY", "8"))
+TREE_WALK_MAX_REQUESTS = int(os.getenv("TREE_WALK_MAX_REQUESTS", "200"))
+
+
+class TreeUnavailable(Exception):
+    """The tree endpoint answered with a non-200 status."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Failed to fetch file tree (HTTP {status_code})")
+        self.status_code = status_code
+
+
+class PathSample:
+    """Minimal sink: keeps the first `limit` paths and counts the rest."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.count = 0
+        self.paths = []
+
+    def add(self, path: str):
+        self.count += 1
+        if len(self.paths) < self.limit:
+            self.paths.append(path)
+
+
+class _ChunkReader:
+    """Adapts an async byte iterator to the async read() ijson expects."""
+
+    def __init__(self, chunks):
+        self._chunks = chunks.__aiter__()
+
+    async def read(self, size: int = -1) -> bytes:
+        # ijson probes with read(0) to tell bytes from str; that must not consume a chunk
+        if size == 0:
+            return b""
+        try:
+            return await self._chunks.__anext__()
+        except StopAsyncIteration:
+            return b""
+
+
+async def _stream_tree(client, url: str, headers: dict, on_blob, on_tree=None):
+    """
+    Parses one trees response incrementally. Only path/type/sha of the current
+    entry are held in memory. Returns whether GitHub marked the listing truncated.
+    """
+    async with cached_stream(client, url, headers) as (status_code, chunks):
+        if status_code != 200:
+            raise TreeUnavailable(status_code)
+
+        truncated = False
+        path = kind = sha = None
+        async for prefix, event, value in ijson.parse_async(_ChunkReader(chunks)):
+            if prefix == "tree.item.path":
+                path = value
+            elif prefix == "tree.item.type":
+                kind = value
+            elif prefix == "tree.item.sha":
+                sha = value
+            elif prefix == "tree.item" and event == "end_map":
+                if kind == "blob":
+                    on_blob(path)
+                elif kind == "tree" and on_tree:
+                    on_tree(path, sha)
+                path = kind = sha = None
+            elif prefix == "truncated":
+                truncated = bool(value)
+        return truncated
+
+
+async def _walk_tree(client, owner: str, repo: str, ref: str, headers: dict, on_path):
+    """
+    Rebuilds a truncated listing from subtrees: each top-level directory is
+    fetched recursively, and any subtree that is itself truncated is split one
+    level further. At most TREE_WALK_MAX_REQUESTS tree calls are made; anything
+    beyond is skipped.
+    Paths are emitted in the same order as a recursive listing, as soon as the
+    subtree holding them is next in line. Up to TREE_WALK_CONCURRENCY subtrees
+    are fetched ahead of it, so at most that many listings are buffered per level.
+    """
+    semaphore = asyncio.Semaphore(TREE_WALK_CONCURRENCY)
+    budget = {"remaining": TREE_WALK_MAX_REQUESTS}
+
+    def take_request() -> bool:
+        if budget["remaining"] <= 0:
+            return False
+        budget["remaining"] -= 1
+        return True
+
+    async def list_level(prefix: str, tree_ref: str):
+        # Non-recursive listing: segments are blob paths or child subtrees
+        segments = []
+        async with semaphore:
+            await _stream_tree(
+                client,
+                f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{tree_ref}",
+                headers,
+                on_blob=lambda p: segments.append(prefix + p),
+                on_tree=lambda p, sha: segments.append((prefix + p + "/", sha))
+            )
+        return segments
+
+    async def walk_subtree(prefix: str, sha: str):
+        """(paths, None) for a complete subtree, or ([], segments of its level) if truncated."""
+        if not take_request():
+            print(f"Tree walk budget exhausted, skipping {prefix}")
+            return [], None
+        paths = []
+        async with semaphore:
+            truncated = await _stream_tree(
+                client,
+                f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{sha}?recursive=1",
+                headers,
+                on_blob=lambda p: paths.append(prefix + p)
+            )
+        if not truncated:
+            return paths, None
+        if not take_request():
+            print(f"Tree walk budget exhausted, keeping partial listing of {prefix}")
+            return paths, None
+        paths.clear()
+        return [], await list_level(prefix, sha)
+
+    async def emit(segments):
+        pending = iter(segments)
+        window = collections.deque()
+        ahead = 0
+        try:
+            while True:
+                # Keep up to TREE_WALK_CONCURRENCY subtree fetches running ahead of the output
+                while ahead < TREE_WALK_CONCURRENCY:
+                    segment = next(pending, None)
+                    if segment is None:
+                        break
+                    if isinstance(segment, tuple):
+                        window.append(asyncio.create_task(walk_subtree(*segment)))
+                        ahead += 1
+                    else:
+                        window.append(segment)
+                if not window:
+                    return
+                head = window.popleft()
+                if isinstance(head, str):
+                    on_path(head)
+                    continue
+                ahead -= 1
+                paths, children = await head
+                for path in paths:
+                    on_path(path)
+                if children:
+                    await emit(children)
+        finally:
+            for item in window:
+                if isinstance(item, asyncio.Task):
+                    item.cancel()
+
+    take_request()
+    await emit(await list_level("", ref))
+
+
+async def read_tree(client, owner: str, repo: str, ref: str, headers: dict, new_sink):
+    """
+    Streams GET /repos/{owner}/{repo}/git/trees/{ref}?recursive=1 into a sink.
+    new_sink() builds an object with add(path) (e.g. FileTreeIndex, PathSample).
+    If GitHub truncates the listing, a fresh sink is filled by walking subtrees.
+    Returns (sink, truncated).
+    """
+    sink = new_sink()
+    url = f"{GITHUB_API_URL}/repos/{owner}/{repo}/git/trees/{ref}?recursive=1"
+    truncated = await _stream_tree(client, url, headers, on_blob=sink.add)
+    if not truncated:
+        return sink, False
+
+    print(f"{owner}/{repo}: recursive tree truncated after {sink.count} files, walking subtrees")
+    sink = new_sink()
+    await _walk_tree(client, owner, repo, ref, headers, sink.add)
+    return sink, True
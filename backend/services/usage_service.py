@@ -1,73 +1,152 @@
 from services.database import db
+from services.user_cache import get_cached_user, put_user, invalidate_user
+from services.indexes import ensure_collection_indexes
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 import secrets
 import string
 from datetime import datetime
 
-def check_usage(user_id: str, email: str):
+FREE_LIMIT = 2
+PRO_LIMIT = 1000
+
+
+async def ensure_usage_indexes():
     """
-    Validates that the user is allowed to generate content and ensures they exist in the DB.
-    Does NOT increment — call increment_usage() only after a successful generation.
-    Raises Exception with "Free limit reached" or "Pro limit reached" if over quota.
+    Unique index on user_id (see services/indexes.py). reserve_usage() relies on it:
+    an upsert against a user who is over quota must fail with a duplicate key,
+    not create a twin record. Built at most once per process; a failed build is
+    logged there and does not fail requests. Returns whether the index is in place.
     """
-    try:
-        collection = db["user_usage"]
-        user = collection.find_one({"user_id": user_id})
+    return await ensure_collection_indexes("user_usage")
 
-        if not user:
-            print(f"New user {user_id}, creating record...")
-            collection.insert_one({
-                "user_id": user_id,
-                "email": email,
-                "usage_count": 0,
-                "is_pro": False,
-                "created_at": datetime.utcnow()
-            })
-            usage_count = 0
-            is_pro = False
-        else:
-            usage_count = user.get("usage_count", 0)
-            is_pro = user.get("is_pro", False)
 
-        if is_pro:
-            if usage_count >= 1000:
-                raise Exception("Pro limit reached (1000/month)")
-        else:
-            if usage_count >= 2:
-                raise Exception("Free limit reached")
+def _limit_message(is_pro: bool) -> str:
+    return f"Pro limit reached ({PRO_LIMIT}/month)" if is_pro else "Free limit reached"
 
-        return True
 
-    except Exception as e:
-        if "limit reached" in str(e):
-            raise e
-        print(f"Db Error in check_usage: {e}")
-        raise Exception(f"Database error: {str(e)}")
+def _over_limit(user: dict, amount: int = 1) -> bool:
+    limit = PRO_LIMIT if user.get("is_pro") else FREE_LIMIT
+    return user.get("usage_count", 0) + amount > limit
+
 
+def _within_limit(user_id: str, amount: int) -> dict:
+    """Filter matching the user's record only if `amount` more stays within their plan."""
+    return {
+        "user_id": user_id,
+        "$or": [
+            {"is_pro": True, "usage_count": {"$lte": PRO_LIMIT - amount}},
+            {"is_pro": {"$ne": True}, "usage_count": {"$lte": FREE_LIMIT - amount}}
+        ]
+    }
+
+
+async def _reserve_unindexed(user_id: str, email: str, amount: int):
+    """
+    reserve_usage() while the unique user_id index is missing. An upsert would
+    then insert a twin record instead of failing with a duplicate key, so only
+    an existing record is updated, and a new one is inserted only when the user
+    has none. Returns the reserved record, or None if the user is over quota.
+    """
+    collection = db["user_usage"]
+    user = await collection.find_one_and_update(
+        _within_limit(user_id, amount),
+        {"$inc": {"usage_count": amount}},
+        return_document=ReturnDocument.AFTER
+    )
+    if user or await collection.find_one({"user_id": user_id}, {"_id": 1}):
+        return user
+    user = {
+        "user_id": user_id,
+        "email": email,
+        "usage_count": amount,
+        "is_pro": False,
+        "created_at": datetime.utcnow()
+    }
+    await collection.insert_one(user)
+    return user
+
+
+async def reserve_usage(user_id: str, email: str, amount: int = 1):
+    """
+    Atomically reserves `amount` generations in ONE round trip.
+    A single conditional upsert increments usage_count only if the user stays
+    within their plan limit, and creates the record for first-time users.
+    Concurrent requests cannot both squeeze past the limit.
+    If the unique user_id index couldn't be built, the upsert is unsafe and
+    _reserve_unindexed() is used instead.
+    Call release_usage() if the generation fails, commit_usage() when it succeeds.
+    Returns the user record after the reservation.
+    Raises Exception with "Free limit reached" or "Pro limit reached" if over quota.
+    """
+    # Users we recently saw at their limit are turned away from memory
+    cached = get_cached_user(user_id)
+    if cached and _over_limit(cached, amount):
+        raise Exception(_limit_message(bool(cached.get("is_pro"))))
 
-def increment_usage(user_id: str):
-    """Increments usage count after a successful generation."""
     try:
-        db["user_usage"].update_one(
-            {"user_id": user_id},
-            {"$inc": {"usage_count": 1}}
-        )
+        if await ensure_usage_indexes():
+            user = await db["user_usage"].find_one_and_update(
+                _within_limit(user_id, amount),
+                {
+                    "$inc": {"usage_count": amount},
+                    "$setOnInsert": {"email": email, "is_pro": False, "created_at": datetime.utcnow()}
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        else:
+            user = await _reserve_unindexed(user_id, email, amount)
+    except DuplicateKeyError:
+        user = None
     except Exception as e:
-        print(f"Failed to increment usage for {user_id}: {e}")
+        print(f"Db Error in reserve_usage: {e}")
+        raise Exception(f"Database error: {str(e)}")
+
+    if user is None:
+        # The record exists but the filter didn't match: over quota
+        existing = await db["user_usage"].find_one({"user_id": user_id})
+        put_user(existing)
+        raise Exception(_limit_message(bool(existing and existing.get("is_pro"))))
+
+    # A brand-new user asking for more than the free plan allows in one go
+    if not user.get("is_pro") and user.get("usage_count", 0) > FREE_LIMIT:
+        await release_usage(user_id, amount)
+        raise Exception(_limit_message(False))
 
+    put_user(user)
+    return user
 
-def check_and_increment_usage(user_id: str, email: str):
-    """Kept for backwards compatibility. Prefer check_usage + increment_usage."""
-    check_usage(user_id, email)
-    increment_usage(user_id)
+
+async def commit_usage(user_id: str, amount: int = 1):
+    """
+    Intentionally a no-op hook: the slot was already counted by reserve_usage(),
+    so there is nothing to write. Callers still call it so the success path is
+    explicit, and so settling (e.g. billing or audit) has one place to go.
+    """
     return True
 
 
+async def release_usage(user_id: str, amount: int = 1):
+    """Gives back reserved generations after a failure (never drops below zero)."""
+    invalidate_user(user_id=user_id)
+    try:
+        user = await db["user_usage"].find_one_and_update(
+            {"user_id": user_id, "usage_count": {"$gte": amount}},
+            {"$inc": {"usage_count": -amount}},
+            return_document=ReturnDocument.AFTER
+        )
+        put_user(user)
+    except Exception as e:
+        print(f"Failed to release usage for {user_id}: {e}")
+
+
 def generate_random_password(length=16):
     chars = string.ascii_letters + string.digits + "!@#$%"
     return ''.join(secrets.choice(chars) for _ in range(length))
 
 
-def handle_subscription_update(email: str, is_pro: bool, subscription_id: str = None, license_key: str = None):
+async def handle_subscription_update(email: str, is_pro: bool, subscription_id: str = None, license_key: str = None):
     """
     Updates the user's pro status based on Gumroad events.
     Finds user by email in user_usage.
@@ -78,7 +157,7 @@ def handle_subscription_update(email: str, is_pro: bool, subscription_id: str =
         collection = db["user_usage"]
 
         # 1. Try to find in user_usage
-        user = collection.find_one({"email": email})
+        user = await collection.find_one({"email": email})
 
         if user:
             user_id = user["user_id"]
@@ -89,10 +168,12 @@ def handle_subscription_update(email: str, is_pro: bool, subscription_id: str =
             if license_key:
                 update_data["gumroad_license_key"] = license_key
 
-            collection.update_one(
+            await collection.update_one(
                 {"user_id": user_id},
                 {"$set": update_data}
             )
+            # Pro status flipped: don't let a cached record serve the old plan
+            invalidate_user(user_id=user_id, email=email)
             print("Updated user_usage successfully.")
             return True
 
@@ -113,7 +194,8 @@ def handle_subscription_update(email: str, is_pro: bool, subscription_id: str =
                 "created_at": datetime.utcnow()
             }
 
-            collection.insert_one(insert_data)
+            await collection.insert_one(insert_data)
+            invalidate_user(email=email)
             print(f"Created new user {new_user_id} for {email}")
             return True
 
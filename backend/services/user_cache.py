@@ -0,0 +1,71 @@
+import os
+import copy
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+from services.database import db
+from services.metrics import record_cache
+
+load_dotenv()
+
+# Short-lived, per-process copy of user_usage records.
+# Quota writes refresh it (write-through), Gumroad events and releases
+# invalidate it, and the TTL bounds staleness between worker processes.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "15"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+
+_entries = OrderedDict()  # user_id -> (expires_at, record)
+_ids_by_email = {}
+
+
+def get_cached_user(user_id: str):
+    """Returns a copy of the cached record, or None if missing/expired."""
+    entry = _entries.get(user_id)
+    if not entry:
+        return None
+    expires_at, record = entry
+    if expires_at <= time.monotonic():
+        invalidate_user(user_id=user_id)
+        return None
+    _entries.move_to_end(user_id)
+    return copy.deepcopy(record)
+
+
+def put_user(record: dict):
+    """Write-through from any path that just read or modified the record."""
+    if not record or "user_id" not in record:
+        return
+    user_id = record["user_id"]
+    _entries[user_id] = (time.monotonic() + USER_CACHE_TTL_SECONDS, copy.deepcopy(record))
+    _entries.move_to_end(user_id)
+    if record.get("email"):
+        _ids_by_email[record["email"]] = user_id
+    while len(_entries) > USER_CACHE_MAX_ENTRIES:
+        evicted_id, (_, evicted) = _entries.popitem(last=False)
+        if evicted.get("email"):
+            _ids_by_email.pop(evicted["email"], None)
+
+
+def invalidate_user(user_id: str = None, email: str = None):
+    """Drops a user by id and/or email (e.g. after a Pro upgrade or refund)."""
+    if email and not user_id:
+        user_id = _ids_by_email.get(email)
+    if email:
+        _ids_by_email.pop(email, None)
+    if user_id:
+        entry = _entries.pop(user_id, None)
+        if entry and entry[1].get("email"):
+            _ids_by_email.pop(entry[1]["email"], None)
+
+
+async def get_user(user_id: str):
+    """Cached read of a user_usage record. Returns None if the user doesn't exist."""
+    record = get_cached_user(user_id)
+    record_cache("user", record is not None)
+    if record is not None:
+        return record
+    record = await db["user_usage"].find_one({"user_id": user_id})
+    if record:
+        put_user(record)
+    return record
@@ -0,0 +1,24 @@
+import os
+import sys
+import pytest
+
+# Tests run against the in-memory Mongo stand-in from benchmarks/, installed
+# before any service module binds services.database.db.
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+os.environ.setdefault("MONGODB_URI", "mongodb://test.invalid")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+from services import database
+from benchmarks.fake_mongo import install
+
+_sync_db = install(database)
+
+
+@pytest.fixture
+def mongo():
+    """The synchronous view of the in-memory database, emptied after each test."""
+    yield _sync_db
+    for name in _sync_db.list_collection_names():
+        _sync_db.drop_collection(name)
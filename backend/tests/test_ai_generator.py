@@ -0,0 +1,106 @@
+import asyncio
+
+import pytest
+
+from services import ai_generator
+from services.generation_cache import make_cache_key
+from services.resilience import CircuitOpenError
+
+
+def test_prompt_cache_is_bounded_by_supported_tones():
+    ai_generator._build_system_prompt.cache_clear()
+    for i in range(500):
+        ai_generator.get_system_prompt(f"tone {i}")
+    for tone in ai_generator.TONES:
+        ai_generator.get_system_prompt(tone)
+        ai_generator.get_system_prompt(tone, ("slides", "twitter_thread"))
+
+    info = ai_generator._build_system_prompt.cache_info()
+    assert info.currsize == 2 * len(ai_generator.TONES)
+    assert ai_generator.get_system_prompt("whatever") == ai_generator.get_system_prompt("Educator")
+    assert ai_generator.get_system_prompt("Hype Man") != ai_generator.get_system_prompt("Educator")
+
+
+def test_unsupported_tones_share_the_default_cache_key():
+    key = make_cache_key("o/r", "sha", "Educator", "deep")
+    assert make_cache_key("o/r", "sha", "made up", "deep") == key
+    assert make_cache_key("o/r", "sha", "Senior Dev", "deep") != key
+
+
+def _fake_complete(monkeypatch, replies):
+    """_complete() answering from per-section queues of replies (text or exception)."""
+    calls = []
+
+    async def complete(user_message, tone, sections):
+        calls.append(sections)
+        reply = replies[sections].pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        return reply
+
+    monkeypatch.setattr(ai_generator, "_complete", complete)
+    return calls
+
+
+def test_failed_section_is_retried(monkeypatch):
+    calls = _fake_complete(monkeypatch, {
+        ("twitter_thread",): ['{"twitter_thread": "thread"}'],
+        ("blog_intro",): [RuntimeError("timeout"), '{"blog_intro": "intro"}']
+    })
+    content = asyncio.run(ai_generator.generate_viral_content("readme", sections=["twitter_thread", "blog_intro"]))
+    assert content == {"twitter_thread": "thread", "blog_intro": "intro"}
+    assert calls.count(("blog_intro",)) == 2
+    assert calls.count(("twitter_thread",)) == 1
+
+
+def test_section_still_missing_after_retry_fails_the_generation(monkeypatch):
+    _fake_complete(monkeypatch, {
+        ("twitter_thread",): ['{"twitter_thread": "thread"}'],
+        # Unparseable, then valid JSON without the requested key
+        ("blog_intro",): ['{"blog_intro": "cut off', '{"something_else": 1}']
+    })
+    content = asyncio.run(ai_generator.generate_viral_content("readme", sections=["twitter_thread", "blog_intro"]))
+    assert content is None
+
+
+def test_open_breaker_is_raised_not_retried(monkeypatch):
+    calls = _fake_complete(monkeypatch, {
+        ("twitter_thread",): ['{"twitter_thread": "thread"}'],
+        ("blog_intro",): [CircuitOpenError("openai", 5)]
+    })
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(ai_generator.generate_viral_content("readme", sections=["twitter_thread", "blog_intro"]))
+    assert calls.count(("blog_intro",)) == 1
+
+
+def test_generation_slot_is_free_during_retry_backoff(monkeypatch):
+    from types import SimpleNamespace
+    import httpx
+    from openai import APIConnectionError
+    from services import resilience
+
+    resilience._breakers.pop("openai", None)
+    monkeypatch.setattr(resilience, "backoff_delay", lambda attempt: 0.2)
+    attempts = []
+
+    async def create(**kwargs):
+        attempts.append(kwargs)
+        if len(attempts) == 1:
+            raise APIConnectionError(request=httpx.Request("POST", "https://api.openai.com"))
+        return SimpleNamespace(usage=None, choices=[SimpleNamespace(message=SimpleNamespace(content="{}"))])
+
+    monkeypatch.setattr(ai_generator.client.chat.completions, "create", create)
+
+    async def scenario():
+        monkeypatch.setattr(ai_generator, "_generation_slots", asyncio.Semaphore(1))
+        task = asyncio.create_task(ai_generator._complete("readme", "Educator", ("blog_intro",)))
+        while not attempts:
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        # The first attempt failed and the call is backing off: the slot must be free
+        await asyncio.wait_for(ai_generator._generation_slots.acquire(), timeout=0.1)
+        ai_generator._generation_slots.release()
+        return await task
+
+    assert asyncio.run(scenario()) == "{}"
+    assert len(attempts) == 2
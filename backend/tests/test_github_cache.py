@@ -0,0 +1,69 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import httpx
+
+from services import github_cache
+
+
+def _entry(size: int) -> dict:
+    return {"etag": '"e"', "body": b"x" * size, "content_type": "application/json"}
+
+
+def test_lru_is_bounded_by_total_bytes(monkeypatch):
+    monkeypatch.setattr(github_cache, "_lru", github_cache.OrderedDict())
+    monkeypatch.setattr(github_cache, "_lru_bytes", 0)
+    monkeypatch.setattr(github_cache, "GITHUB_CACHE_LRU_BYTES", 1000)
+    monkeypatch.setattr(github_cache, "GITHUB_CACHE_LRU_MAX_ENTRY_BYTES", 400)
+
+    for i in range(5):
+        github_cache._lru_put(f"k{i}", _entry(300))
+
+    assert list(github_cache._lru) == ["k2", "k3", "k4"]
+    assert github_cache._lru_bytes == 900
+
+
+def test_large_bodies_are_not_kept_in_memory(monkeypatch):
+    monkeypatch.setattr(github_cache, "_lru", github_cache.OrderedDict())
+    monkeypatch.setattr(github_cache, "_lru_bytes", 0)
+    monkeypatch.setattr(github_cache, "GITHUB_CACHE_LRU_MAX_ENTRY_BYTES", 400)
+
+    github_cache._lru_put("small", _entry(100))
+    github_cache._lru_put("small", _entry(500))
+
+    # Replacing an entry with an oversized body drops it and its byte count
+    assert "small" not in github_cache._lru
+    assert github_cache._lru_bytes == 0
+
+
+def test_revalidation_keeps_the_entry_alive(monkeypatch, mongo):
+    monkeypatch.setattr(github_cache, "_lru", github_cache.OrderedDict())
+    monkeypatch.setattr(github_cache, "_lru_bytes", 0)
+    url = "https://api.github.com/repos/o/r"
+    key = github_cache._cache_key(url, {})
+    stale = datetime.utcnow() - timedelta(days=20)
+    mongo[github_cache.CACHE_COLLECTION].insert_one(
+        {"_id": key, "url": url, "etag": '"e"', "body": b"{}", "content_type": "application/json", "updated_at": stale}
+    )
+    writes = []
+    update_one = github_cache.db[github_cache.CACHE_COLLECTION].update_one
+
+    async def counting_update_one(*args, **kwargs):
+        writes.append(args)
+        return await update_one(*args, **kwargs)
+
+    monkeypatch.setattr(github_cache.db[github_cache.CACHE_COLLECTION], "update_one", counting_update_one)
+
+    async def scenario():
+        transport = httpx.MockTransport(lambda request: httpx.Response(304))
+        async with httpx.AsyncClient(transport=transport) as client:
+            for _ in range(3):
+                resp = await github_cache.cached_get(client, url)
+                assert resp.status_code == 200 and resp.json() == {}
+
+    asyncio.run(scenario())
+
+    updated_at = mongo[github_cache.CACHE_COLLECTION].find_one({"_id": key})["updated_at"]
+    assert updated_at > stale + timedelta(days=19)
+    # Throttled: one write for three revalidations
+    assert len(writes) == 1
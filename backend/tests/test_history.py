@@ -0,0 +1,61 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+import main
+
+
+def _seed(mongo):
+    base = datetime(2026, 1, 1)
+    docs = []
+    # Pairs share a created_at so the _id tiebreak is exercised
+    for i in range(7):
+        docs.append({
+            "_id": ObjectId(),
+            "user_id": "u1",
+            "repo_url": f"https://github.com/o/r{i}",
+            "platform": "twitter",
+            "tone_used": "professional",
+            "created_at": base + timedelta(minutes=i // 2),
+            "generated_content": {"twitter_thread": "t" * 200, "repo_stats": {"stars": i}}
+        })
+    mongo["content_history"].insert_many(docs)
+    mongo["content_history"].insert_one({"user_id": "other", "created_at": base, "generated_content": {}})
+    return sorted(docs, key=lambda d: (d["created_at"], d["_id"]), reverse=True)
+
+
+def test_cursor_pages_cover_history_once_in_order(mongo):
+    expected = [str(d["_id"]) for d in _seed(mongo)]
+
+    async def walk():
+        seen, cursor = [], None
+        while True:
+            page = await main.get_user_history("u1", limit=2, cursor=cursor)
+            assert len(page["items"]) <= 2
+            seen.extend(item["id"] for item in page["items"])
+            cursor = page["next_cursor"]
+            if cursor is None:
+                return seen
+
+    assert asyncio.run(walk()) == expected
+
+
+def test_summary_view_projects_a_short_preview(mongo):
+    _seed(mongo)
+    page = asyncio.run(main.get_user_history("u1", limit=1))
+    item = page["items"][0]
+    assert "generated_content" not in item
+    assert item["preview"] == "t" * 150
+    assert item["repo_stats"] == {"stars": 6}
+
+    full = asyncio.run(main.get_user_history("u1", limit=1, view="full"))
+    assert full["items"][0]["generated_content"]["twitter_thread"] == "t" * 200
+
+
+def test_invalid_cursor_is_a_400(mongo):
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(main.get_user_history("u1", cursor="not-a-cursor"))
+    assert exc.value.status_code == 400
@@ -0,0 +1,33 @@
+import asyncio
+
+from services import history_writer
+
+
+def test_batch_cut_off_by_drain_timeout_is_spilled(mongo, monkeypatch, tmp_path):
+    spill = tmp_path / "spill.jsonl"
+    monkeypatch.setattr(history_writer, "HISTORY_SPILL_PATH", str(spill))
+    monkeypatch.setattr(history_writer, "HISTORY_DRAIN_TIMEOUT_SECONDS", 0.1)
+    monkeypatch.setattr(history_writer, "HISTORY_FLUSH_INTERVAL_SECONDS", 0.01)
+    inserting = []
+
+    async def unreachable_mongo(records, ordered=True):
+        inserting.append(len(records))
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(history_writer.db[history_writer.HISTORY_COLLECTION], "insert_many", unreachable_mongo)
+
+    async def scenario():
+        await history_writer.start_history_writer()
+        await history_writer.record_history({"user_id": "u1", "n": 1})
+        await history_writer.record_history({"user_id": "u1", "n": 2})
+        while not inserting:
+            await asyncio.sleep(0.01)
+        # Queued behind the stuck insert
+        await history_writer.record_history({"user_id": "u1", "n": 3})
+        await history_writer.stop_history_writer()
+
+    asyncio.run(scenario())
+
+    assert inserting == [2]
+    spilled = sorted(record["n"] for record in history_writer._read_spill())
+    assert spilled == [1, 2, 3]
@@ -0,0 +1,64 @@
+import asyncio
+
+from services import job_queue
+from services.job_queue import JobFailed
+
+
+def _stored_payload(mongo, job_id):
+    return mongo[job_queue.JOBS_COLLECTION].find_one({"_id": job_queue.parse_job_id(job_id)})["payload"]
+
+
+def test_token_is_only_stored_while_the_job_waits(mongo):
+    async def scenario():
+        job_id = await job_queue.enqueue_job("deep", "u1", {"repo_url": "https://github.com/o/r", "github_token": "secret"})
+        assert _stored_payload(mongo, job_id)["github_token"] == "secret"
+
+        job = await job_queue.claim_job("w1")
+        assert job["payload"]["github_token"] == "secret"
+        assert job["status"] == job_queue.RUNNING and job["attempts"] == 1
+        assert "github_token" not in _stored_payload(mongo, job_id)
+
+        # A retry needs the token again
+        assert await job_queue.fail_job(job, "w1", JobFailed("upstream", 502)) == job_queue.QUEUED
+        assert _stored_payload(mongo, job_id)["github_token"] == "secret"
+
+        mongo[job_queue.JOBS_COLLECTION].update_one({"_id": job["_id"]}, {"$set": {"available_at": job["created_at"]}})
+        job = await job_queue.claim_job("w1")
+        assert job["attempts"] == 2
+        assert await job_queue.complete_job(job["_id"], "w1", {"ok": True})
+        assert "github_token" not in _stored_payload(mongo, job_id)
+
+        status = await job_queue.get_job(job_id, "u1")
+        assert "payload" not in status and status["status"] == job_queue.SUCCEEDED
+
+    asyncio.run(scenario())
+
+
+def test_final_failure_keeps_the_token_out(mongo):
+    async def scenario():
+        job_id = await job_queue.enqueue_job("deep", "u1", {"github_token": "secret"})
+        job = await job_queue.claim_job("w1")
+        assert await job_queue.fail_job(job, "w1", JobFailed("bad repo", 404, retryable=False)) == job_queue.FAILED
+        assert "github_token" not in _stored_payload(mongo, job_id)
+
+    asyncio.run(scenario())
+
+
+def test_lease_survives_a_failed_extension(mongo, monkeypatch):
+    monkeypatch.setattr(job_queue, "JOB_VISIBILITY_TIMEOUT_SECONDS", 0.03)
+    calls = []
+
+    async def flaky_extend(job_id, worker_id):
+        calls.append(job_id)
+        if len(calls) == 1:
+            raise ConnectionError("primary stepped down")
+        return len(calls) < 4
+
+    monkeypatch.setattr(job_queue, "extend_lease", flaky_extend)
+
+    async def scenario():
+        await asyncio.wait_for(job_queue._keep_lease("job", "w1"), timeout=5)
+
+    # Keeps extending after the error and stops only once the lease is lost
+    asyncio.run(scenario())
+    assert len(calls) == 4
@@ -0,0 +1,42 @@
+from services.repo_index import FileTreeIndex
+from services.deep_analyser import DETECTORS
+
+
+def test_root_readme_survives_bucket_limit():
+    nested = [f"packages/pkg{i}/README.md" for i in range(60)]
+    index = FileTreeIndex.build(nested + ["README.md", "requirements.txt"], DETECTORS, bucket_limit=50)
+
+    found = DETECTORS.resolve(index)
+
+    assert "README.md" in found["readme"]
+    assert found["readme"].total == 61
+    assert "packages/pkg59/README.md" not in found["readme"]
+
+
+def test_results_keep_tree_order():
+    index = FileTreeIndex.build(["b/models.py", "models.py", "a/models.py"], DETECTORS)
+
+    assert list(DETECTORS.resolve(index)["models"]) == ["b/models.py", "models.py", "a/models.py"]
+
+
+def test_unmatched_paths_are_only_counted():
+    paths = [f"src/pkg{i}/module_{i}.rs" for i in range(5000)]
+    index = FileTreeIndex.build(paths + ["Cargo.toml", "tests/test_a.py"], DETECTORS, keep_paths=10, bucket_limit=50)
+
+    assert index.count == 5002
+    assert len(index.paths) == 10
+    assert sum(len(hits) for hits in index.hits.values()) <= 3
+    found = DETECTORS.resolve(index)
+    assert list(found["rust"]) == ["Cargo.toml"]
+    assert found["tests"].total == 1
+    assert not found["workflows"]
+
+
+def test_each_detector_keeps_at_most_bucket_limit_matches():
+    paths = [f"tests/test_{i}.py" for i in range(500)] + [".github/workflows/ci.yml"]
+    index = FileTreeIndex.build(paths, DETECTORS, bucket_limit=50)
+
+    found = DETECTORS.resolve(index)
+    assert found["tests"].total == 500
+    assert len(found["tests"]) == 50
+    assert list(found["workflows"]) == [".github/workflows/ci.yml"]
@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError
+
+
+def _opened(reset_seconds=60, threshold=2, due=True):
+    """A breaker that just opened, or (due=True) one whose reset time is already up."""
+    breaker = CircuitBreaker("test", threshold=threshold, reset_seconds=reset_seconds)
+    for _ in range(threshold):
+        breaker.before_call()
+        breaker.record_failure()
+    if due:
+        breaker.opened_at -= reset_seconds
+    return breaker
+
+
+def test_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker("test", threshold=3, reset_seconds=60)
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_success()
+    assert breaker.failures == 0
+
+    for _ in range(3):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = _opened()
+    assert breaker.before_call() is True
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.before_call() is False
+
+
+def test_failed_probe_reopens():
+    breaker = _opened()
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_lost_probe_expires_after_a_reset_period():
+    breaker = _opened(reset_seconds=0.01, due=False)
+    time.sleep(0.02)
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.02)
+    # The first probe never reported back
+    assert breaker.before_call() is True
+
+
+def test_cancelled_probe_in_retry_call_frees_the_slot(monkeypatch):
+    breaker = _opened()
+    monkeypatch.setitem(resilience._breakers, "test", breaker)
+
+    async def scenario():
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.Event().wait()
+
+        probe = asyncio.create_task(resilience.retry_call("test", hang, lambda e: (False, None, True)))
+        await started.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        async def ok():
+            return "ok"
+
+        return await resilience.retry_call("test", ok, lambda e: (False, None, True))
+
+    assert asyncio.run(scenario()) == "ok"
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_cancelled_probe_in_transport_frees_the_slot(monkeypatch):
+    breaker = _opened()
+    monkeypatch.setitem(resilience._breakers, "github:api.test", breaker)
+    hang = {"on": True}
+
+    async def handler(request):
+        if hang["on"]:
+            await asyncio.Event().wait()
+        return httpx.Response(200)
+
+    async def scenario():
+        transport = resilience.ResilientTransport(httpx.MockTransport(handler), "github")
+        request = httpx.Request("GET", "https://api.test/x")
+        probe = asyncio.create_task(transport.handle_async_request(request))
+        await asyncio.sleep(0)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        hang["on"] = False
+        return await transport.handle_async_request(request)
+
+    assert asyncio.run(scenario()).status_code == 200
+    assert breaker.state == CircuitBreaker.CLOSED
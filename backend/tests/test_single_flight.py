@@ -0,0 +1,85 @@
+import asyncio
+
+import pytest
+
+from services.single_flight import SingleFlight
+
+
+def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"value": [1]}
+
+    async def scenario():
+        results = await asyncio.gather(*(flight.do("k", work) for _ in range(5)))
+        assert not flight.in_flight("k")
+        return results
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert [shared for _, shared in results].count(False) == 1
+    leader = next(result for result, shared in results if not shared)
+    for result, shared in results:
+        assert result == {"value": [1]}
+        # Followers get their own copy
+        if shared:
+            assert result is not leader
+
+
+def test_none_key_and_finished_keys_run_again():
+    flight = SingleFlight()
+    calls = []
+
+    async def work():
+        calls.append(1)
+        return len(calls)
+
+    async def scenario():
+        assert await flight.do(None, work) == (1, False)
+        assert not flight.in_flight(None)
+        assert await flight.do("k", work) == (2, False)
+        assert await flight.do("k", work) == (3, False)
+
+    asyncio.run(scenario())
+
+
+def test_errors_reach_every_caller_and_clear_the_key():
+    flight = SingleFlight()
+
+    async def boom():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream")
+
+    async def scenario():
+        results = await asyncio.gather(flight.do("k", boom), flight.do("k", boom), return_exceptions=True)
+        assert all(isinstance(r, ValueError) for r in results)
+        assert not flight.in_flight("k")
+
+    asyncio.run(scenario())
+
+
+def test_cancelled_leader_does_not_cancel_the_work():
+    flight = SingleFlight()
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def work():
+            await gate.wait()
+            return "done"
+
+        leader = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        follower = asyncio.create_task(flight.do("k", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await leader
+        assert flight.in_flight("k")
+        gate.set()
+        assert await follower == ("done", True)
+
+    asyncio.run(scenario())
@@ -0,0 +1,88 @@
+import asyncio
+from collections import OrderedDict
+
+import anyio
+import pytest
+
+import main
+from services import user_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_user_cache(monkeypatch):
+    monkeypatch.setattr(user_cache, "_entries", OrderedDict())
+    monkeypatch.setattr(user_cache, "_ids_by_email", {})
+
+
+async def _no_cache_key(*args, **kwargs):
+    return None
+
+
+async def _hanging_analysis(repo_url, github_token, analysis_mode, on_stage):
+    on_stage("repo_info", {})
+    await asyncio.Event().wait()
+
+
+async def _disconnect_after_first_chunk(body):
+    """Consumes a streaming body the way StreamingResponse does, then cancels it like a disconnect."""
+    received = anyio.Event()
+
+    async def consume():
+        async for _ in body:
+            received.set()
+
+    async with anyio.create_task_group() as tg:
+        tg.start_soon(consume)
+        await received.wait()
+        tg.cancel_scope.cancel()
+
+
+def _usage(mongo):
+    return mongo["user_usage"].find_one({"user_id": "u1"})["usage_count"]
+
+
+def test_deep_stream_releases_quota_when_client_disconnects(mongo, monkeypatch):
+    monkeypatch.setattr(main, "build_cache_key", _no_cache_key)
+    monkeypatch.setattr(main, "analyze_repo_structure", _hanging_analysis)
+    request = main.AnalyzeRequest(repo_url="https://github.com/o/r", github_token="t", user_id="u1", email="u1@example.com")
+
+    async def scenario():
+        await main.reserve_quota("u1", "u1@example.com")
+        assert _usage(mongo) == 1
+        await _disconnect_after_first_chunk(main.stream_deep(request))
+
+    asyncio.run(scenario())
+    assert _usage(mongo) == 0
+
+
+def test_batch_stream_refunds_unfinished_repos_when_client_disconnects(mongo, monkeypatch):
+    async def generate_deep(item, response):
+        if item.repo_url.endswith("/fast"):
+            return {"twitter_thread": "ok"}
+        await asyncio.Event().wait()
+
+    monkeypatch.setattr(main, "generate_deep", generate_deep)
+    repo_urls = ["https://github.com/o/fast", "https://github.com/o/slow1", "https://github.com/o/slow2"]
+    request = main.BatchAnalyzeRequest(repo_urls=repo_urls, github_token="t", user_id="u1", email="u1@example.com")
+    mongo["user_usage"].insert_one({"user_id": "u1", "email": "u1@example.com", "usage_count": 0, "is_pro": True})
+
+    async def scenario():
+        await main.reserve_usage("u1", "u1@example.com", amount=3)
+        assert _usage(mongo) == 3
+        body = main.stream_batch(request, repo_urls)
+        received = []
+
+        async def consume():
+            async for chunk in body:
+                received.append(chunk)
+
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(consume)
+            while len(received) < 2:
+                await anyio.sleep(0.001)
+            tg.cancel_scope.cancel()
+        assert '"type": "result"' in received[1]
+
+    asyncio.run(scenario())
+    # The finished repo stays charged; the two that never finished are refunded
+    assert _usage(mongo) == 1
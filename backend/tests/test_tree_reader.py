@@ -0,0 +1,151 @@
+import json
+import asyncio
+import tracemalloc
+import httpx
+from services import github_cache, tree_reader
+from services.tree_reader import read_tree, PathSample
+from services.repo_index import FileTreeIndex
+from services.deep_analyser import DETECTORS, DEEP_TREE_KEEP_PATHS, DEEP_TREE_BUCKET_LIMIT
+
+# Directory tree served by the fake GitHub below. Listings truncated after
+# their first entry when recursive, to force the subtree walk.
+TREE = {"a": {"1": None, "2": None}, "b": {"2": None, "x": {"1": None}}, "c.txt": None}
+TRUNCATED = {"", "b"}
+FULL_ORDER = ["a/1", "a/2", "b/2", "b/x/1", "c.txt"]
+
+
+def _node(path: str):
+    node = TREE
+    for part in filter(None, path.split("/")):
+        node = node[part]
+    return node
+
+
+def _entries(path: str, recursive: bool):
+    for name, child in sorted(_node(path).items()):
+        full = f"{path}/{name}" if path else name
+        if child is None:
+            yield {"path": name, "type": "blob", "sha": "b-" + full}
+        else:
+            yield {"path": name, "type": "tree", "sha": "t-" + full.replace("/", ":")}
+            if recursive:
+                for sub in _entries(full, True):
+                    yield dict(sub, path=f"{name}/{sub['path']}")
+
+
+def _chunked(body: bytes, size: int):
+    async def chunks():
+        for i in range(0, len(body), size):
+            yield body[i:i + size]
+    return chunks()
+
+
+def make_client(log, chunk_size=7, truncated_paths=TRUNCATED):
+    def handler(request: httpx.Request) -> httpx.Response:
+        ref = request.url.path.rsplit("/", 1)[-1]
+        path = "" if ref == "main" else ref[2:].replace(":", "/")
+        recursive = "recursive" in request.url.params
+        log.append(("fetch", path, recursive))
+        entries = list(_entries(path, recursive))
+        truncated = recursive and path in truncated_paths
+        if truncated:
+            entries = entries[:1]
+        body = json.dumps({"sha": ref, "tree": entries, "truncated": truncated}).encode("utf-8")
+        return httpx.Response(200, content=_chunked(body, chunk_size))
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def test_tree_split_across_chunks(monkeypatch, mongo):
+    monkeypatch.setattr(github_cache, "GITHUB_CACHE_ENABLED", False)
+
+    async def run(chunk_size):
+        async with make_client([], chunk_size, truncated_paths=set()) as client:
+            return await read_tree(client, "o", "r", "main", {}, lambda: PathSample(100))
+
+    # Tiny chunks split tokens mid-string; one huge chunk is the single-read case
+    for chunk_size in (1, 7, 64, 1 << 20):
+        sink, truncated = asyncio.run(run(chunk_size))
+        assert sink.paths == FULL_ORDER
+        assert truncated is False
+
+
+def test_truncated_tree_is_walked_in_listing_order(monkeypatch, mongo):
+    monkeypatch.setattr(github_cache, "GITHUB_CACHE_ENABLED", False)
+    monkeypatch.setattr(tree_reader, "TREE_WALK_CONCURRENCY", 1)
+    log = []
+
+    class Sink(PathSample):
+        def add(self, path):
+            log.append(("emit", path))
+            super().add(path)
+
+    async def run():
+        async with make_client(log) as client:
+            return await read_tree(client, "o", "r", "main", {}, lambda: Sink(100))
+
+    sink, truncated = asyncio.run(run())
+
+    assert truncated is True
+    assert sink.paths == FULL_ORDER
+    # Subtree a is emitted before the walk moves on to fetch b
+    walk = log[log.index(("fetch", "", False)):]
+    assert walk.index(("emit", "a/2")) < walk.index(("fetch", "b", True))
+
+
+def _wide_tree_client(dirs: int, files_per_dir: int):
+    """Fake GitHub for a repo of `dirs` top-level packages whose recursive root listing is truncated."""
+    def handler(request: httpx.Request) -> httpx.Response:
+        ref = request.url.path.rsplit("/", 1)[-1]
+        recursive = "recursive" in request.url.params
+        if ref != "main":
+            names = [(f"module_{i}.py", "blob") for i in range(files_per_dir)]
+        elif recursive:
+            names = [(f"pkg0/module_{i}.py", "blob") for i in range(files_per_dir)]
+        else:
+            names = [(f"pkg{d}", "tree") for d in range(dirs)]
+        truncated = ref == "main" and recursive
+
+        async def chunks():
+            # Generated as it is read, like a socket, so only the app's own memory is measured
+            yield b'{"tree": ['
+            for start in range(0, len(names), 250):
+                body = ",".join(
+                    json.dumps({"path": p, "type": t, "sha": "t-" + p if t == "tree" else "b"})
+                    for p, t in names[start:start + 250]
+                )
+                yield (("," if start else "") + body).encode("utf-8")
+            yield b'], "truncated": %s}' % (b"true" if truncated else b"false")
+
+        return httpx.Response(200, content=chunks())
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def _peak_walk_memory(dirs: int, files_per_dir: int) -> int:
+    async def run():
+        async with _wide_tree_client(dirs, files_per_dir) as client:
+            return await read_tree(
+                client, "o", "r", "main", {},
+                lambda: FileTreeIndex(DETECTORS, DEEP_TREE_KEEP_PATHS, DEEP_TREE_BUCKET_LIMIT)
+            )
+
+    tracemalloc.start()
+    try:
+        index, truncated = asyncio.run(run())
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    assert truncated is True
+    assert index.count == dirs * files_per_dir
+    return peak
+
+
+def test_tree_walk_memory_does_not_grow_with_repo_size(monkeypatch, mongo):
+    monkeypatch.setattr(github_cache, "GITHUB_CACHE_ENABLED", False)
+    _peak_walk_memory(2, 10)  # warm up imports and caches outside the measurement
+
+    small = _peak_walk_memory(8, 500)
+    large = _peak_walk_memory(64, 500)
+
+    # 8x the files (32k paths, ~1.8 MB of listings) must not mean 8x the memory:
+    # only the subtrees in the walk window and the index's capped hits are held
+    assert large < small * 1.5, f"{small / 1e6:.2f} MB -> {large / 1e6:.2f} MB"
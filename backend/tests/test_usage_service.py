@@ -0,0 +1,111 @@
+import asyncio
+from collections import OrderedDict
+
+import pytest
+
+from services import indexes, usage_service, user_cache
+
+
+@pytest.fixture(autouse=True)
+def fresh_state(monkeypatch):
+    monkeypatch.setattr(user_cache, "_entries", OrderedDict())
+    monkeypatch.setattr(user_cache, "_ids_by_email", {})
+    monkeypatch.setattr(indexes, "_index_built", {})
+
+
+def _count(mongo, user_id):
+    return mongo["user_usage"].find_one({"user_id": user_id})["usage_count"]
+
+
+def test_reserve_and_release_keep_usage_exact(mongo):
+    async def scenario():
+        await usage_service.reserve_usage("u1", "u1@example.com")
+        await usage_service.reserve_usage("u1", "u1@example.com")
+        with pytest.raises(Exception, match="Free limit reached"):
+            await usage_service.reserve_usage("u1", "u1@example.com")
+        assert _count(mongo, "u1") == 2
+
+        await usage_service.release_usage("u1")
+        assert _count(mongo, "u1") == 1
+        await usage_service.reserve_usage("u1", "u1@example.com")
+        assert _count(mongo, "u1") == 2
+
+    asyncio.run(scenario())
+    assert mongo["user_usage"].count_documents({"user_id": "u1"}) == 1
+
+
+def test_batch_reservation_and_release_never_go_negative(mongo):
+    async def scenario():
+        # A new user asking for more than the free plan in one go gets nothing
+        with pytest.raises(Exception, match="Free limit reached"):
+            await usage_service.reserve_usage("u2", "u2@example.com", amount=3)
+        assert _count(mongo, "u2") == 0
+
+        await usage_service.reserve_usage("u2", "u2@example.com", amount=2)
+        await usage_service.release_usage("u2", amount=5)
+        assert _count(mongo, "u2") == 2
+        await usage_service.release_usage("u2", amount=2)
+        assert _count(mongo, "u2") == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_index_build_is_not_retried_on_the_request_path(mongo, monkeypatch):
+    mongo["user_usage"].insert_many([
+        {"user_id": "dup", "usage_count": 1, "is_pro": False, "email": "a@example.com"},
+        {"user_id": "dup", "usage_count": 1, "is_pro": True, "gumroad_license_key": "key"}
+    ])
+    calls = []
+    create_indexes = indexes.db["user_usage"].create_indexes
+
+    async def counting_create_indexes(models):
+        calls.append(models)
+        return await create_indexes(models)
+
+    monkeypatch.setattr(indexes.db["user_usage"], "create_indexes", counting_create_indexes)
+
+    async def scenario():
+        await usage_service.reserve_usage("u3", "u3@example.com")
+        await usage_service.reserve_usage("u3", "u3@example.com")
+
+    asyncio.run(scenario())
+    assert len(calls) == 1
+    assert _count(mongo, "u3") == 2
+
+    assert indexes.dedupe_users(mongo) == 1
+    assert mongo["user_usage"].count_documents({"user_id": "dup"}) == 2
+    indexes.dedupe_users(mongo, apply=True)
+    merged = list(mongo["user_usage"].find({"user_id": "dup"}))
+    assert len(merged) == 1
+    assert merged[0]["usage_count"] == 2
+    assert merged[0]["is_pro"] is True
+    assert merged[0]["email"] == "a@example.com"
+    assert merged[0]["gumroad_license_key"] == "key"
+    assert indexes.dedupe_users(mongo) == 0
+
+
+def test_reserve_without_unique_index_enforces_the_limit(mongo):
+    mongo["user_usage"].insert_many([
+        {"user_id": "dup", "usage_count": 2, "is_pro": False},
+        {"user_id": "dup", "usage_count": 1, "is_pro": False}
+    ])
+
+    # Duplicates blocking the index: reservations must not upsert more twins
+    async def scenario():
+        granted = 0
+        for user_id in ("dup", "new"):
+            for _ in range(6):
+                try:
+                    await usage_service.reserve_usage(user_id, f"{user_id}@example.com")
+                    granted += 1
+                except Exception as e:
+                    assert "Free limit reached" in str(e)
+                user_cache._entries.clear()
+        return granted
+
+    # One slot left on the "dup" twin below the limit, two for the new user
+    assert asyncio.run(scenario()) == 1 + usage_service.FREE_LIMIT
+    assert indexes._index_built["user_usage"] is False
+    assert mongo["user_usage"].count_documents({"user_id": "dup"}) == 2
+    assert mongo["user_usage"].count_documents({"user_id": "new"}) == 1
+    assert _count(mongo, "new") == usage_service.FREE_LIMIT
@@ -1,9 +1,9 @@
 import sys
-from services.database import db
+from services.database import get_sync_db
 
 
 def toggle_pro_status(email: str, status: bool):
-    collection = db["user_usage"]
+    collection = get_sync_db()["user_usage"]
 
     # Check if user exists in user_usage
     user = collection.find_one({"email": email})
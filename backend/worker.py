@@ -0,0 +1,42 @@
+"""
+Standalone job worker: processes queued analyses outside the API process.
+
+    python worker.py            # JOB_WORKERS concurrent workers (default 2)
+
+Run as many of these as needed; they coordinate through the analysis_jobs
+collection. Set JOB_INPROCESS_WORKERS=0 on the API when workers run here.
+"""
+import os
+import signal
+import asyncio
+
+from main import process_job, finish_job
+from services.database import close_database
+from services.github_client import start_github_client, close_github_client
+from services.history_writer import start_history_writer, stop_history_writer
+from services.indexes import ensure_indexes
+from services.job_queue import run_worker
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+
+
+async def main():
+    await start_github_client()
+    await ensure_indexes()
+    await start_history_writer()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    try:
+        await asyncio.gather(*(run_worker(process_job, finish_job, stop) for _ in range(JOB_WORKERS)))
+    finally:
+        await stop_history_writer()
+        await close_github_client()
+        await close_database()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,25 @@
+import { NextRequest, NextResponse } from "next/server";
+import { getServerSession } from "next-auth";
+import { authOptions } from "@/app/api/auth/[...nextauth]/route";
+
+const BACKEND_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
+
+export async function GET(_request: NextRequest, { params }: { params: Promise<{ id: string }> }) {
+    try {
+        const session = await getServerSession(authOptions);
+        const userId = (session as any)?.userId || session?.user?.id;
+        if (!userId) {
+            return NextResponse.json({ detail: "Unauthorized" }, { status: 401 });
+        }
+
+        const { id } = await params;
+        const res = await fetch(
+            `${BACKEND_URL}/history/${encodeURIComponent(id)}?user_id=${encodeURIComponent(userId)}`
+        );
+        const item = await res.json();
+        return NextResponse.json(item, { status: res.status });
+    } catch (error) {
+        console.error("Error fetching history item:", error);
+        return NextResponse.json({ detail: "Failed to fetch history item" }, { status: 500 });
+    }
+}
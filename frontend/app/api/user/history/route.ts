@@ -1,30 +1,39 @@
-import { NextResponse } from "next/server";
+import { NextRequest, NextResponse } from "next/server";
 import { getServerSession } from "next-auth";
 import { authOptions } from "@/app/api/auth/[...nextauth]/route";
 
 const BACKEND_URL = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
-export async function GET() {
+const EMPTY_PAGE = { items: [], next_cursor: null };
+
+export async function GET(request: NextRequest) {
     try {
         const session = await getServerSession(authOptions);
         if (!session?.user) {
-            return NextResponse.json([]);
+            return NextResponse.json(EMPTY_PAGE);
         }
 
         const userId = (session as any).userId || session.user.id;
         if (!userId) {
-            return NextResponse.json([]);
+            return NextResponse.json(EMPTY_PAGE);
+        }
+
+        // Forward paging params (cursor, limit, view) to the backend
+        const params = new URLSearchParams({ user_id: userId });
+        for (const key of ["cursor", "limit", "view"]) {
+            const value = request.nextUrl.searchParams.get(key);
+            if (value) params.set(key, value);
         }
 
-        const res = await fetch(`${BACKEND_URL}/history?user_id=${encodeURIComponent(userId)}`);
+        const res = await fetch(`${BACKEND_URL}/history?${params.toString()}`);
         if (!res.ok) {
-            return NextResponse.json([]);
+            return NextResponse.json(EMPTY_PAGE);
         }
 
-        const history = await res.json();
-        return NextResponse.json(history);
+        const page = await res.json();
+        return NextResponse.json(page);
     } catch (error) {
         console.error("Error fetching history:", error);
-        return NextResponse.json([]);
+        return NextResponse.json(EMPTY_PAGE);
     }
 }
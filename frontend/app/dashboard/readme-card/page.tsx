@@ -50,10 +50,10 @@ export default function ReadmeCardPage() {
     useEffect(() => {
         const load = async () => {
             try {
-                const res = await fetch("/api/user/history");
+                const res = await fetch("/api/user/history?view=full&limit=1");
                 const data = await res.json();
-                if (Array.isArray(data) && data.length > 0) {
-                    const item = data[0];
+                if (Array.isArray(data?.items) && data.items.length > 0) {
+                    const item = data.items[0];
                     const content = typeof item.generated_content === "string"
                         ? JSON.parse(item.generated_content)
                         : item.generated_content;
@@ -6,7 +6,7 @@ import { Twitter, Copy, Check, RefreshCw, ChevronDown, AlertCircle } from "lucid
 interface HistoryItem {
     id: string;
     repo_url: string;
-    generated_content: any;
+    generated_content?: any;
     tone_used: string;
     created_at: string;
 }
@@ -66,15 +66,19 @@ export default function TwitterThreadPage() {
     const [tweets, setTweets] = useState<string[]>([]);
     const [loading, setLoading] = useState(true);
     const [copiedAll, setCopiedAll] = useState(false);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         const load = async () => {
             try {
-                const res = await fetch("/api/user/history");
+                const res = await fetch("/api/user/history?view=summary");
                 const data = await res.json();
-                if (Array.isArray(data) && data.length > 0) {
-                    setHistory(data);
-                    pickItem(data[0]);
+                const items: HistoryItem[] = Array.isArray(data?.items) ? data.items : [];
+                if (items.length > 0) {
+                    setHistory(items);
+                    setNextCursor(data.next_cursor || null);
+                    await pickItem(items[0]);
                 }
             } catch (e) {
                 console.error(e);
@@ -84,9 +88,12 @@ export default function TwitterThreadPage() {
         load();
     }, []);
 
-    const pickItem = (item: HistoryItem) => {
-        setSelected(item);
+    const pickItem = async (summary: HistoryItem) => {
+        setSelected(summary);
         try {
+            // The list only carries summaries; load the full thread for this entry
+            const res = await fetch(`/api/user/history/${summary.id}`);
+            const item: HistoryItem = await res.json();
             const content = typeof item.generated_content === "string"
                 ? JSON.parse(item.generated_content)
                 : item.generated_content;
@@ -97,6 +104,22 @@ export default function TwitterThreadPage() {
         }
     };
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const res = await fetch(`/api/user/history?view=summary&cursor=${encodeURIComponent(nextCursor)}`);
+            const page = await res.json();
+            if (Array.isArray(page?.items)) {
+                setHistory(prev => [...prev, ...page.items]);
+                setNextCursor(page.next_cursor || null);
+            }
+        } catch (e) {
+            console.error("Error loading more history:", e);
+        }
+        setLoadingMore(false);
+    };
+
     const copyAll = async () => {
         const allText = tweets.map((t, i) => `${i + 1}/${tweets.length} ${t}`).join("\n\n---\n\n");
         await navigator.clipboard.writeText(allText);
@@ -130,23 +153,34 @@ export default function TwitterThreadPage() {
             </div>
 
             {/* Repo selector */}
-            {history.length > 1 && (
-                <div className="relative w-full max-w-md">
-                    <select
-                        onChange={(e) => {
-                            const item = history.find((h) => h.id === e.target.value);
-                            if (item) pickItem(item);
-                        }}
-                        value={selected?.id}
-                        className="w-full bg-slate-900 border border-slate-700 rounded-xl px-4 py-2.5 text-white text-sm outline-none focus:ring-2 focus:ring-indigo-500 appearance-none pr-10"
-                    >
-                        {history.map((item) => (
-                            <option key={item.id} value={item.id}>
-                                {repoLabel(item.repo_url)} — {new Date(item.created_at).toLocaleDateString()}
-                            </option>
-                        ))}
-                    </select>
-                    <ChevronDown className="absolute right-3 top-3 w-4 h-4 text-slate-500 pointer-events-none" />
+            {(history.length > 1 || nextCursor) && (
+                <div className="flex items-center gap-3">
+                    <div className="relative w-full max-w-md">
+                        <select
+                            onChange={(e) => {
+                                const item = history.find((h) => h.id === e.target.value);
+                                if (item) pickItem(item);
+                            }}
+                            value={selected?.id}
+                            className="w-full bg-slate-900 border border-slate-700 rounded-xl px-4 py-2.5 text-white text-sm outline-none focus:ring-2 focus:ring-indigo-500 appearance-none pr-10"
+                        >
+                            {history.map((item) => (
+                                <option key={item.id} value={item.id}>
+                                    {repoLabel(item.repo_url)} — {new Date(item.created_at).toLocaleDateString()}
+                                </option>
+                            ))}
+                        </select>
+                        <ChevronDown className="absolute right-3 top-3 w-4 h-4 text-slate-500 pointer-events-none" />
+                    </div>
+                    {nextCursor && (
+                        <button
+                            onClick={loadMore}
+                            disabled={loadingMore}
+                            className="shrink-0 px-4 py-2.5 rounded-xl border border-slate-800 text-slate-400 hover:text-white hover:border-slate-700 text-sm transition-colors disabled:opacity-50"
+                        >
+                            {loadingMore ? "Loading..." : "Load more"}
+                        </button>
+                    )}
                 </div>
             )}
 
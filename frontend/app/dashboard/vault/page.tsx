@@ -10,7 +10,7 @@ interface HistoryItem {
     created_at: string;
     tone_used: string;
     platform: string;
-    generated_content: any;
+    preview?: string;
 }
 
 export default function VaultPage() {
@@ -18,6 +18,8 @@ export default function VaultPage() {
     const [loading, setLoading] = useState(true);
     const [isPro, setIsPro] = useState(false);
     const [error, setError] = useState<string | null>(null);
+    const [nextCursor, setNextCursor] = useState<string | null>(null);
+    const [loadingMore, setLoadingMore] = useState(false);
 
     useEffect(() => {
         const fetchData = async () => {
@@ -28,11 +30,12 @@ export default function VaultPage() {
                 if (usageData) setIsPro(usageData.is_pro);
 
                 // Fetch History
-                const historyRes = await fetch("/api/user/history");
+                const historyRes = await fetch("/api/user/history?view=summary");
                 const historyData = await historyRes.json();
 
-                if (Array.isArray(historyData)) {
-                    setHistory(historyData);
+                if (Array.isArray(historyData?.items)) {
+                    setHistory(historyData.items);
+                    setNextCursor(historyData.next_cursor || null);
                 }
             } catch (err: any) {
                 console.error("Error fetching data:", err);
@@ -43,6 +46,22 @@ export default function VaultPage() {
         fetchData();
     }, []);
 
+    const loadMore = async () => {
+        if (!nextCursor) return;
+        setLoadingMore(true);
+        try {
+            const res = await fetch(`/api/user/history?view=summary&cursor=${encodeURIComponent(nextCursor)}`);
+            const page = await res.json();
+            if (Array.isArray(page?.items)) {
+                setHistory(prev => [...prev, ...page.items]);
+                setNextCursor(page.next_cursor || null);
+            }
+        } catch (err: any) {
+            console.error("Error loading more history:", err);
+        }
+        setLoadingMore(false);
+    };
+
     const isOlderThan3Days = (dateString: string) => {
         const date = new Date(dateString);
         const now = new Date();
@@ -116,7 +135,7 @@ export default function VaultPage() {
 
                                     <div className="bg-slate-950 p-4 rounded-lg border border-slate-800/50">
                                         <p className="text-slate-400 text-sm line-clamp-2">
-                                            {item.generated_content?.twitter_thread?.substring(0, 150)}...
+                                            {item.preview}...
                                         </p>
                                     </div>
                                 </div>
@@ -141,6 +160,16 @@ export default function VaultPage() {
                         );
                     })
                 )}
+
+                {nextCursor && (
+                    <button
+                        onClick={loadMore}
+                        disabled={loadingMore}
+                        className="w-full py-3 rounded-xl border border-slate-800 text-slate-400 hover:text-white hover:border-slate-700 text-sm transition-colors disabled:opacity-50"
+                    >
+                        {loadingMore ? "Loading..." : "Load more"}
+                    </button>
+                )}
             </div>
         </div>
     );
@@ -17,15 +17,35 @@ export function useRepoGenerator() {
     const [error, setError] = useState<string | null>(null);
     const [showPaywall, setShowPaywall] = useState(false);
 
-    const logMessages = [
-        "> Initializing connection...",
-        "> Fetching repository data...",
-        "> Analyzing codebase structure...",
-        "> Drafting viral content...",
-        "> Finalizing output..."
-    ];
-
-    const generateContent = async (url: string, tone: string) => {
+    const stageMessage = (stage: string, stageData: any): string => {
+        switch (stage) {
+            case "cache":
+                return "> Found a fresh result for this commit...";
+            case "repo_info":
+                return `> Connected to ${stageData?.name ?? "repository"} (${stageData?.stars ?? 0} stars)...`;
+            case "tree":
+                return `> Indexed ${stageData?.file_count ?? 0} files...`;
+            case "evidence":
+                return `> Detected stack: ${(stageData?.tech_stack ?? []).join(", ") || "unknown"}...`;
+            case "entry_point":
+                return `> Reading entry point ${stageData?.name ?? "(none found)"}...`;
+            case "generating":
+                return "> Drafting viral content...";
+            default:
+                return `> ${stage}...`;
+        }
+    };
+
+    const sectionMessages: Record<string, string> = {
+        twitter_thread: "> Twitter thread ready",
+        linkedin_post: "> LinkedIn post ready",
+        blog_intro: "> Blog intro ready",
+        slides: "> Carousel slides ready",
+        video_metadata: "> Video script ready"
+    };
+
+    // sections: optional subset of outputs (e.g. ["twitter_thread"]); default is all of them
+    const generateContent = async (url: string, tone: string, sections?: string[]) => {
         setLoading(true);
         setError(null);
         setData(null);
@@ -45,14 +65,7 @@ export function useRepoGenerator() {
             return;
         }
 
-        // Timer for simulating logs
-        let step = 0;
-        const intervalId = setInterval(() => {
-            if (step < logMessages.length) {
-                setLogs(prev => [...prev, logMessages[step]]);
-                step++;
-            }
-        }, 800);
+        setLogs(["> Initializing connection..."]);
 
         try {
             // Use environment variable or default to localhost
@@ -61,7 +74,8 @@ export function useRepoGenerator() {
             // Remove trailing slash if present to avoid //analyze
             const baseUrl = backendUrl.replace(/\/$/, "");
 
-            const response = await fetch(`${baseUrl}/api/analyze-repo`, {
+            // Streaming endpoint: stage/section events arrive as Server-Sent Events
+            const response = await fetch(`${baseUrl}/api/analyze-repo/stream`, {
                 method: "POST",
                 headers: {
                     "Content-Type": "application/json",
@@ -71,7 +85,8 @@ export function useRepoGenerator() {
                     github_token: token,
                     user_id: session.userId || session.user.id,
                     email: session.user.email,
-                    tone
+                    tone,
+                    sections
                 }),
             });
 
@@ -85,14 +100,63 @@ export function useRepoGenerator() {
                 throw new Error(errData.detail || "Failed to analyze repository");
             }
 
-            const result = await response.json();
-            setData(result);
+            if (!response.body) {
+                throw new Error("Streaming is not supported by this browser");
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            let finished = false;
+
+            const handleEvent = (block: string) => {
+                let event = "message";
+                const dataLines: string[] = [];
+                for (const line of block.split("\n")) {
+                    if (line.startsWith("event:")) event = line.slice(6).trim();
+                    else if (line.startsWith("data:")) dataLines.push(line.slice(5).trimStart());
+                }
+                if (!dataLines.length) return;
+                const payload = JSON.parse(dataLines.join("\n"));
+
+                if (event === "stage") {
+                    setLogs(prev => [...prev, stageMessage(payload.stage, payload.data)]);
+                } else if (event === "section") {
+                    const message = sectionMessages[payload.key];
+                    if (message) setLogs(prev => [...prev, message]);
+                } else if (event === "done") {
+                    finished = true;
+                    setData(payload);
+                } else if (event === "error") {
+                    finished = true;
+                    if (payload.status_code === 403) {
+                        setShowPaywall(true);
+                        throw new Error("Free limit reached");
+                    }
+                    throw new Error(payload.detail || "Failed to analyze repository");
+                }
+            };
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let boundary = buffer.indexOf("\n\n");
+                while (boundary !== -1) {
+                    handleEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+                    boundary = buffer.indexOf("\n\n");
+                }
+            }
+
+            if (!finished) {
+                throw new Error("Connection closed before analysis finished");
+            }
         } catch (err: any) {
             if (err.message !== "Free limit reached") {
                 setError(err.message);
             }
         } finally {
-            clearInterval(intervalId);
             setLoading(false);
         }
     };